@@ -0,0 +1,168 @@
+# action_mutation.py
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from parallel_executor import DEFAULT_MAX_WORKERS, ParallelExecutor
+
+KIND_TEMPLATE = "template"
+KIND_POLICY = "policy"
+# Набор пользовательских правил (templates/with_user_rules)
+KIND_RULE_SET = "rule_set"
+
+SCOPE_SYSTEM = "system"
+SCOPE_USER = "user"
+
+DEFAULT_MUTATION_RETRIES = 2
+
+
+def rule_path(kind, container_id, scope, rule_id):
+    """Путь API к правилу шаблона, набора пользовательских правил или политики"""
+    if kind == KIND_TEMPLATE:
+        return f"config/policies/templates/user/{container_id}/rules/{rule_id}"
+    if kind == KIND_RULE_SET:
+        return f"config/policies/templates/with_user_rules/{container_id}/rules/{rule_id}"
+    if scope == SCOPE_USER:
+        return f"config/policies/{container_id}/user_rules/{rule_id}"
+    return f"config/policies/{container_id}/rules/{rule_id}"
+
+
+def response_etag(response):
+    """ETag ответа или None, если сервер его не вернул"""
+    if response is None:
+        return None
+    return response.headers.get('ETag')
+
+
+def fetch_rule_details(api_client, kind, container_id, scope, rule_id):
+    """Запрашивает детали правила шаблона или политики, возвращает ответ API"""
+    if kind == KIND_TEMPLATE:
+        return api_client.get_template_rule_details(container_id, rule_id)
+    if kind == KIND_RULE_SET:
+        return api_client.get_user_rule_details_raw(container_id, rule_id)
+    if scope == SCOPE_USER:
+        return api_client.get_policy_user_rule_details(container_id, rule_id)
+    return api_client.get_policy_system_rule_details(container_id, rule_id)
+
+
+def update_rule_actions(api_client, kind, container_id, scope, rule_id, new_actions):
+    """Обновляет только действия правила шаблона или политики (PATCH)"""
+    update_data = {"actions": new_actions}
+    if kind == KIND_TEMPLATE:
+        return api_client.update_template_rule(container_id, rule_id, update_data)
+    if kind == KIND_RULE_SET:
+        return api_client.update_user_rule(container_id, rule_id, update_data)
+    if scope == SCOPE_USER:
+        return api_client.update_policy_user_rule(container_id, rule_id, update_data)
+    return api_client.update_policy_system_rule(container_id, rule_id, update_data)
+
+
+def add_action_transform(action_id):
+    """Возвращает transform, добавляющий действие в правило"""
+    return lambda actions: None if action_id in actions else actions + [action_id]
+
+
+def replace_action_transform(old_action_id, new_action_id):
+    """Возвращает transform, заменяющий действие в правиле"""
+    return lambda actions: ([new_action_id if action_id == old_action_id else action_id for action_id in actions]
+                            if old_action_id in actions else None)
+
+
+class ActionMutationEngine:
+    """Параллельное изменение списков действий в правилах шаблонов и политик
+
+    Этап чтения параллельно получает детали правил, этап записи параллельно
+    отправляет PATCH только с действиями, не дожидаясь чтения остальных
+    правил. Оба этапа ограничены по числу потоков и повторяют запрос к
+    правилу при временных ошибках.
+
+    Правило описывается словарем с полями kind, container_id, scope, rule_id
+    и name. transform(actions) возвращает новый список действий или None,
+    если правило менять не нужно.
+    """
+
+    def __init__(self, api_client, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None,
+                 max_retries=DEFAULT_MUTATION_RETRIES):
+        self.api_client = api_client
+        self.max_workers = max_workers
+        self.fetcher = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit, max_retries=max_retries)
+        self.writer = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit, max_retries=max_retries)
+
+    def _fetch(self, rule):
+        return fetch_rule_details(self.api_client, rule['kind'], rule['container_id'], rule['scope'],
+                                  rule['rule_id'])
+
+    def _write(self, rule, new_actions):
+        return self.writer.call_with_retry(
+            lambda actions: update_rule_actions(self.api_client, rule['kind'], rule['container_id'],
+                                                rule['scope'], rule['rule_id'], actions),
+            new_actions)
+
+    @staticmethod
+    def _rule_label(rule):
+        """Имя правила для вывода (для политик - с типом правила)"""
+        if rule['kind'] == KIND_POLICY:
+            rule_type = 'пользовательское' if rule['scope'] == SCOPE_USER else 'системное'
+            return f"'{rule['name']}' ({rule_type})"
+        return f"'{rule['name']}'"
+
+    def run(self, rules, transform, done_message, on_actions=None):
+        """Применяет transform к действиям правил, возвращает итоговую сводку
+
+        on_actions(rule, actions) вызывается в текущем потоке с актуальным
+        списком действий правила (после изменения или без него).
+        """
+        summary = {'total': len(rules), 'updated': 0, 'unchanged': 0, 'fetch_failed': 0, 'update_failed': 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as write_pool:
+            write_futures = {}
+
+            def on_fetched(rule, response):
+                if response is None or response.status_code != 200:
+                    summary['fetch_failed'] += 1
+                    print(f"Не удалось получить детали правила '{rule['name']}'")
+                    return
+
+                current_actions = response.json().get('actions', []) or []
+                new_actions = transform(current_actions)
+                if new_actions is None:
+                    summary['unchanged'] += 1
+                    if on_actions:
+                        on_actions(rule, current_actions)
+                    return
+
+                # Правило сразу уходит на запись, не дожидаясь чтения остальных
+                future = write_pool.submit(self._write, rule, new_actions)
+                write_futures[future] = (rule, new_actions)
+
+            self.fetcher.map(self._fetch, rules, on_fetched)
+
+            for future in as_completed(write_futures):
+                rule, new_actions = write_futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print(f"Исключение при обновлении правила '{rule['name']}': {e}")
+                    response = None
+
+                if response is not None and response.status_code in (200, 204):
+                    summary['updated'] += 1
+                    print(f"{done_message} в правиле {self._rule_label(rule)}")
+                    if on_actions:
+                        on_actions(rule, new_actions)
+                else:
+                    summary['update_failed'] += 1
+                    error_msg = response.text if response is not None else "Неизвестная ошибка"
+                    print(f"Ошибка при обновлении правила '{rule['name']}': {error_msg}")
+
+        self.print_summary(summary)
+        return summary
+
+    @staticmethod
+    def print_summary(summary):
+        """Выводит итоговую сводку изменения действий"""
+        print(f"\nОбработано правил: {summary['total']}")
+        print(f"  Изменено: {summary['updated']}")
+        print(f"  Без изменений: {summary['unchanged']}")
+        if summary['fetch_failed']:
+            print(f"  Ошибок чтения: {summary['fetch_failed']}")
+        if summary['update_failed']:
+            print(f"  Ошибок записи: {summary['update_failed']}")
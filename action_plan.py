@@ -0,0 +1,233 @@
+# action_plan.py
+import os
+import json
+import datetime
+
+from parallel_executor import DEFAULT_MAX_WORKERS, ParallelExecutor
+from action_mutation import (KIND_TEMPLATE, SCOPE_USER, add_action_transform, replace_action_transform,
+                             response_etag, rule_path)
+from action_usage_index import container_key
+
+PLAN_DIR = "action_plans"
+PLAN_VERSION = 1
+
+OPERATION_ADD = "add"
+OPERATION_REPLACE = "replace"
+
+STATUS_APPLIED = "applied"
+STATUS_CONFLICT = "conflict"
+STATUS_FAILED = "failed"
+
+
+class StaleRule:
+    """Результат проверки правила без ETag перед применением: правило изменилось (как ответ 412)"""
+    status_code = 412
+    text = "Действия правила изменились после построения плана"
+    headers = {}
+
+
+class ActionChangePlanner:
+    """Планирование и применение изменений действий в правилах шаблонов и политик
+
+    План строится по индексу использования действий: кандидаты в изменение
+    перепроверяются условными запросами (If-None-Match), поэтому неизменившиеся
+    правила не передаются заново. План содержит точный набор PATCH-запросов
+    (действия до и после) и сохраняется в JSON, чтобы его можно было
+    просмотреть и применить позже. При применении отправляются только
+    запланированные запросы; если сервер вернул ETag, запрос отправляется с
+    If-Match, иначе правило перед изменением перечитывается и сравнивается с
+    планом, поэтому правило, измененное после планирования, не перезаписывается.
+    """
+
+    def __init__(self, actions_manager, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None, plan_dir=PLAN_DIR):
+        self.actions_manager = actions_manager
+        self.api_client = actions_manager.api_client
+        self.plan_dir = plan_dir
+        self.executor = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit)
+
+    # ==================== ПЛАНИРОВАНИЕ ====================
+
+    @staticmethod
+    def _transform(operation, old_action_id, new_action_id):
+        if operation == OPERATION_ADD:
+            return add_action_transform(new_action_id)
+        return replace_action_transform(old_action_id, new_action_id)
+
+    def plan(self, operation, containers, new_action, old_action=None):
+        """Строит план изменения действий в шаблонах и политиках
+
+        containers - список (вид, ID, имя); new_action и old_action - словари
+        действий с полями id и name.
+        """
+        index = self.actions_manager.get_action_usage_index(build=False)
+        transform = self._transform(operation, old_action.get('id') if old_action else None, new_action.get('id'))
+        changes = []
+        unverified = 0
+        total_rules = 0
+
+        def candidates(ckey):
+            if operation == OPERATION_ADD:
+                return index.rules_without(new_action.get('id'), ckey)
+            return index.usages(old_action.get('id'), ckey)
+
+        for kind, container_id, container_name in containers:
+            if not index.refresh_container(kind, container_id, container_name):
+                continue
+            ckey = container_key(kind, container_id)
+            total_rules += index.rule_count(ckey)
+
+            # Кандидаты по индексу перепроверяются на сервере: 304 - правило не менялось
+            _, failed = index.revalidate(ckey, [rule['rule_key'] for rule in candidates(ckey)])
+            unverified += len(failed)
+
+            for rule in candidates(ckey):
+                if rule['rule_key'] in failed:
+                    continue
+                after = transform(rule['actions'])
+                if after is None:
+                    continue
+                changes.append({
+                    'kind': rule['kind'],
+                    'container_id': rule['container_id'],
+                    'container_name': rule['container_name'],
+                    'scope': rule['scope'],
+                    'rule_id': rule['rule_id'],
+                    'rule_key': rule['rule_key'],
+                    'name': rule['name'],
+                    'etag': rule['etag'],
+                    'before': rule['actions'],
+                    'after': after
+                })
+        index.save()
+
+        return {
+            'version': PLAN_VERSION,
+            'created_at': datetime.datetime.now().isoformat(),
+            'tenant_id': self.api_client.auth_manager.tenant_id,
+            'operation': operation,
+            'old_action': old_action,
+            'new_action': new_action,
+            'containers': [{'kind': kind, 'id': container_id, 'name': name}
+                           for kind, container_id, name in containers],
+            'total_rules': total_rules,
+            'unverified': unverified,
+            'changes': changes
+        }
+
+    # ==================== ХРАНЕНИЕ ====================
+
+    def save_plan(self, plan, plan_path=None):
+        """Сохраняет план в JSON файл, возвращает путь к нему"""
+        if not plan_path:
+            os.makedirs(self.plan_dir, exist_ok=True)
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            plan_path = os.path.join(self.plan_dir, f"plan_{timestamp}.json")
+        with open(plan_path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+        return plan_path
+
+    @staticmethod
+    def load_plan(plan_path):
+        """Загружает план из файла"""
+        try:
+            with open(plan_path, 'r', encoding='utf-8') as f:
+                plan = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Не удалось прочитать план {plan_path}: {e}")
+            return None
+        if plan.get('version') != PLAN_VERSION:
+            print(f"❌ Неподдерживаемая версия плана: {plan.get('version')}")
+            return None
+        return plan
+
+    def list_plans(self):
+        """Возвращает сохраненные планы (новые первыми)"""
+        if not os.path.isdir(self.plan_dir):
+            return []
+        files = [f for f in os.listdir(self.plan_dir) if f.endswith('.json')]
+        return [os.path.join(self.plan_dir, f) for f in sorted(files, reverse=True)]
+
+    # ==================== ПРОСМОТР ====================
+
+    def print_plan(self, plan):
+        """Выводит сводку изменений плана"""
+        action_names = {action.get('id'): action.get('name')
+                        for action in self.actions_manager.get_available_actions() or []}
+
+        def describe(action_ids):
+            return ", ".join(action_names.get(action_id, str(action_id)) for action_id in action_ids) or "-"
+
+        changes = plan['changes']
+        print(f"\n=== План изменения действий ({plan['created_at']}) ===")
+        if plan['operation'] == OPERATION_ADD:
+            print(f"Операция: добавить '{plan['new_action'].get('name')}'")
+        else:
+            print(f"Операция: заменить '{plan['old_action'].get('name')}' на '{plan['new_action'].get('name')}'")
+
+        current_container = None
+        for change in changes:
+            ckey = container_key(change['kind'], change['container_id'])
+            if ckey != current_container:
+                current_container = ckey
+                kind_name = 'Шаблон' if change['kind'] == KIND_TEMPLATE else 'Политика'
+                print(f"\n{kind_name} '{change['container_name']}' (ID: {change['container_id']}):")
+            rule_type = 'пользовательское' if change['scope'] == SCOPE_USER else 'системное'
+            print(f"  ~ {change['name']} ({rule_type})")
+            print(f"      - {describe(change['before'])}")
+            print(f"      + {describe(change['after'])}")
+
+        print(f"\nБудет изменено правил: {len(changes)} из {plan['total_rules']}")
+        if plan.get('unverified'):
+            print(f"⚠️ Не удалось проверить правил: {plan['unverified']} (в план не включены)")
+
+    # ==================== ПРИМЕНЕНИЕ ====================
+
+    def apply(self, plan):
+        """Отправляет только запланированные изменения, возвращает сводку"""
+        summary = {'total': len(plan['changes']), STATUS_APPLIED: 0, STATUS_CONFLICT: 0, STATUS_FAILED: 0}
+        if plan.get('tenant_id') != self.api_client.auth_manager.tenant_id:
+            print("❌ План построен для другого тенанта")
+            summary[STATUS_FAILED] = summary['total']
+            return summary
+
+        index = self.actions_manager.get_action_usage_index(build=False)
+
+        def send(change):
+            path = rule_path(change['kind'], change['container_id'], change['scope'], change['rule_id'])
+            etag = change.get('etag')
+            if not etag:
+                # Без ETag условный запрос невозможен: действия сверяются с планом перед изменением
+                response = self.api_client.get_rule_conditional(path)
+                if response is None or response.status_code != 200:
+                    return response
+                current = response.json().get('actions', []) or []
+                if [str(action_id) for action_id in current] != [str(action_id) for action_id in change['before']]:
+                    return StaleRule()
+                etag = response_etag(response)
+            return self.api_client.update_rule_conditional(path, {"actions": change['after']}, etag)
+
+        def on_result(change, response):
+            ckey = container_key(change['kind'], change['container_id'])
+            if response is not None and response.status_code in (200, 204):
+                summary[STATUS_APPLIED] += 1
+                index.set_rule_actions(ckey, change['rule_key'], change['after'], response_etag(response))
+                print(f"✅ Изменено правило '{change['name']}'")
+            elif response is not None and response.status_code == 412:
+                summary[STATUS_CONFLICT] += 1
+                # Правило изменилось после планирования - индекс перечитает его при следующем обновлении
+                index.invalidate_rule(ckey, change['rule_key'])
+                print(f"⚠️ Правило '{change['name']}' изменено после построения плана, пропущено")
+            else:
+                summary[STATUS_FAILED] += 1
+                error_msg = response.text if response is not None else "Неизвестная ошибка"
+                print(f"❌ Ошибка при обновлении правила '{change['name']}': {error_msg}")
+
+        self.executor.map(send, plan['changes'], on_result)
+        index.save()
+
+        print(f"\nПрименено: {summary[STATUS_APPLIED]} из {summary['total']}")
+        if summary[STATUS_CONFLICT]:
+            print(f"  Конфликтов (правило изменено после планирования): {summary[STATUS_CONFLICT]}")
+        if summary[STATUS_FAILED]:
+            print(f"  Ошибок: {summary[STATUS_FAILED]}")
+        return summary
@@ -0,0 +1,165 @@
+# action_rollout.py
+import os
+import json
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from parallel_executor import DEFAULT_MAX_WORKERS
+from action_mutation import ActionMutationEngine, add_action_transform, replace_action_transform
+
+OPERATION_ADD = "add"
+OPERATION_REPLACE = "replace"
+
+DEFAULT_TENANT_WORKERS = 4
+REPORT_DIR = "action_rollout_reports"
+
+
+class ActionRolloutPipeline:
+    """Применение операции с действием ко всем шаблонам и политикам нескольких тенантов
+
+    Операция задается типом (add/replace), ключом типа действия и именами
+    действий; в каждом тенанте действия находятся по паре (имя, ключ типа),
+    поэтому их ID могут различаться. Тенанты обрабатываются параллельно,
+    каждый собственным клиентом с отдельными токенами. Затронутые правила
+    выбираются по индексу использования действий тенанта. Результаты всех
+    тенантов собираются в один отчет.
+    """
+
+    def __init__(self, api_client, operation, action_key, new_action_name, old_action_name=None,
+                 tenant_workers=DEFAULT_TENANT_WORKERS, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None,
+                 report_dir=REPORT_DIR):
+        self.api_client = api_client
+        self.operation = operation
+        self.action_key = action_key
+        self.new_action_name = new_action_name
+        self.old_action_name = old_action_name
+        self.tenant_workers = max(1, tenant_workers)
+        self.max_workers = max_workers
+        self.rate_limit = rate_limit
+        self.report_dir = report_dir
+
+    def _resolve_action(self, actions_manager, action_name):
+        """Находит действие тенанта по имени и ключу типа"""
+        for action in actions_manager.get_actions_by_type(self.action_key) or []:
+            if action.get('name') == action_name:
+                return action
+        return None
+
+    def _transform(self, new_action_id, old_action_id):
+        if self.operation == OPERATION_ADD:
+            return add_action_transform(new_action_id), "Успешно добавлено действие"
+        return replace_action_transform(old_action_id, new_action_id), "Успешно заменено действие"
+
+    def _rollout_tenant(self, tenant):
+        """Выполняет операцию в одном тенанте, возвращает запись отчета"""
+        from actions_manager import ActionsManager
+        from action_usage_index import ActionUsageIndex
+
+        tenant_id = tenant.get('id')
+        tenant_name = tenant.get('name', 'Без названия')
+        result = {'tenant_id': tenant_id, 'tenant_name': tenant_name, 'status': 'failed', 'error': None,
+                  'containers': 0, 'total': 0, 'updated': 0, 'unchanged': 0,
+                  'fetch_failed': 0, 'update_failed': 0}
+
+        client = self.api_client.clone_for_tenant(tenant_id)
+        if client is None:
+            result['error'] = "Не удалось авторизоваться в тенанте"
+            return result
+
+        actions_manager = ActionsManager(client)
+        new_action = self._resolve_action(actions_manager, self.new_action_name)
+        if not new_action:
+            result['status'] = 'skipped'
+            result['error'] = f"Действие '{self.new_action_name}' ({self.action_key}) не найдено"
+            return result
+
+        old_action = None
+        if self.operation == OPERATION_REPLACE:
+            old_action = self._resolve_action(actions_manager, self.old_action_name)
+            if not old_action:
+                result['status'] = 'skipped'
+                result['error'] = f"Действие '{self.old_action_name}' ({self.action_key}) не найдено"
+                return result
+
+        index = ActionUsageIndex(actions_manager, tenant_id, max_workers=self.max_workers,
+                                 rate_limit=self.rate_limit)
+        index.load()
+        # Детали запрашиваются только для новых и измененных с прошлого обхода правил
+        index.build(full=False)
+
+        rules = []
+        for ckey in index.containers:
+            if self.operation == OPERATION_ADD:
+                rules.extend(index.rules_without(new_action['id'], ckey))
+            else:
+                rules.extend(index.usages(old_action['id'], ckey))
+        result['containers'] = len(index.containers)
+
+        transform, done_message = self._transform(new_action['id'], old_action['id'] if old_action else None)
+        engine = ActionMutationEngine(client, max_workers=self.max_workers, rate_limit=self.rate_limit)
+        print(f"\n[{tenant_name}] Затронуто правил по индексу: {len(rules)}")
+        summary = engine.run(
+            rules, transform, f"[{tenant_name}] {done_message}",
+            on_actions=lambda rule, actions: index.set_rule_actions(rule['container_key'], rule['rule_key'],
+                                                                    actions)
+        )
+        index.save()
+
+        result.update(summary)
+        result['status'] = 'ok' if not summary['fetch_failed'] and not summary['update_failed'] else 'partial'
+        return result
+
+    def run(self, tenants):
+        """Выполняет операцию во всех тенантах, возвращает (результаты, путь к отчету)"""
+        print(f"\nПрименение операции в {len(tenants)} тенантах ({self.tenant_workers} параллельно)...")
+        results = []
+        with ThreadPoolExecutor(max_workers=self.tenant_workers) as executor:
+            futures = {executor.submit(self._rollout_tenant, tenant): tenant for tenant in tenants}
+            for future in as_completed(futures):
+                tenant = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'tenant_id': tenant.get('id'), 'tenant_name': tenant.get('name', 'Без названия'),
+                              'status': 'failed', 'error': str(e)}
+                results.append(result)
+
+        results.sort(key=lambda result: str(result.get('tenant_name')))
+        report_path = self.save_report(results)
+        self.print_report(results)
+        print(f"\nОтчет сохранен: {report_path}")
+        return results, report_path
+
+    def save_report(self, results):
+        """Сохраняет сводный отчет по всем тенантам"""
+        os.makedirs(self.report_dir, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        report_path = os.path.join(self.report_dir, f"rollout_{timestamp}.json")
+        totals = {key: sum(result.get(key, 0) for result in results)
+                  for key in ('total', 'updated', 'unchanged', 'fetch_failed', 'update_failed')}
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'time': datetime.datetime.now().isoformat(),
+                'operation': self.operation,
+                'action_key': self.action_key,
+                'old_action_name': self.old_action_name,
+                'new_action_name': self.new_action_name,
+                'totals': totals,
+                'tenants': results
+            }, f, ensure_ascii=False, indent=2)
+        return report_path
+
+    @staticmethod
+    def print_report(results):
+        """Выводит сводку по тенантам"""
+        status_marks = {'ok': '✅', 'partial': '⚠️', 'skipped': '⏭️', 'failed': '❌'}
+        print("\n=== Итог по тенантам ===")
+        for result in results:
+            mark = status_marks.get(result['status'], '❓')
+            line = f"{mark} {result['tenant_name']} (ID: {result['tenant_id']})"
+            if result.get('error'):
+                line += f": {result['error']}"
+            else:
+                line += (f": изменено {result.get('updated', 0)} из {result.get('total', 0)} правил, "
+                         f"ошибок {result.get('fetch_failed', 0) + result.get('update_failed', 0)}")
+            print(line)
@@ -0,0 +1,303 @@
+# action_usage_index.py
+import os
+import json
+import hashlib
+import datetime
+
+from parallel_executor import DEFAULT_MAX_WORKERS, ParallelExecutor
+from action_mutation import (KIND_POLICY, KIND_TEMPLATE, SCOPE_SYSTEM, SCOPE_USER, fetch_rule_details,
+                             response_etag, rule_path)
+
+INDEX_DIR = "action_usage_index"
+INDEX_VERSION = 1
+
+
+def container_key(kind, container_id):
+    """Ключ шаблона или политики в индексе"""
+    return f"{kind}:{container_id}"
+
+
+def rule_key(scope, rule_id):
+    """Ключ правила внутри шаблона или политики"""
+    return f"{scope}:{rule_id}"
+
+
+def _fingerprint(rule):
+    """Отпечаток записи правила из списка (меняется вместе с ее содержимым)"""
+    raw = json.dumps(rule, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class ActionUsageIndex:
+    """Обратный индекс: ID действия -> правила шаблонов и политик, в которых оно используется
+
+    Индекс строится одним параллельным обходом и сохраняется на диск для
+    каждого тенанта. При обновлении детали запрашиваются только для новых
+    правил и правил, запись которых в списке изменилась; изменения, сделанные
+    через этот инструмент, вносятся в индекс сразу. Если запись в списке не
+    содержит ни действий, ни времени изменения, неизменность записи ничего не
+    гарантирует: такие правила перепроверяются условным запросом по ETag
+    деталей (или читаются заново, если ETag нет).
+    """
+
+    def __init__(self, actions_manager, tenant_id=None, index_dir=INDEX_DIR,
+                 max_workers=DEFAULT_MAX_WORKERS, rate_limit=None):
+        self.actions_manager = actions_manager
+        self.tenant_id = tenant_id
+        self.index_path = os.path.join(index_dir, f"{tenant_id or 'default'}.json")
+        # Повтор один: обычные методы клиента сами обрабатывают 401/404
+        self.executor = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit, max_retries=1)
+        self.containers = {}
+        self.built_at = None
+        self._usage = None
+
+    # ==================== ХРАНЕНИЕ ====================
+
+    def load(self):
+        """Загружает индекс с диска, возвращает True если он найден"""
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать индекс использования действий: {e}")
+            return False
+        if data.get('version') != INDEX_VERSION:
+            return False
+        self.containers = data.get('containers', {})
+        self.built_at = data.get('built_at')
+        self._usage = None
+        return True
+
+    def save(self):
+        """Сохраняет индекс на диск (через временный файл)"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'tenant_id': self.tenant_id,
+                'built_at': self.built_at,
+                'containers': self.containers
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+    # ==================== ОБХОД ====================
+
+    def _list_rules(self, kind, container_id):
+        """Возвращает список правил шаблона или политики с областью (system/user)"""
+        manager = self.actions_manager
+        if kind == KIND_TEMPLATE:
+            rules = manager.get_template_rules(container_id)
+            if rules is None:
+                return None
+            return [(SCOPE_SYSTEM if rule.get('is_system') else SCOPE_USER, rule) for rule in rules]
+
+        system_rules = manager.get_policy_system_rules(container_id)
+        user_rules = manager.get_policy_user_rules(container_id)
+        if system_rules is None and user_rules is None:
+            return None
+        return ([(SCOPE_SYSTEM, rule) for rule in system_rules or []] +
+                [(SCOPE_USER, rule) for rule in user_rules or []])
+
+    def fetch_rule_details(self, kind, container_id, scope, rule_id):
+        """Запрашивает детали правила, возвращает ответ API"""
+        return fetch_rule_details(self.actions_manager.api_client, kind, container_id, scope, rule_id)
+
+    def refresh_container(self, kind, container_id, name=None, full=False):
+        """Обновляет правила одного шаблона или политики
+
+        Без full детали запрашиваются только для новых и измененных правил,
+        а также перепроверяются правила, изменение которых по списку не видно.
+        """
+        listed = self._list_rules(kind, container_id)
+        if listed is None:
+            print(f"⚠️ Не удалось получить список правил ({kind} {container_id})")
+            return False
+
+        ckey = container_key(kind, container_id)
+        container = self.containers.get(ckey) or {'kind': kind, 'id': container_id, 'rules': {}}
+        if name:
+            container['name'] = name
+        known = container['rules']
+
+        rules = {}
+        to_fetch = []
+        to_revalidate = []
+        for scope, rule in listed:
+            rkey = rule_key(scope, rule.get('id'))
+            fingerprint = _fingerprint(rule)
+            entry = known.get(rkey)
+            if entry and not full and entry.get('fingerprint') == fingerprint:
+                rules[rkey] = entry
+                if not isinstance(rule.get('actions'), list) and 'updated_at' not in rule:
+                    # Действия могли измениться без изменения записи в списке
+                    to_revalidate.append(rkey)
+                continue
+            entry = {'rule_id': rule.get('id'), 'name': rule.get('name', 'Без названия'),
+                     'scope': scope, 'fingerprint': fingerprint, 'actions': [], 'etag': None}
+            rules[rkey] = entry
+            if isinstance(rule.get('actions'), list):
+                # Список уже содержит действия - детали не нужны
+                entry['actions'] = rule['actions']
+            else:
+                to_fetch.append(entry)
+
+        def on_result(entry, response):
+            if response is not None and response.status_code == 200:
+                entry['actions'] = response.json().get('actions', []) or []
+                entry['etag'] = response_etag(response)
+            else:
+                # Без деталей правило будет перечитано при следующем обновлении
+                entry['fingerprint'] = None
+                print(f"  ⚠️ Не удалось получить детали правила '{entry['name']}'")
+
+        if to_fetch:
+            self.executor.map(lambda entry: self.fetch_rule_details(kind, container_id, entry['scope'],
+                                                                   entry['rule_id']),
+                              to_fetch, on_result)
+
+        container['rules'] = rules
+        container['updated_at'] = datetime.datetime.now().isoformat()
+        self.containers[ckey] = container
+        self._usage = None
+        if to_revalidate:
+            self.revalidate(ckey, to_revalidate)
+        return True
+
+    def _list_containers(self):
+        """Возвращает [(вид, ID, имя)] всех шаблонов и политик тенанта"""
+        containers = []
+        for template in self.actions_manager.get_user_templates() or []:
+            containers.append((KIND_TEMPLATE, template.get('id'), template.get('name')))
+        for policy in self.actions_manager.get_web_app_policies() or []:
+            containers.append((KIND_POLICY, policy.get('id'), policy.get('name')))
+        return containers
+
+    def build(self, full=True):
+        """Строит индекс по всем шаблонам и политикам тенанта (full=False - только изменения)"""
+        containers = self._list_containers()
+        print(f"\nИндексация использования действий: {len(containers)} шаблонов и политик...")
+
+        present = set()
+        for kind, container_id, name in containers:
+            present.add(container_key(kind, container_id))
+            self.refresh_container(kind, container_id, name, full=full)
+
+        # Удаленные шаблоны и политики убираем из индекса
+        for ckey in [ckey for ckey in self.containers if ckey not in present]:
+            del self.containers[ckey]
+
+        self.built_at = datetime.datetime.now().isoformat()
+        self._usage = None
+        self.save()
+        print(f"✅ Проиндексировано правил: {sum(len(c['rules']) for c in self.containers.values())}")
+        return True
+
+    def revalidate(self, ckey, rule_keys):
+        """Перепроверяет действия правил условными запросами (If-None-Match)
+
+        Для правил с сохраненным ETag неизменившиеся правила возвращают 304 без
+        тела ответа. Возвращает (число изменившихся правил, ключи правил,
+        которые не удалось проверить).
+        """
+        container = self.containers.get(ckey)
+        if not container:
+            return 0, list(rule_keys)
+        entries = [(rkey, container['rules'][rkey]) for rkey in rule_keys if rkey in container['rules']]
+        api_client = self.actions_manager.api_client
+        changed = []
+        failed = []
+
+        def on_result(item, response):
+            rkey, entry = item
+            if response is not None and response.status_code == 304:
+                return
+            if response is not None and response.status_code == 200:
+                actions = response.json().get('actions', []) or []
+                if actions != entry.get('actions'):
+                    changed.append(rkey)
+                entry['actions'] = actions
+                entry['etag'] = response_etag(response)
+            else:
+                entry['fingerprint'] = None
+                failed.append(rkey)
+                print(f"  ⚠️ Не удалось проверить правило '{entry['name']}'")
+
+        self.executor.map(
+            lambda item: api_client.get_rule_conditional(
+                rule_path(container['kind'], container['id'], item[1]['scope'], item[1]['rule_id']),
+                item[1].get('etag')),
+            entries, on_result)
+        self._usage = None
+        return len(changed), failed
+
+    # ==================== ЗАПРОСЫ ====================
+
+    def _usage_map(self):
+        """Строит (один раз) отображение ID действия -> [(ключ контейнера, ключ правила)]"""
+        if self._usage is None:
+            usage = {}
+            for ckey, container in self.containers.items():
+                for rkey, entry in container['rules'].items():
+                    for action_id in entry.get('actions', []):
+                        usage.setdefault(str(action_id), []).append((ckey, rkey))
+            self._usage = usage
+        return self._usage
+
+    def _describe(self, ckey, rkey):
+        """Возвращает описание правила из индекса"""
+        container = self.containers[ckey]
+        entry = container['rules'][rkey]
+        return {
+            'container_key': ckey,
+            'kind': container['kind'],
+            'container_id': container['id'],
+            'container_name': container.get('name', 'Без названия'),
+            'rule_key': rkey,
+            'rule_id': entry['rule_id'],
+            'name': entry['name'],
+            'scope': entry['scope'],
+            'actions': list(entry.get('actions', [])),
+            'etag': entry.get('etag')
+        }
+
+    def usages(self, action_id, ckey=None):
+        """Правила, использующие действие (во всем тенанте или в одном контейнере)"""
+        return [self._describe(c, r) for c, r in self._usage_map().get(str(action_id), [])
+                if ckey is None or c == ckey]
+
+    def rules_without(self, action_id, ckey):
+        """Правила контейнера, в которых действие не используется"""
+        container = self.containers.get(ckey)
+        if not container:
+            return []
+        return [self._describe(ckey, rkey) for rkey, entry in container['rules'].items()
+                if str(action_id) not in [str(a) for a in entry.get('actions', [])]]
+
+    def rule_count(self, ckey):
+        """Количество правил контейнера в индексе"""
+        container = self.containers.get(ckey)
+        return len(container['rules']) if container else 0
+
+    def invalidate_rule(self, ckey, rkey):
+        """Помечает правило как неизвестное: при следующем обновлении его детали будут перечитаны"""
+        container = self.containers.get(ckey)
+        if not container or rkey not in container['rules']:
+            return
+        container['rules'][rkey]['fingerprint'] = None
+        container['rules'][rkey]['etag'] = None
+
+    def set_rule_actions(self, ckey, rkey, actions, etag=None):
+        """Обновляет действия правила после изменения (ETag прежней версии правила больше не действует)"""
+        container = self.containers.get(ckey)
+        if not container or rkey not in container['rules']:
+            return
+        container['rules'][rkey]['actions'] = list(actions)
+        container['rules'][rkey]['etag'] = etag
+        self._usage = None
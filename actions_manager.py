@@ -1,10 +1,91 @@
 # actions_manager.py (оптимизированный с APIClient и BaseManager)
+import os
 import json
+import threading
 from base_manager import BaseManager
+from action_mutation import (KIND_POLICY, KIND_TEMPLATE, SCOPE_USER, ActionMutationEngine, add_action_transform,
+                             replace_action_transform)
+from action_usage_index import ActionUsageIndex, container_key
+from catalogue_cache import get_catalogue_cache
+
+
+class ActionIndex:
+    """Индекс действий тенанта (имя, type_id) -> действие
+    
+    Список действий загружается один раз, новые действия добавляются в индекс
+    сразу после создания. Поиск и создание потокобезопасны: каждое отсутствующее
+    действие создается ровно один раз, даже при параллельном импорте.
+    """
+    
+    def __init__(self, actions_manager, tenant_id=None):
+        self.actions_manager = actions_manager
+        self.tenant_id = tenant_id
+        self._index = None
+        self._lock = threading.Lock()
+        self._key_locks = {}
+    
+    def _ensure_loaded(self):
+        """Загружает список действий при первом обращении (вызывается под блокировкой)"""
+        if self._index is not None:
+            return True
+        
+        actions = self.actions_manager.get_available_actions()
+        if actions is None:
+            print("❌ Не удалось загрузить список действий для индекса")
+            return False
+        
+        self._index = {}
+        for action in actions:
+            key = (action.get('name'), action.get('type_id'))
+            self._index.setdefault(key, action)
+        return True
+    
+    def find(self, action_name, action_type_id):
+        """Находит действие по имени и типу без запросов к API"""
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            return self._index.get((action_name, action_type_id))
+    
+    def find_or_create(self, action_data):
+        """Находит действие в индексе или создает его (один раз на ключ)"""
+        action_name = action_data.get('name')
+        action_type_id = action_data.get('type_id')
+        
+        if not action_name or not action_type_id:
+            print(f"❌ Неверные данные действия: имя={action_name}, тип={action_type_id}")
+            return None
+        
+        key = (action_name, action_type_id)
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            existing_action = self._index.get(key)
+            if existing_action is None:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+        
+        if existing_action is not None:
+            print(f"  ✓ Действие '{action_name}' уже существует (ID: {existing_action.get('id')})")
+            return existing_action
+        
+        # Создание одного действия не блокирует поиск остальных
+        with key_lock:
+            with self._lock:
+                existing_action = self._index.get(key)
+            if existing_action is not None:
+                return existing_action
+            
+            new_action = self.actions_manager.create_action_from_data(action_data)
+            if new_action:
+                with self._lock:
+                    self._index[key] = new_action
+            return new_action
+
 
 class ActionsManager(BaseManager):
     def __init__(self, api_client):
         super().__init__(api_client)
+        self._usage_indexes = {}
     
     # ==================== ОСНОВНЫЕ МЕТОДЫ ====================
     
@@ -36,9 +117,8 @@ class ActionsManager(BaseManager):
         return self._parse_response_items(response)
     
     def get_action_types(self):
-        """Получает список типов действий"""
-        response = self.api_client.get_action_types()
-        return self._parse_response_items(response)
+        """Получает список типов действий (из кэша справочников)"""
+        return get_catalogue_cache(self.api_client).get_action_types(self.api_client)
     
     def get_web_app_policies(self):
         """Получает список политик веб приложений"""
@@ -89,7 +169,7 @@ class ActionsManager(BaseManager):
     
     # ==================== ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ====================
     
-    def _get_actions_by_type(self, action_key):
+    def get_actions_by_type(self, action_key):
         """Получает действия определенного типа"""
         actions = self.get_available_actions()
         if not actions:
@@ -129,201 +209,257 @@ class ActionsManager(BaseManager):
     
     def add_syslog_action_to_template(self, template_id, syslog_action_id):
         """Добавляет действие send_to_syslog в правила шаблона"""
-        rules = self.get_template_rules(template_id)
-        if not rules:
-            print("Не найдено правил в указанном шаблоне")
+        return self._apply_action_change(
+            KIND_TEMPLATE, template_id, syslog_action_id, False,
+            add_action_transform(syslog_action_id),
+            "Успешно добавлено действие"
+        )
+    
+    def add_syslog_action_to_policy(self, policy_id, syslog_action_id):
+        """Добавляет действие send_to_syslog в правила политики"""
+        return self._apply_action_change(
+            KIND_POLICY, policy_id, syslog_action_id, False,
+            add_action_transform(syslog_action_id),
+            "Успешно добавлено действие"
+        )
+    
+    def replace_actions_in_template(self, template_id, old_action_id, new_action_id):
+        """Заменяет действие в указанном шаблоне политики"""
+        return self._apply_action_change(
+            KIND_TEMPLATE, template_id, old_action_id, True,
+            replace_action_transform(old_action_id, new_action_id),
+            "Успешно заменено действие"
+        )
+    
+    def replace_actions_in_policy(self, policy_id, old_action_id, new_action_id):
+        """Заменяет действие в указанной политике веб приложения"""
+        return self._apply_action_change(
+            KIND_POLICY, policy_id, old_action_id, True,
+            replace_action_transform(old_action_id, new_action_id),
+            "Успешно заменено действие"
+        )
+    
+    # ==================== ИНДЕКС ИСПОЛЬЗОВАНИЯ ДЕЙСТВИЙ ====================
+    
+    def get_action_usage_index(self, refresh=False, build=True):
+        """Возвращает индекс использования действий текущего тенанта
+        
+        build - построить полный индекс, если его еще нет; refresh - обновить
+        уже построенный индекс (только новые и измененные правила).
+        """
+        tenant_id = self.api_client.auth_manager.tenant_id
+        index = self._usage_indexes.get(tenant_id)
+        if index is None:
+            index = ActionUsageIndex(self, tenant_id)
+            index.load()
+            self._usage_indexes[tenant_id] = index
+        
+        if not index.is_built:
+            if build:
+                index.build()
+        elif refresh:
+            index.build(full=False)
+        return index
+    
+    def _apply_action_change(self, kind, container_id, action_id, with_action, transform, done_message):
+        """Изменяет действия только в затронутых правилах шаблона или политики
+        
+        Затронутые правила берутся из индекса использования действий
+        (with_action - правила с действием, иначе - без него) и изменяются
+        через ActionMutationEngine.
+        """
+        # Для одного шаблона или политики полный обход тенанта не нужен
+        index = self.get_action_usage_index(build=False)
+        ckey = container_key(kind, container_id)
+        if not index.refresh_container(kind, container_id):
             return 0, 0
         
-        total_updated = 0
-        total_rules = len(rules)
+        total_rules = index.rule_count(ckey)
+        if not total_rules:
+            print("Не найдено правил в указанном шаблоне" if kind == KIND_TEMPLATE
+                  else "Не найдено правил в указанной политике")
+            return 0, 0
         
-        for rule in rules:
-            rule_id = rule.get('id')
-            rule_name = rule.get('name', 'Без названия')
-            
-            # Получаем детали правила
-            rule_details = self.get_rule_details(template_id, rule_id)
-            if not rule_details:
-                print(f"Не удалось получить детали правила '{rule_name}'")
-                continue
-            
-            current_actions = rule_details.get('actions', [])
-            
-            # Проверяем, есть ли уже это действие в правиле
-            if syslog_action_id in current_actions:
-                continue
-            
-            # Добавляем действие
-            new_actions = current_actions + [syslog_action_id]
-            
-            # Обновляем только действия
-            response = self.update_rule_actions_only(template_id, rule_id, new_actions)
-            if self._check_response(response):
-                print(f"Успешно добавлено действие в правило '{rule_name}'")
-                total_updated += 1
-            else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"Ошибка при обновлении правила '{rule_name}': {error_msg}")
+        rules = index.usages(action_id, ckey) if with_action else index.rules_without(action_id, ckey)
+        print(f"Затронуто правил по индексу: {len(rules)} из {total_rules}")
         
-        return total_updated, total_rules
+        # Перед изменением действия правил перечитываются, индекс получает актуальные списки
+        summary = ActionMutationEngine(self.api_client).run(
+            rules, transform, done_message,
+            on_actions=lambda rule, actions: index.set_rule_actions(ckey, rule['rule_key'], actions)
+        )
+        index.save()
+        return summary['updated'], total_rules
     
-    def add_syslog_action_to_policy(self, policy_id, syslog_action_id):
-        """Добавляет действие send_to_syslog в правила политики"""
-        # Получаем все правила политики (системные и пользовательские)
-        system_rules = self.get_policy_system_rules(policy_id)
-        user_rules = self.get_policy_user_rules(policy_id)
-        
-        all_rules = []
-        if system_rules:
-            all_rules.extend(system_rules)
-        if user_rules:
-            all_rules.extend(user_rules)
-        
-        if not all_rules:
-            print("Не найдено правил в указанной политике")
-            return 0, 0
+    def show_action_usage(self):
+        """Показывает, в каких правилах шаблонов и политик используется действие"""
+        actions = self.get_available_actions()
+        action = self._select_item_from_list(actions, "Доступные действия")
+        if not action:
+            return
         
-        total_updated = 0
-        total_rules = len(all_rules)
+        index = self.get_action_usage_index()
+        usages = index.usages(action.get('id'))
+        action_name = action.get('name', 'Без названия')
+        if not usages:
+            print(f"\nДействие '{action_name}' не используется ни в одном правиле")
+        else:
+            print(f"\nДействие '{action_name}' используется в {len(usages)} правилах:")
+            current_container = None
+            for usage in usages:
+                if usage['container_key'] != current_container:
+                    current_container = usage['container_key']
+                    kind_name = 'Шаблон' if usage['kind'] == KIND_TEMPLATE else 'Политика'
+                    print(f"\n{kind_name} '{usage['container_name']}' (ID: {usage['container_id']}):")
+                rule_type = 'пользовательское' if usage['scope'] == SCOPE_USER else 'системное'
+                print(f"  - {usage['name']} ({rule_type}, ID: {usage['rule_id']})")
+        print(f"\nИндекс построен: {index.built_at}")
+    
+    def rebuild_action_usage_index(self):
+        """Обновляет индекс использования действий"""
+        index = self.get_action_usage_index(build=False)
+        full = self._confirm_action("Перечитать все правила (иначе только новые и измененные)?")
+        index.build(full=full)
+    
+    # ==================== ПЛАНИРОВАНИЕ ИЗМЕНЕНИЙ ====================
+    
+    def _select_plan_containers(self):
+        """Выбор шаблонов и политик для плана, возвращает [(вид, ID, имя)]"""
+        print("\n=== Выберите объекты для плана ===")
+        print("1. Шаблон политики")
+        print("2. Политика веб приложения")
+        print("3. Все шаблоны и политики тенанта")
+        print("4. Отмена")
         
-        for rule in all_rules:
-            rule_id = rule.get('id')
-            rule_name = rule.get('name', 'Без названия')
-            is_user_rule = rule.get('is_user_rule', False)
-            
-            # Получаем детали правила
-            if is_user_rule:
-                rule_details = self.get_policy_user_rule_details(policy_id, rule_id)
-            else:
-                rule_details = self.get_policy_system_rule_details(policy_id, rule_id)
-                
-            if not rule_details:
-                print(f"Не удалось получить детали правила '{rule_name}'")
-                continue
-            
-            current_actions = rule_details.get('actions', [])
-            
-            # Проверяем, есть ли уже это действие в правиле
-            if syslog_action_id in current_actions:
-                continue
-            
-            # Добавляем действие
-            new_actions = current_actions + [syslog_action_id]
+        while True:
+            choice = input("\nВаш выбор (1-4): ").strip()
             
-            # Обновляем только действия
-            if is_user_rule:
-                response = self.update_policy_user_rule_actions_only(policy_id, rule_id, new_actions)
-            else:
-                response = self.update_policy_system_rule_actions_only(policy_id, rule_id, new_actions)
-                
-            if self._check_response(response):
-                rule_type = 'пользовательское' if is_user_rule else 'системное'
-                print(f"Успешно добавлено действие в правило '{rule_name}' ({rule_type})")
-                total_updated += 1
+            if choice == '1':
+                template = self._select_template()
+                return [(KIND_TEMPLATE, template['id'], template.get('name'))] if template else None
+            elif choice == '2':
+                policy = self._select_policy()
+                return [(KIND_POLICY, policy['id'], policy.get('name'))] if policy else None
+            elif choice == '3':
+                containers = [(KIND_TEMPLATE, t.get('id'), t.get('name')) for t in self.get_user_templates() or []]
+                containers += [(KIND_POLICY, p.get('id'), p.get('name')) for p in self.get_web_app_policies() or []]
+                return containers
+            elif choice == '4':
+                return None
             else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"Ошибка при обновлении правила '{rule_name}': {error_msg}")
+                print("Некорректный выбор. Попробуйте снова.")
+    
+    def plan_actions_operation(self):
+        """Строит план изменения действий без записи, сохраняет его и предлагает применить"""
+        from action_plan import ActionChangePlanner
+        
+        action_type = self._select_action_type()
+        if not action_type:
+            return
+        
+        if not self.api_client.auth_manager.tenant_id:
+            print("Сначала необходимо выбрать тенант")
+            return
         
-        return total_updated, total_rules
+        action_data = self._select_specific_action(action_type)
+        if not action_data:
+            return
+        
+        containers = self._select_plan_containers()
+        if not containers:
+            return
+        
+        new_action = {'id': action_data['new_action_id'], 'name': action_data['new_action_name']}
+        old_action = None
+        if action_type['type'] == 'replace':
+            old_action = {'id': action_data['old_action_id'], 'name': action_data['old_action_name']}
+        
+        planner = ActionChangePlanner(self)
+        plan = planner.plan(action_type['type'], containers, new_action, old_action)
+        planner.print_plan(plan)
+        plan_path = planner.save_plan(plan)
+        print(f"\nПлан сохранен: {plan_path}")
+        
+        if plan['changes'] and self._confirm_action("Применить план сейчас?"):
+            planner.apply(plan)
     
-    def replace_actions_in_template(self, template_id, old_action_id, new_action_id):
-        """Заменяет действие в указанном шаблоне политики"""
-        rules = self.get_template_rules(template_id)
-        if not rules:
-            print("Не найдено правил в указанном шаблоне")
-            return 0, 0
+    def apply_saved_action_plan(self):
+        """Применяет сохраненный план изменения действий"""
+        from action_plan import ActionChangePlanner
+        
+        planner = ActionChangePlanner(self)
+        plan_paths = planner.list_plans()
+        if not plan_paths:
+            print(f"Нет сохраненных планов в {planner.plan_dir}")
+            return
         
-        total_replaced = 0
-        total_rules = len(rules)
+        plan_path = self._select_item_from_list(
+            [{'name': os.path.basename(path), 'id': path} for path in plan_paths], "Сохраненные планы"
+        )
+        if not plan_path:
+            return
         
-        for rule in rules:
-            rule_id = rule.get('id')
-            rule_name = rule.get('name', 'Без названия')
-            
-            # Получаем детали правила
-            rule_details = self.get_rule_details(template_id, rule_id)
-            if not rule_details:
-                print(f"Не удалось получить детали правила '{rule_name}'")
-                continue
-            
-            current_actions = rule_details.get('actions', [])
-            
-            # Проверяем, есть ли старое действие в правиле
-            if old_action_id not in current_actions:
-                continue
-            
-            # Заменяем действие
-            new_actions = [new_action_id if action_id == old_action_id else action_id for action_id in current_actions]
-            
-            # Обновляем только действия
-            response = self.update_rule_actions_only(template_id, rule_id, new_actions)
-            if self._check_response(response):
-                print(f"Успешно заменено действие в правиле '{rule_name}'")
-                total_replaced += 1
-            else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"Ошибка при обновлении правила '{rule_name}': {error_msg}")
+        plan = planner.load_plan(plan_path['id'])
+        if not plan:
+            return
         
-        return total_replaced, total_rules
+        planner.print_plan(plan)
+        if not plan['changes']:
+            print("В плане нет изменений")
+            return
+        if not self._confirm_action(f"Применить {len(plan['changes'])} изменений из плана?"):
+            print("Отмена операции")
+            return
+        planner.apply(plan)
     
-    def replace_actions_in_policy(self, policy_id, old_action_id, new_action_id):
-        """Заменяет действие в указанной политике веб приложения"""
-        # Получаем все правила политики (системные и пользовательские)
-        system_rules = self.get_policy_system_rules(policy_id)
-        user_rules = self.get_policy_user_rules(policy_id)
-        
-        all_rules = []
-        if system_rules:
-            all_rules.extend(system_rules)
-        if user_rules:
-            all_rules.extend(user_rules)
-        
-        if not all_rules:
-            print("Не найдено правил в указанной политике")
-            return 0, 0
+    # ==================== ПРИМЕНЕНИЕ В НЕСКОЛЬКИХ ТЕНАНТАХ ====================
+    
+    def rollout_action_to_tenants(self, max_workers=None, rate_limit=None):
+        """Применяет операцию с действием ко всем шаблонам и политикам выбранных тенантов
         
-        total_replaced = 0
-        total_rules = len(all_rules)
+        Действия выбираются в текущем тенанте, в остальных тенантах они
+        находятся по имени и ключу типа действия.
+        """
+        from tenants import TenantManager
+        from parallel_executor import DEFAULT_MAX_WORKERS
+        from action_rollout import ActionRolloutPipeline
         
-        for rule in all_rules:
-            rule_id = rule.get('id')
-            rule_name = rule.get('name', 'Без названия')
-            is_user_rule = rule.get('is_user_rule', False)
-            
-            # Получаем детали правила
-            if is_user_rule:
-                rule_details = self.get_policy_user_rule_details(policy_id, rule_id)
-            else:
-                rule_details = self.get_policy_system_rule_details(policy_id, rule_id)
-                
-            if not rule_details:
-                print(f"Не удалось получить детали правила '{rule_name}'")
-                continue
-            
-            current_actions = rule_details.get('actions', [])
-            
-            # Проверяем, есть ли старое действие в правиле
-            if old_action_id not in current_actions:
-                continue
-            
-            # Заменяем действие
-            new_actions = [new_action_id if action_id == old_action_id else action_id for action_id in current_actions]
-            
-            # Обновляем только действия
-            if is_user_rule:
-                response = self.update_policy_user_rule_actions_only(policy_id, rule_id, new_actions)
-            else:
-                response = self.update_policy_system_rule_actions_only(policy_id, rule_id, new_actions)
-                
-            if self._check_response(response):
-                rule_type = 'пользовательское' if is_user_rule else 'системное'
-                print(f"Успешно заменено действие в правиле '{rule_name}' ({rule_type})")
-                total_replaced += 1
-            else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"Ошибка при обновлении правила '{rule_name}': {error_msg}")
+        action_type = self._select_action_type()
+        if not action_type:
+            return
         
-        return total_replaced, total_rules
+        if not self.api_client.auth_manager.tenant_id:
+            print("Сначала необходимо выбрать тенант")
+            return
+        
+        action_data = self._select_specific_action(action_type)
+        if not action_data:
+            return
+        
+        tenant_manager = TenantManager(self.api_client.auth_manager, self.api_client.make_request)
+        tenants = tenant_manager.select_multiple_tenants("Выберите тенанты для применения операции:")
+        if not tenants:
+            return
+        
+        if action_type['type'] == 'add':
+            confirm_msg = (f"Добавить действие '{action_data['new_action_name']}' во все правила шаблонов "
+                           f"и политик в {len(tenants)} тенантах?")
+        else:
+            confirm_msg = (f"Заменить действие '{action_data['old_action_name']}' на '{action_data['new_action_name']}' "
+                           f"во всех шаблонах и политиках в {len(tenants)} тенантах?")
+        if not self._confirm_action(confirm_msg):
+            print("Отмена операции")
+            return
+        
+        pipeline = ActionRolloutPipeline(
+            self.api_client, action_type['type'], action_type['action_key'],
+            action_data['new_action_name'], action_data.get('old_action_name'),
+            max_workers=max_workers or DEFAULT_MAX_WORKERS, rate_limit=rate_limit
+        )
+        results, _ = pipeline.run(tenants)
+        # Конвейер сохранил обновленные индексы тенантов - при следующем обращении они загружаются заново
+        self._usage_indexes.clear()
+        return results
     
     # ==================== ИНТЕРАКТИВНОЕ УПРАВЛЕНИЕ ====================
     
@@ -332,13 +468,28 @@ class ActionsManager(BaseManager):
         while True:
             print("\n=== Управление действиями в правилах ===")
             print("1. Замена или добавление действий")
-            print("2. Вернуться в главное меню")
+            print("2. Спланировать замену или добавление (без изменений)")
+            print("3. Применить сохраненный план")
+            print("4. Где используется действие")
+            print("5. Обновить индекс использования действий")
+            print("6. Применить операцию во всех шаблонах и политиках нескольких тенантов")
+            print("7. Вернуться в главное меню")
             
-            choice = input("\nВыберите действие (1-2): ")
+            choice = input("\nВыберите действие (1-7): ")
             
             if choice == '1':
                 self._perform_actions_operation()
             elif choice == '2':
+                self.plan_actions_operation()
+            elif choice == '3':
+                self.apply_saved_action_plan()
+            elif choice == '4':
+                self.show_action_usage()
+            elif choice == '5':
+                self.rebuild_action_usage_index()
+            elif choice == '6':
+                self.rollout_action_to_tenants()
+            elif choice == '7':
                 return
             else:
                 print("Некорректный выбор. Попробуйте снова.")
@@ -397,7 +548,7 @@ class ActionsManager(BaseManager):
         """Выбор конкретного действия"""
         if action_type['type'] == 'add':
             # Для добавления нужен только одно действие
-            actions = self._get_actions_by_type(action_type['action_key'])
+            actions = self.get_actions_by_type(action_type['action_key'])
             if not actions:
                 print(f"Не найдено действий типа '{action_type['name']}'")
                 return None
@@ -416,7 +567,7 @@ class ActionsManager(BaseManager):
         
         else:  # replace
             # Для замены нужны два действия - старое и новое
-            actions = self._get_actions_by_type(action_type['action_key'])
+            actions = self.get_actions_by_type(action_type['action_key'])
             if not actions:
                 print(f"Не найдено действий типа '{action_type['name']}'")
                 return None
@@ -556,6 +707,10 @@ class ActionsManager(BaseManager):
                 return action
         return None
 
+    def build_action_index(self):
+        """Создает индекс действий текущего тенанта"""
+        return ActionIndex(self, self.api_client.auth_manager.tenant_id)
+
     def find_or_create_action(self, action_data):
         """Находит существующее действие или создает новое"""
         action_name = action_data.get('name')
@@ -572,6 +727,11 @@ class ActionsManager(BaseManager):
             return existing_action
         
         # Создаем новое действие
+        return self.create_action_from_data(action_data)
+
+    def create_action_from_data(self, action_data):
+        """Создает действие по данным из экспорта или другого тенанта"""
+        action_name = action_data.get('name')
         print(f"  ✗ Действие '{action_name}' не найдено, создаем...")
         create_data = action_data.copy()
         
@@ -600,6 +760,7 @@ class ActionsManager(BaseManager):
                 return {}
         
         action_mapping = {}
+        action_index = self.build_action_index()
         
         for action in source_actions:
             original_action_id = action.get('id')
@@ -611,7 +772,7 @@ class ActionsManager(BaseManager):
                 continue
             
             # Ищем или создаем действие в целевом тенанте
-            target_action = self.find_or_create_action(action)
+            target_action = action_index.find_or_create(action)
             if target_action:
                 action_mapping[original_action_id] = target_action.get('id')
         
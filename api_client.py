@@ -9,6 +9,28 @@ class APIClient:
         self.make_request = make_request_func
         self.error_handler = ErrorHandler(self)
     
+    def clone_for_tenant(self, tenant_id):
+        """Создает независимый клиент, авторизованный в указанном тенанте
+        
+        У копии собственные токены и HTTP сессии, поэтому с разными тенантами
+        можно работать одновременно, не переключая тенант общего клиента.
+        """
+        from base_client import BaseAPIClient
+        # make_request - метод BaseAPIClient, от него берем режим отладки
+        source_client = getattr(self.make_request, '__self__', None)
+        debug = getattr(source_client, 'debug', False)
+        
+        auth_manager = self.auth_manager.clone()
+        base_client = BaseAPIClient(auth_manager, debug)
+        if not auth_manager.get_jwt_tokens(base_client.make_request):
+            return None
+        
+        auth_manager.tenant_id = tenant_id
+        if tenant_id and not auth_manager.update_jwt_with_tenant(base_client.make_request):
+            return None
+        
+        return APIClient(auth_manager, base_client.make_request)
+    
     def _make_api_call(self, method, endpoint, **kwargs):
         """Универсальный метод для API вызовов"""
         url = urljoin(self.auth_manager.base_url, f"{self.auth_manager.api_path}/{endpoint}")
@@ -330,6 +352,30 @@ class APIClient:
             operation_name=f"Обновление правила {rule_id} в наборе пользовательских правил"
         )
     
+    def create_user_rule_raw(self, template_id, rule_data):
+        """Создать правило без обработки ошибок (для параллельных операций с повторами)"""
+        return self._make_api_call(
+            "POST", f"config/policies/templates/with_user_rules/{template_id}/rules", json=rule_data
+        )
+    
+    def update_user_rule_raw(self, template_id, rule_id, update_data):
+        """Обновить правило без обработки ошибок (для параллельных операций с повторами)"""
+        return self._make_api_call(
+            "PATCH", f"config/policies/templates/with_user_rules/{template_id}/rules/{rule_id}", json=update_data
+        )
+    
+    def get_user_rule_details_raw(self, template_id, rule_id):
+        """Получить детали правила без обработки ошибок (для параллельных операций с повторами)"""
+        return self._make_api_call(
+            "GET", f"config/policies/templates/with_user_rules/{template_id}/rules/{rule_id}"
+        )
+    
+    def delete_user_rule_raw(self, template_id, rule_id):
+        """Удалить правило без обработки ошибок (для параллельных операций с повторами)"""
+        return self._make_api_call(
+            "DELETE", f"config/policies/templates/with_user_rules/{template_id}/rules/{rule_id}"
+        )
+    
     def delete_user_rule(self, template_id, rule_id):
         """Удалить пользовательское правило"""
         return self.error_handler.safe_api_call(
@@ -344,6 +390,35 @@ class APIClient:
             self._make_api_call, "PATCH", f"config/policies/templates/with_user_rules/{template_id}/rules/{rule_id}", json=payload,
             operation_name=f"Изменение состояния правила {rule_id}"
         )
+    # ==================== ВЫБОРОЧНОЕ ВОССТАНОВЛЕНИЕ ====================
+    def create_action_raw(self, action_data):
+        """Создать действие без обработки ошибок"""
+        return self._make_api_call("POST", "config/actions", json=action_data)
+    
+    def update_action_raw(self, action_id, update_data):
+        """Обновить действие без обработки ошибок"""
+        return self._make_api_call("PATCH", f"config/actions/{action_id}", json=update_data)
+    
+    def update_global_list_raw(self, list_id, update_data):
+        """Обновить глобальный список без обработки ошибок"""
+        return self._make_api_call("PATCH", f"config/global_lists/{list_id}", json=update_data)
+    
+    # ==================== УСЛОВНЫЕ ЗАПРОСЫ ====================
+    def get_rule_conditional(self, rule_path, etag=None):
+        """Получить правило по пути с If-None-Match (304 - не изменилось), без обработки ошибок"""
+        headers = {"If-None-Match": etag} if etag else None
+        return self._make_api_call("GET", rule_path, headers=headers)
+    
+    def get_snapshot_conditional(self, etag=None):
+        """Получить конфигурацию тенанта с If-None-Match (304 - не изменилась), без обработки ошибок"""
+        headers = {"If-None-Match": etag} if etag else None
+        return self._make_api_call("GET", "config/snapshot", headers=headers)
+    
+    def update_rule_conditional(self, rule_path, update_data, etag=None):
+        """Обновить правило по пути с If-Match (412 - изменено после чтения), без обработки ошибок"""
+        headers = {"If-Match": etag} if etag else None
+        return self._make_api_call("PATCH", rule_path, json=update_data, headers=headers)
+    
     # ==================== УТИЛИТНЫЕ МЕТОДЫ ====================
     def _parse_response_items(self, response):
         """Парсит ответ API для извлечения items"""
@@ -1,6 +1,7 @@
 # auth.py
 import json
 import uuid
+import threading
 from urllib.parse import urljoin
 import requests
 
@@ -16,12 +17,19 @@ class AuthManager:
         self.refresh_token = None
         self.tenant_id = None
         self.fingerprint = str(uuid.uuid4()).replace("-", "")
+        # Общая блокировка обновления токенов для всех потоков и обработчиков ошибок
+        self.token_lock = threading.Lock()
         
         if self.ssl_cert_path:
             self.ssl_verify = self.ssl_cert_path
         else:
             self.ssl_verify = self.verify_ssl
 
+    def clone(self):
+        """Создает независимую копию с теми же учетными данными (без токенов и тенанта)"""
+        return AuthManager(self.base_url, self.username, self.password, self.api_path,
+                           self.verify_ssl, self.ssl_cert_path)
+
     def get_jwt_tokens(self, make_request_func):
         """Получает JWT токены (access и refresh)"""
         url = urljoin(self.base_url, f"{self.api_path}/auth/refresh_tokens")
@@ -96,6 +104,15 @@ class AuthManager:
             print(f"Исключение при обновлении токенов: {e}")
             return False
 
+    def reauthenticate(self, make_request_func):
+        """Получает новые токены после истечения старых и снова привязывает их к выбранному тенанту"""
+        if not self.get_jwt_tokens(make_request_func):
+            return False
+        # Без привязки новые токены относятся к тенанту по умолчанию
+        if self.tenant_id:
+            return self.update_jwt_with_tenant(make_request_func)
+        return True
+
     def get_auth_headers(self):
         """Возвращает заголовки авторизации"""
         headers = {
@@ -1,12 +1,19 @@
 # backup_manager.py (обновленный)
 import os
 import json
+import hashlib
 import datetime
 from base_manager import BaseManager
+from snapshot_store import STORAGE_FILES, STORAGE_STORE, SnapshotStore, canonical_bytes
+from snapshot_catalog import get_snapshot_catalog, load_snapshot_file, snapshot_path_exists
 
 class BackupManager(BaseManager):
-    def __init__(self, api_client):
+    def __init__(self, api_client, storage=STORAGE_FILES):
         super().__init__(api_client)
+        # files - отдельные JSON файлы на каждый запуск, store - хранилище с адресацией по содержимому
+        self.storage = storage
+        self.store = SnapshotStore() if storage == STORAGE_STORE else None
+        self.catalog = get_snapshot_catalog()
         # Инициализируем другие менеджеры
         from backends_manager import BackendsManager
         from roles_manager import RolesManager
@@ -34,6 +41,8 @@ class BackupManager(BaseManager):
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            self._catalog_file(tenant_id, 'snapshot', current_time, filepath, snapshot)
+            self._index_file(filepath)
             print(f"Конфигурация сохранена в файл:")
             print(f"📁 Полный путь: {absolute_filepath}")
             return absolute_filepath
@@ -61,6 +70,7 @@ class BackupManager(BaseManager):
             
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(cleaned_backends, f, ensure_ascii=False, indent=2)
+            self._catalog_file(tenant_id, 'backends', current_time, filepath, cleaned_backends)
             print(f"Бекенды сохранены в файл:")
             print(f"📁 Полный путь: {absolute_filepath}")
             return absolute_filepath
@@ -85,6 +95,7 @@ class BackupManager(BaseManager):
             
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(cleaned_roles, f, ensure_ascii=False, indent=2)
+            self._catalog_file(tenant_id, 'roles', current_time, filepath, cleaned_roles)
             print(f"Роли сохранены в файл: {filepath}")
             return filepath
         except Exception as e:
@@ -108,12 +119,96 @@ class BackupManager(BaseManager):
             
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(cleaned_actions, f, ensure_ascii=False, indent=2)
+            self._catalog_file(tenant_id, 'custom_actions', current_time, filepath, cleaned_actions)
             print(f"Пользовательские действия сохранены в файл: {filepath}")
             return filepath
         except Exception as e:
             print(f"Ошибка при сохранении пользовательских действий: {e}")
             return None
     
+    def _catalog_file(self, tenant_id, resource, timestamp, filepath, data):
+        """Записывает сохраненный файл в каталог снапшотов"""
+        self.catalog.record(tenant_id, resource, timestamp, os.path.abspath(filepath), STORAGE_FILES,
+                            size=os.path.getsize(filepath),
+                            checksum=hashlib.sha256(canonical_bytes(data)).hexdigest())
+    
+    def _index_file(self, filepath):
+        """Строит индекс разделов снапшота сразу при сохранении (иначе он строится при первом чтении)"""
+        from snapshot_reader import build_index
+        try:
+            build_index(filepath)
+        except (OSError, ValueError) as e:
+            print(f"Не удалось построить индекс снапшота: {e}")
+    
+    def _ensure_catalog(self):
+        """Дописывает в каталог снапшоты, сохраненные до его появления (один раз на каталог)"""
+        if not self.catalog.is_backfilled():
+            self.catalog.rebuild(store=self.store or SnapshotStore(), only_missing=True)
+    
+    def clean_resource(self, name, data):
+        """Очищает ресурс так же, как при сохранении (удаляет системные поля)"""
+        cleaners = {
+            'backends': self.backends_manager._clean_backends_data,
+            'roles': self._clean_roles_data,
+            'custom_actions': self._clean_actions_data
+        }
+        return cleaners.get(name, lambda data: data)(data)
+    
+    def resource_checksum(self, name, data):
+        """Контрольная сумма ресурса в том виде, в каком она записывается в каталог"""
+        return hashlib.sha256(canonical_bytes(self.clean_resource(name, data))).hexdigest()
+    
+    def save_tenant_resources(self, tenant_id, resources, base_dir="snapshot", unchanged=()):
+        """Сохраняет ресурсы тенанта ({snapshot, backends, roles, custom_actions}) выбранным способом
+        
+        unchanged - ресурсы, не изменившиеся с прошлого сохранения: файлы для
+        них не пишутся, а запуск в хранилище ссылается на их прежние объекты.
+        Возвращает {ресурс: путь}, для хранилища путь - манифест запуска.
+        """
+        resources = {name: data for name, data in resources.items() if data}
+        if self.store is None:
+            savers = {
+                'snapshot': self.save_snapshot_to_file,
+                'backends': self.save_backends_to_file,
+                'roles': self.save_roles_to_file,
+                'custom_actions': self.save_custom_actions_to_file
+            }
+            saved = {name: savers[name](data, tenant_id, base_dir=base_dir) for name, data in resources.items()}
+            return {name: path for name, path in saved.items() if path}
+        
+        try:
+            cleaned = {name: self.clean_resource(name, data) for name, data in resources.items()}
+            objects = {name: self.store.put_resource(tenant_id, name, data) for name, data in cleaned.items()}
+            carried = {}
+            for name in unchanged:
+                entry = self.store.latest_entry(tenant_id, name)
+                if entry and name not in objects:
+                    objects[name] = entry
+                    carried[name] = self.catalog.latest(tenant_id, name) or {}
+            created_at = datetime.datetime.now()
+            manifest_path = self.store.write_manifest(tenant_id, objects, created_at)
+            timestamp = created_at.strftime("%Y-%m-%d-%H-%M-%S")
+            for name, data in cleaned.items():
+                raw = canonical_bytes(data)
+                self.catalog.record(tenant_id, name, timestamp, os.path.abspath(manifest_path), STORAGE_STORE,
+                                    size=len(raw), checksum=hashlib.sha256(raw).hexdigest())
+            for name, previous in carried.items():
+                self.catalog.record(tenant_id, name, timestamp, os.path.abspath(manifest_path), STORAGE_STORE,
+                                    size=previous.get('size'), checksum=previous.get('checksum'))
+        except Exception as e:
+            print(f"Ошибка при сохранении в хранилище снапшотов: {e}")
+            return {}
+        print(f"Данные тенанта сохранены в хранилище: {os.path.abspath(manifest_path)}")
+        return {name: manifest_path for name in objects}
+    
+    def load_snapshot(self, path):
+        """Читает конфигурацию из файла снапшота или из манифеста хранилища"""
+        store = self.store or SnapshotStore()
+        if store.is_manifest(path):
+            return store.load_resource(path, 'snapshot')
+        # Старые снапшоты могут быть перенесены очисткой в архив
+        return load_snapshot_file(path)
+    
     def _clean_roles_data(self, roles_data):
         """Очищает данные ролей - удаляет id и is_default"""
         if isinstance(roles_data, dict) and 'items' in roles_data:
@@ -162,50 +257,34 @@ class BackupManager(BaseManager):
         else:
             return actions_data
 
-    def _find_available_snapshots(self, tenant_id):
-        """Находит все доступные файлы снапшотов для указанного тенанта"""
+    def _find_catalog_entries(self, tenant_id, resource, storage=None, limit=None):
+        """Записи каталога о ресурсе тенанта (последняя первой), без удаленных вручную файлов"""
         if not tenant_id:
             return []
-        
-        tenant_dir = os.path.join("snapshot", tenant_id)
-        if not os.path.exists(tenant_dir):
-            return []
-        
-        # Ищем все файлы снапшотов
-        snapshot_files = []
-        for filename in os.listdir(tenant_dir):
-            if filename.endswith('-snapshot.json'):
-                filepath = os.path.join(tenant_dir, filename)
-                # Извлекаем timestamp из имени файла
-                timestamp = filename.split('-snapshot.json')[0]
-                snapshot_files.append((filepath, timestamp))
-        
-        # Сортируем по времени (последний первый)
-        snapshot_files.sort(key=lambda x: x[1], reverse=True)
-        return snapshot_files
+        self._ensure_catalog()
+        entries = []
+        for entry in self.catalog.query(tenant_id=tenant_id, resource=resource, storage=storage):
+            if not snapshot_path_exists(entry['path']):
+                self.catalog.remove(entry['path'])
+                continue
+            entries.append(entry)
+            if limit and len(entries) >= limit:
+                break
+        return entries
+    
+    def _find_available_snapshots(self, tenant_id):
+        """Находит все доступные файлы снапшотов для указанного тенанта"""
+        return [(entry['path'], entry['timestamp'])
+                for entry in self._find_catalog_entries(tenant_id, 'snapshot', STORAGE_FILES)]
+    
+    def find_available_snapshots(self, tenant_id):
+        """Находит снапшоты тенанта в файлах и в хранилище (последний первый)"""
+        return [(entry['path'], entry['timestamp']) for entry in self._find_catalog_entries(tenant_id, 'snapshot')]
 
     def _find_latest_backends_file(self, tenant_id):
         """Находит последний файл с бекендами для указанного тенанта"""
-        if not tenant_id:
-            return None
-        
-        tenant_dir = os.path.join("snapshot", tenant_id)
-        if not os.path.exists(tenant_dir):
-            return None
-        
-        # Ищем все файлы бекендов
-        backends_files = []
-        for filename in os.listdir(tenant_dir):
-            if filename.endswith('-backends.json'):
-                filepath = os.path.join(tenant_dir, filename)
-                backends_files.append((filepath, os.path.getmtime(filepath)))
-        
-        if not backends_files:
-            return None
-        
-        # Сортируем по времени изменения (последний первый)
-        backends_files.sort(key=lambda x: x[1], reverse=True)
-        return backends_files[0][0]
+        entries = self._find_catalog_entries(tenant_id, 'backends', STORAGE_FILES, limit=1)
+        return entries[0]['path'] if entries else None
 
     def _select_index(self, items, prompt):
         """Выбор индекса из списка (переопределяем для совместимости)"""
@@ -1,5 +1,7 @@
 # base_client.py
 import json
+import time
+import threading
 import requests
 from urllib.parse import urljoin
 import urllib3
@@ -15,6 +17,25 @@ class BaseAPIClient:
             "Accept": "application/json",
             "Content-Type": "application/json"
         }
+        # Отдельная сессия на поток: соединения переиспользуются и при параллельной работе
+        self._local = threading.local()
+
+    def _get_session(self):
+        """Возвращает HTTP сессию текущего потока"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _refresh_tokens(self, used_token):
+        """Обновляет токены один раз на все потоки, получившие 401 с одним и тем же токеном"""
+        with self.auth_manager.token_lock:
+            if self.auth_manager.access_token and self.auth_manager.access_token != used_token:
+                # Токен уже обновлен другим потоком
+                return True
+            print("Получена 401 ошибка, пытаемся обновить токен...")
+            return self.auth_manager.reauthenticate(self.make_request)
 
     def _debug_request(self, method, url, **kwargs):
         """Выводит отладочную информацию о запросе"""
@@ -37,15 +58,20 @@ class BaseAPIClient:
             except:
                 print(f"Response: {response.text[:500]}")
 
-    def make_request(self, method, url, max_retries=2, **kwargs):
-        """Универсальный метод для выполнения запросов"""
+    def make_request(self, method, url, max_retries=2, headers=None, **kwargs):
+        """Универсальный метод для выполнения запросов
+        
+        headers - дополнительные заголовки запроса (например, If-None-Match)
+        """
+        extra_headers = headers or {}
+        used_token = self.auth_manager.access_token
         auth_headers = self.auth_manager.get_auth_headers()
-        headers = {**self.headers, **auth_headers}
+        headers = {**self.headers, **auth_headers, **extra_headers}
         
         for attempt in range(max_retries + 1):
             try:
                 self._debug_request(method, url, **kwargs)
-                response = requests.request(
+                response = self._get_session().request(
                     method,
                     url,
                     headers=headers,
@@ -56,10 +82,10 @@ class BaseAPIClient:
 
                 # Если получили 401 и это не последняя попытка - обновляем токен
                 if response.status_code == 401 and attempt < max_retries:
-                    print("Получена 401 ошибка, пытаемся обновить токен...")
-                    if self.auth_manager.get_jwt_tokens(self.make_request):
+                    if self._refresh_tokens(used_token):
+                        used_token = self.auth_manager.access_token
                         auth_headers = self.auth_manager.get_auth_headers()
-                        headers = {**self.headers, **auth_headers}
+                        headers = {**self.headers, **auth_headers, **extra_headers}
                         continue
                     else:
                         print("Не удалось обновить JWT токены")
@@ -0,0 +1,182 @@
+# catalogue_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+
+CACHE_DIR = "catalogue_cache"
+CACHE_VERSION = 2
+DEFAULT_CATALOGUE_TTL = 24 * 60 * 60
+
+CATALOGUE_ACTION_TYPES = "action_types"
+CATALOGUE_VENDOR_TEMPLATES = "vendor_templates"
+
+_caches = {}
+_caches_lock = threading.Lock()
+# Настройки, заданные при запуске, действуют на кэши всех тенантов сервера
+_ttls = {}
+
+
+def _fingerprint(items):
+    """Отпечаток содержимого справочника"""
+    raw = json.dumps(items, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class CatalogueCache:
+    """Дисковый кэш справочников PTAF (типы действий, системные шаблоны)
+
+    Справочники меняются редко, поэтому они хранятся на диске отдельно для
+    каждого сервера и тенанта. По истечении ttl запрашиваются типы действий:
+    их отпечаток служит отпечатком всего каталога, и при его изменении
+    остальные справочники сбрасываются. Кроме того, каждый справочник
+    перезагружается не реже раза в ttl: системные шаблоны меняются с
+    обновлением набора правил и тогда, когда типы действий остаются прежними.
+    """
+
+    def __init__(self, server_url, tenant_id=None, cache_dir=CACHE_DIR, ttl=DEFAULT_CATALOGUE_TTL):
+        self.server_url = server_url or ""
+        self.tenant_id = tenant_id
+        self.cache_path = os.path.join(cache_dir, f"{server_cache_prefix(self.server_url)}{tenant_id or 'default'}.json")
+        self.ttl = ttl
+        self.fingerprint = None
+        self.checked_at = 0
+        self.entries = {}
+        # Время загрузки каждого справочника
+        self.fetched_at = {}
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Загружает кэш с диска, возвращает True если он найден"""
+        if not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать кэш справочников: {e}")
+            return False
+        if data.get('version') != CACHE_VERSION or data.get('server') != self.server_url or \
+                data.get('tenant_id') != self.tenant_id:
+            return False
+        self.fingerprint = data.get('fingerprint')
+        self.checked_at = data.get('checked_at', 0)
+        self.entries = data.get('entries', {})
+        self.fetched_at = data.get('fetched_at', {})
+        return True
+
+    def save(self):
+        """Сохраняет кэш на диск (через временный файл)"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CACHE_VERSION,
+                'server': self.server_url,
+                'tenant_id': self.tenant_id,
+                'fingerprint': self.fingerprint,
+                'checked_at': self.checked_at,
+                'entries': self.entries,
+                'fetched_at': self.fetched_at
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def clear(self):
+        """Сбрасывает кэш: все справочники будут загружены заново"""
+        with self._lock:
+            self.fingerprint = None
+            self.checked_at = 0
+            self.entries = {}
+            self.fetched_at = {}
+            if os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+
+    def _is_stale(self):
+        return self.fingerprint is None or time.time() - self.checked_at > self.ttl
+
+    def _revalidate(self, api_client):
+        """Сверяет отпечаток каталога с сервером, возвращает False если сервер недоступен"""
+        response = api_client.get_action_types()
+        items = api_client._parse_response_items(response)
+        if items is None:
+            return False
+
+        fingerprint = _fingerprint(items)
+        if fingerprint != self.fingerprint:
+            if self.fingerprint is not None:
+                print("Справочники PTAF изменились, кэш справочников обновлен")
+            self.entries = {}
+            self.fetched_at = {}
+            self.fingerprint = fingerprint
+        self.entries[CATALOGUE_ACTION_TYPES] = items
+        self.checked_at = time.time()
+        self.fetched_at[CATALOGUE_ACTION_TYPES] = self.checked_at
+        self.save()
+        return True
+
+    def get(self, api_client, name, fetch):
+        """Возвращает справочник из кэша; fetch() загружает его с сервера (None - ошибка)"""
+        with self._lock:
+            if self._is_stale() and not self._revalidate(api_client):
+                # Сервер не ответил - отдаем то, что есть, без сохранения
+                return self.entries[name] if name in self.entries else fetch()
+
+            expired = time.time() - self.fetched_at.get(name, 0) > self.ttl
+            if name not in self.entries or expired:
+                items = fetch()
+                if items is None:
+                    # Устаревший справочник лучше, чем никакого
+                    return self.entries.get(name)
+                if name in self.entries and _fingerprint(items) != _fingerprint(self.entries[name]):
+                    print(f"Справочник {name} изменился, кэш справочников обновлен")
+                self.entries[name] = items
+                self.fetched_at[name] = time.time()
+                self.save()
+            return self.entries[name]
+
+    def get_action_types(self, api_client):
+        """Типы действий"""
+        return self.get(api_client, CATALOGUE_ACTION_TYPES,
+                        lambda: api_client._parse_response_items(api_client.get_action_types()))
+
+    def get_vendor_templates(self, api_client):
+        """Системные шаблоны (наборы правил)"""
+        return self.get(api_client, CATALOGUE_VENDOR_TEMPLATES,
+                        lambda: api_client._parse_response_items(api_client.get_vendor_templates()))
+
+
+def server_cache_prefix(server_url):
+    """Префикс файлов кэша сервера (за ним следует ID тенанта)"""
+    return f"{hashlib.sha1((server_url or '').encode('utf-8')).hexdigest()[:16]}-"
+
+
+def get_catalogue_cache(api_client, ttl=None, refresh=False):
+    """Возвращает общий кэш справочников сервера и тенанта клиента (один на процесс)
+
+    ttl и refresh относятся ко всем тенантам сервера: refresh сбрасывает все
+    его кэши, в том числе сохраненные на диске.
+    """
+    server_url = api_client.auth_manager.base_url
+    tenant_id = api_client.auth_manager.tenant_id
+    with _caches_lock:
+        if ttl is not None:
+            _ttls[server_url] = ttl
+            for (cache_server, _), cache in _caches.items():
+                if cache_server == server_url:
+                    cache.ttl = ttl
+        if refresh:
+            for (cache_server, _), cache in list(_caches.items()):
+                if cache_server == server_url:
+                    cache.clear()
+            prefix = server_cache_prefix(server_url)
+            if os.path.isdir(CACHE_DIR):
+                for filename in os.listdir(CACHE_DIR):
+                    if filename.startswith(prefix) and filename.endswith('.json'):
+                        os.remove(os.path.join(CACHE_DIR, filename))
+        cache = _caches.get((server_url, tenant_id))
+        if cache is None:
+            cache = CatalogueCache(server_url, tenant_id, ttl=_ttls.get(server_url, DEFAULT_CATALOGUE_TTL))
+            _caches[(server_url, tenant_id)] = cache
+    return cache
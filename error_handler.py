@@ -6,10 +6,32 @@ class ErrorHandler:
     def __init__(self, api_client):
         self.api_client = api_client
     
+    def _request_token(self, response):
+        """Возвращает токен, с которым был отправлен запрос (None - неизвестен)"""
+        request = getattr(response, 'request', None)
+        authorization = getattr(request, 'headers', {}).get('Authorization', '') if request is not None else ''
+        if authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):]
+        return None
+    
+    def _refresh_tokens(self, response):
+        """Обновляет токены под общей блокировкой
+        
+        Ошибку с одним и тем же токеном могут получить несколько потоков:
+        токены обновляет первый из них, остальные используют уже новые.
+        """
+        auth_manager = self.api_client.auth_manager
+        used_token = self._request_token(response)
+        with auth_manager.token_lock:
+            if used_token is not None and auth_manager.access_token and auth_manager.access_token != used_token:
+                # Токен уже обновлен другим потоком
+                return True
+            return auth_manager.reauthenticate(self.api_client.make_request)
+    
     def handle_401_error(self, response=None):
         """Обрабатывает ошибку 401 - обновляет токен"""
         print("Получена 401 ошибка, пытаемся обновить токен...")
-        if self.api_client.auth_manager.get_jwt_tokens(self.api_client.make_request):
+        if self._refresh_tokens(response):
             print("✅ Токен успешно обновлен")
             return True
         else:
@@ -20,21 +42,11 @@ class ErrorHandler:
         """Обрабатывает ошибку 404 - обновляет токен для текущего тенанта"""
         print("Обновляем токен для текущего тенанта...")
         
-        # Сохраняем текущий тенант
-        current_tenant_id = self.api_client.auth_manager.tenant_id
-        
-        # Получаем новые токены
-        if not self.api_client.auth_manager.get_jwt_tokens(self.api_client.make_request):
-            print("❌ Не удалось получить новые JWT токены")
+        # Новые токены снова привязываются к текущему тенанту
+        if not self._refresh_tokens(response):
+            print("❌ Не удалось обновить токен для тенанта")
             return False
         
-        # Обновляем токен для текущего тенанта
-        if current_tenant_id:
-            self.api_client.auth_manager.tenant_id = current_tenant_id
-            if not self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request):
-                print("❌ Не удалось обновить токен для тенанта")
-                return False
-        
         print("✅ Токен успешно обновлен")
         return True
     
@@ -0,0 +1,177 @@
+# import_journal.py
+import os
+import json
+import datetime
+
+from rule_bundle import is_bundle_path
+
+JOURNAL_FILENAME = "import_journal.jsonl"
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+EVENT_START = "start"
+EVENT_BEGIN = "begin"
+EVENT_COMMIT = "commit"
+EVENT_FAIL = "fail"
+
+
+def journal_path_for(source_path):
+    """Путь к журналу импорта: рядом с пакетом или внутри директории с правилами"""
+    if is_bundle_path(source_path):
+        return os.path.abspath(source_path) + JOURNAL_SUFFIX
+    return os.path.join(os.path.abspath(source_path), JOURNAL_FILENAME)
+
+
+class ImportJournal:
+    """Журнал упреждающей записи (write-ahead) для возобновляемого импорта правил
+
+    Каждое событие - отдельная строка JSON, дописывается и сбрасывается на диск
+    (fsync) до перехода к следующему файлу. begin пишется до запроса к API,
+    commit/fail - после ответа. Файл с begin без commit/fail считается
+    "в сомнении" и сверяется с сервером при возобновлении. Журнал импорта,
+    завершившегося без ошибок, удаляется (finish).
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.committed = {}
+        self.failed = {}
+        self.in_doubt = {}
+        # Параметры первого запуска (источник, тенант)
+        self.metadata = {}
+        self._pending = set()
+        self._file = None
+
+    @classmethod
+    def exists_for(cls, source_path):
+        """Проверяет, есть ли журнал прерванного импорта для источника"""
+        path = journal_path_for(source_path)
+        return os.path.isfile(path) and os.path.getsize(path) > 0
+
+    def open(self, resume=False, metadata=None):
+        """Открывает журнал: продолжает существующий или начинает новый
+
+        Журнал, начатый в другом тенанте, не продолжается: возвращается None.
+        """
+        if resume and os.path.isfile(self.journal_path):
+            self._load()
+            tenant_id = (metadata or {}).get('tenant_id')
+            if self.metadata.get('tenant_id') not in (None, tenant_id):
+                return None
+            mode = 'a'
+        else:
+            mode = 'w'
+        self._file = open(self.journal_path, mode, encoding='utf-8')
+        self._append(EVENT_START, resume=bool(resume), **(metadata or {}))
+        return self
+
+    def _load(self):
+        """Восстанавливает состояние по событиям журнала"""
+        pending = {}
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка после аварийного завершения
+                    continue
+
+                event = record.get('event')
+                file_key = record.get('file')
+                if event == EVENT_START and not self.metadata:
+                    self.metadata = {key: value for key, value in record.items()
+                                     if key not in ('event', 'time', 'resume')}
+                elif event == EVENT_BEGIN:
+                    pending[file_key] = record
+                elif event == EVENT_COMMIT:
+                    pending.pop(file_key, None)
+                    self.failed.pop(file_key, None)
+                    self.committed[file_key] = record.get('rule_id')
+                elif event == EVENT_FAIL:
+                    pending.pop(file_key, None)
+                    self.failed[file_key] = record.get('error')
+
+        self.in_doubt = {file_key: record.get('rule') for file_key, record in pending.items()
+                         if file_key not in self.committed}
+
+    def _append(self, event, **fields):
+        """Дописывает событие и сбрасывает его на диск"""
+        record = {"event": event, "time": datetime.datetime.now().isoformat()}
+        record.update(fields)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def begin(self, file_key, rule_name=None):
+        """Отмечает начало импорта файла"""
+        self._append(EVENT_BEGIN, file=file_key, rule=rule_name)
+        self._pending.add(file_key)
+
+    def commit(self, file_key, rule_name=None, rule_id=None):
+        """Отмечает успешный импорт файла и ID правила на сервере"""
+        self._append(EVENT_COMMIT, file=file_key, rule=rule_name, rule_id=rule_id)
+        self.committed[file_key] = rule_id
+        self.failed.pop(file_key, None)
+        self.in_doubt.pop(file_key, None)
+        self._pending.discard(file_key)
+
+    def fail(self, file_key, rule_name=None, error=None):
+        """Отмечает неудачный импорт файла"""
+        self._append(EVENT_FAIL, file=file_key, rule=rule_name, error=error)
+        self.failed[file_key] = error
+        self.in_doubt.pop(file_key, None)
+        self._pending.discard(file_key)
+
+    def is_committed(self, file_key):
+        """Проверяет, импортирован ли файл ранее"""
+        return file_key in self.committed
+
+    def reconcile(self, existing_rules_dict, resolve_name=None, matches=None):
+        """Сверяет записи "в сомнении" со списком правил на сервере
+
+        existing_rules_dict - {имя правила: id}, resolve_name - функция,
+        возвращающая имя правила по файлу, если его нет в журнале, matches -
+        функция (файл, id правила), проверяющая, что правило на сервере уже
+        совпадает с файлом (при обновлении правило существовало и до импорта).
+        Подтвержденные правила фиксируются как импортированные, остальные
+        будут импортированы заново. Возвращает количество подтвержденных записей.
+        """
+        confirmed = 0
+        for file_key, rule_name in list(self.in_doubt.items()):
+            if not rule_name and resolve_name:
+                rule_name = resolve_name(file_key)
+            if rule_name and rule_name in existing_rules_dict and \
+                    (matches is None or matches(file_key, existing_rules_dict[rule_name])):
+                self._append(EVENT_COMMIT, file=file_key, rule=rule_name,
+                             rule_id=existing_rules_dict[rule_name], reconciled=True)
+                self.committed[file_key] = existing_rules_dict[rule_name]
+                confirmed += 1
+            self.in_doubt.pop(file_key, None)
+        return confirmed
+
+    def is_complete(self):
+        """Все начатые файлы завершены и ни один не завершился ошибкой"""
+        return self._file is not None and not self._pending and not self.failed and not self.in_doubt
+
+    def finish(self):
+        """Закрывает журнал и удаляет его, если импорт завершен полностью (продолжать нечего)"""
+        complete = self.is_complete()
+        self.close()
+        if complete and os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+        return complete
+
+    def close(self):
+        """Закрывает журнал"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
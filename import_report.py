@@ -0,0 +1,117 @@
+# import_report.py
+import os
+import json
+import datetime
+import tempfile
+import threading
+
+EVENT_START = "start"
+EVENT_SUCCESS = "success"
+EVENT_FAILURE = "failure"
+EVENT_SKIP = "skip"
+EVENT_RETRY = "retry"
+EVENT_SUMMARY = "summary"
+
+
+class ImportReportWriter:
+    """Потоковый отчет об операции с правилами в формате JSONL
+
+    Каждый результат записывается отдельной строкой сразу, как только он
+    получен, поэтому внешние инструменты могут следить за файлом во время
+    работы. В памяти хранятся только счетчики и последняя ошибка. Без пути
+    отчет пишется во временный файл, который удаляется при закрытии.
+    """
+
+    def __init__(self, report_path=None, operation="import", metadata=None):
+        self.report_path = report_path
+        self.operation = operation
+        self.success_count = 0
+        self.failure_count = 0
+        self.skip_count = 0
+        self.retry_count = 0
+        self.last_failure = None
+        # Запись возможна из потоков повторного импорта
+        self._lock = threading.RLock()
+
+        if report_path:
+            directory = os.path.dirname(os.path.abspath(report_path))
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(report_path, 'w+', encoding='utf-8')
+        else:
+            self._file = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self._write(EVENT_START, operation=operation, **(metadata or {}))
+
+    def _write(self, event, **fields):
+        """Записывает событие и сразу сбрасывает его в файл"""
+        if self._file is None:
+            return
+        record = {"event": event, "time": datetime.datetime.now().isoformat()}
+        record.update(fields)
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def record_success(self, file_path, rule_name=None, rule_id=None):
+        """Фиксирует успешную обработку файла"""
+        with self._lock:
+            self.success_count += 1
+            self._write(EVENT_SUCCESS, file=file_path, rule=rule_name, rule_id=rule_id)
+
+    def record_failure(self, file_path, rule_name, error, code=None, response=None):
+        """Фиксирует ошибку обработки файла"""
+        failure = {
+            'file': file_path,
+            'rule': rule_name,
+            'error': error,
+            'code': code,
+            'response': response
+        }
+        with self._lock:
+            self.failure_count += 1
+            self.last_failure = failure
+            self._write(EVENT_FAILURE, **failure)
+
+    def record_retry(self, file_path, rule_name, error, code=None):
+        """Фиксирует временную ошибку, после которой файл поставлен в очередь на повтор"""
+        with self._lock:
+            self.retry_count += 1
+            self._write(EVENT_RETRY, file=file_path, rule=rule_name, error=error, code=code)
+
+    def record_skip(self, file_path, reason):
+        """Фиксирует пропущенный файл"""
+        with self._lock:
+            self.skip_count += 1
+            self._write(EVENT_SKIP, file=file_path, reason=reason)
+
+    def iter_events(self, event=None):
+        """Перечитывает отчет с начала и отдает события (по одному, без загрузки в память)"""
+        if self._file is None:
+            return
+        self._file.flush()
+        position = self._file.tell()
+        self._file.seek(0)
+        try:
+            for line in self._file:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if event is None or record.get('event') == event:
+                    yield record
+        finally:
+            self._file.seek(position)
+
+    def iter_failures(self):
+        """Отдает записи об ошибках"""
+        return self.iter_events(EVENT_FAILURE)
+
+    def finish(self, **summary):
+        """Записывает итоговую сводку (отчет остается доступным для чтения)"""
+        self._write(EVENT_SUMMARY, success=self.success_count, failed=self.failure_count,
+                    skipped=self.skip_count, retried=self.retry_count, **summary)
+
+    def close(self):
+        """Закрывает отчет"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
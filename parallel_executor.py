@@ -0,0 +1,100 @@
+# parallel_executor.py
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 3
+
+# Коды ответа, при которых запрос имеет смысл повторить
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """Общий для всех потоков ограничитель частоты запросов (запросов в секунду)"""
+
+    def __init__(self, rate_limit=None):
+        self.interval = 1.0 / rate_limit if rate_limit else 0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        """Ожидает, пока можно будет выполнить следующий запрос"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ParallelExecutor:
+    """Параллельное выполнение API запросов с ограничением частоты и повторами
+
+    Функция задачи получает элемент и возвращает "сырой" ответ requests.
+    Пустой ответ (ошибка соединения) и коды из TRANSIENT_STATUS_CODES
+    повторяются с экспоненциальной задержкой, Retry-After учитывается.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=1.0):
+        self.max_workers = max(1, max_workers or DEFAULT_MAX_WORKERS)
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def _retry_delay(self, response, attempt):
+        """Вычисляет паузу перед повтором"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    def call_with_retry(self, func, item, max_retries=None):
+        """Выполняет одну задачу с повторами при временных ошибках"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        response = None
+        for attempt in range(max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = func(item)
+            except Exception as e:
+                print(f"Исключение при выполнении запроса: {e}")
+                response = None
+
+            if response is not None and response.status_code not in TRANSIENT_STATUS_CODES:
+                return response
+
+            if attempt < max_retries:
+                time.sleep(self._retry_delay(response, attempt))
+        return response
+
+    def map(self, func, items, on_result=None, max_retries=None):
+        """Выполняет func для всех элементов, возвращает [(элемент, ответ)] в исходном порядке
+
+        on_result(элемент, ответ) вызывается в текущем потоке по мере готовности,
+        поэтому в нем можно безопасно печатать прогресс и писать в файлы.
+        max_retries=0 - без повторов (для неидемпотентных запросов, например POST).
+        """
+        items = list(items)
+        results = [None] * len(items)
+        if not items:
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.call_with_retry, func, item, max_retries): index
+                       for index, item in enumerate(items)}
+            for future in as_completed(futures):
+                index = futures[future]
+                response = future.result()
+                results[index] = (items[index], response)
+                if on_result:
+                    on_result(items[index], response)
+        return results
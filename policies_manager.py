@@ -1,6 +1,8 @@
 # policies_manager.py
 import json
 from urllib.parse import urljoin
+from action_mutation import (KIND_POLICY, SCOPE_SYSTEM, SCOPE_USER, ActionMutationEngine, add_action_transform,
+                             replace_action_transform)
 
 class PoliciesManager:
     def __init__(self, api_client):
@@ -81,105 +83,40 @@ class PoliciesManager:
         update_data = {"actions": new_actions}
         return self.api_client.update_policy_user_rule(policy_id, rule_id, update_data)
     
-    def add_syslog_action_to_policy(self, policy_id, syslog_action_id):
-        """Добавляет действие send_to_syslog в правила политики"""
+    def _mutate_policy_actions(self, policy_id, transform, done_message):
+        """Изменяет действия во всех правилах политики, возвращает (изменено, всего правил)"""
         all_rules = self.get_all_policy_rules(policy_id)
         
         if not all_rules:
             print("Не найдено правил в указанной политике")
             return 0, 0
         
-        total_updated = 0
-        total_rules = len(all_rules)
-        
-        for rule in all_rules:
-            rule_id = rule.get('id')
-            rule_name = rule.get('name', 'Без названия')
-            is_user_rule = rule.get('is_user_rule', False)
-            
-            # Получаем детали правила
-            if is_user_rule:
-                rule_details = self.get_policy_user_rule_details(policy_id, rule_id)
-            else:
-                rule_details = self.get_policy_system_rule_details(policy_id, rule_id)
-                
-            if not rule_details:
-                print(f"Не удалось получить детали правила '{rule_name}'")
-                continue
-            
-            current_actions = rule_details.get('actions', [])
-            
-            # Проверяем, есть ли уже это действие в правиле
-            if syslog_action_id in current_actions:
-                continue
-            
-            # Добавляем действие
-            new_actions = current_actions + [syslog_action_id]
-            
-            # Обновляем только действия
-            if is_user_rule:
-                response = self.update_policy_user_rule_actions_only(policy_id, rule_id, new_actions)
-            else:
-                response = self.update_policy_system_rule_actions_only(policy_id, rule_id, new_actions)
-                
-            if response and response.status_code == 200:
-                print(f"Успешно добавлено действие в правило '{rule_name}' ({'пользовательское' if is_user_rule else 'системное'})")
-                total_updated += 1
-            else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"Ошибка при обновлении правила '{rule_name}': {error_msg}")
+        rules = [{
+            'kind': KIND_POLICY,
+            'container_id': policy_id,
+            'scope': SCOPE_USER if rule.get('is_user_rule', False) else SCOPE_SYSTEM,
+            'rule_id': rule.get('id'),
+            'name': rule.get('name', 'Без названия')
+        } for rule in all_rules]
         
-        return total_updated, total_rules
+        summary = ActionMutationEngine(self.api_client).run(rules, transform, done_message)
+        return summary['updated'], len(all_rules)
+    
+    def add_syslog_action_to_policy(self, policy_id, syslog_action_id):
+        """Добавляет действие send_to_syslog в правила политики"""
+        return self._mutate_policy_actions(
+            policy_id,
+            add_action_transform(syslog_action_id),
+            "Успешно добавлено действие"
+        )
     
     def replace_actions_in_policy(self, policy_id, old_action_id, new_action_id):
         """Заменяет действие в указанной политике веб приложения"""
-        all_rules = self.get_all_policy_rules(policy_id)
-        
-        if not all_rules:
-            print("Не найдено правил в указанной политике")
-            return 0, 0
-        
-        total_replaced = 0
-        total_rules = len(all_rules)
-        
-        for rule in all_rules:
-            rule_id = rule.get('id')
-            rule_name = rule.get('name', 'Без названия')
-            is_user_rule = rule.get('is_user_rule', False)
-            
-            # Получаем детали правила
-            if is_user_rule:
-                rule_details = self.get_policy_user_rule_details(policy_id, rule_id)
-            else:
-                rule_details = self.get_policy_system_rule_details(policy_id, rule_id)
-                
-            if not rule_details:
-                print(f"Не удалось получить детали правила '{rule_name}'")
-                continue
-            
-            current_actions = rule_details.get('actions', [])
-            
-            # Проверяем, есть ли старое действие в правиле
-            if old_action_id not in current_actions:
-                continue
-            
-            # Заменяем действие
-            new_actions = [new_action_id if action_id == old_action_id else action_id for action_id in current_actions]
-            
-            # Обновляем только действия
-            if is_user_rule:
-                response = self.update_policy_user_rule_actions_only(policy_id, rule_id, new_actions)
-            else:
-                response = self.update_policy_system_rule_actions_only(policy_id, rule_id, new_actions)
-                
-            if response and response.status_code == 200:
-                print(f"Успешно заменено действие в правиле '{rule_name}' ({'пользовательское' if is_user_rule else 'системное'})")
-                total_replaced += 1
-            else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"Ошибка при обновлении правила '{rule_name}': {error_msg}")
-        
-        return total_replaced, total_rules
+        return self._mutate_policy_actions(
+            policy_id,
+            replace_action_transform(old_action_id, new_action_id),
+            "Успешно заменено действие"
+        )
     
     def _select_policy_interactive(self):
         """Интерактивный выбор политики"""
@@ -5,6 +5,8 @@ import datetime
 import tempfile
 import shutil
 from base_manager import BaseManager
+from unit_of_work import PatchUnitOfWork
+from catalogue_cache import get_catalogue_cache
 
 class PolicyTemplateManager(BaseManager):
     def __init__(self, api_client):
@@ -13,9 +15,8 @@ class PolicyTemplateManager(BaseManager):
     # ==================== ПОЛУЧЕНИЕ ДАННЫХ ====================
     
     def get_vendor_templates(self):
-        """Получает список системных шаблонов"""
-        response = self.api_client.get_vendor_templates()
-        return self._parse_response_items(response)
+        """Получает список системных шаблонов (из кэша справочников)"""
+        return get_catalogue_cache(self.api_client).get_vendor_templates(self.api_client)
     
     def get_user_templates(self):
         """Получает список пользовательских шаблонов"""
@@ -350,6 +351,7 @@ class PolicyTemplateManager(BaseManager):
             action_mapping = {}
             created_count = 0
             found_count = 0
+            action_index = actions_manager.build_action_index()
             
             print(f"  Создание маппинга для {len(source_actions)} действий...")
             
@@ -366,7 +368,7 @@ class PolicyTemplateManager(BaseManager):
                 print(f"    [{i}] Обработка действия: {action_name}")
                 
                 # Ищем или создаем действие в целевом тенанте
-                target_action = actions_manager.find_or_create_action(action)
+                target_action = action_index.find_or_create(action)
                 
                 if target_action:
                     new_action_id = target_action.get('id')
@@ -427,14 +429,45 @@ class PolicyTemplateManager(BaseManager):
         
         return None
 
+    def _commit_rule_changes(self, work, rule_keys):
+        """Отправляет накопленные изменения правил одним пакетом, возвращает (успешно, ошибок)"""
+        def on_result(patch):
+            if patch.skipped:
+                print(f"      = {patch.label}: изменений нет")
+            elif patch.ok:
+                print(f"      ✅ {patch.label}: изменения применены")
+            else:
+                error_msg = patch.response.text if patch.response is not None else "Неизвестная ошибка"
+                print(f"      ✗ {patch.label}: {error_msg}")
+        
+        if len(work):
+            print(f"\n    Отправка изменений ({len(work)} запросов)...")
+        
+        imported_count = 0
+        failed_count = 0
+        for patch in work.commit(on_result):
+            rule_names = rule_keys.get(patch.key)
+            if rule_names is None:
+                # Агрегация не влияет на итог по правилу
+                continue
+            if patch.ok:
+                imported_count += len(rule_names)
+            else:
+                failed_count += len(rule_names)
+        return imported_count, failed_count
+
     def _import_system_rules_with_overrides(self, template_id, system_rules_data, action_mapping, 
-                                            global_list_mapping=None, preserve_state=True):
+                                            global_list_mapping=None, preserve_state=True, work=None):
         """Импортирует изменения в системные правила (has_overrides: true)"""
         if not system_rules_data:
             return 0, 0
         
         imported_count = 0
         failed_count = 0
+        # Изменения правил и их агрегации отправляются вместе после подготовки всех правил
+        if work is None:
+            work = PatchUnitOfWork()
+        rule_keys = {}
         
         print(f"\n  Импорт изменений в {len(system_rules_data)} системных правил:")
         
@@ -539,41 +572,33 @@ class PolicyTemplateManager(BaseManager):
                 failed_count += 1
                 continue
             
-            # Обновляем правило
-            response = self.update_rule(template_id, target_rule_id, update_data)
+            # Откладываем обновление правила, поля без изменений будут отброшены
+            key = ('template_rule', template_id, target_rule_id)
+            work.observe(key, target_rule)
+            work.update(key, lambda data, rule_id=target_rule_id: self.update_rule(template_id, rule_id, data),
+                        update_data, f"Правило '{rule_name}'")
+            rule_keys.setdefault(key, []).append(rule_name)
             
-            if response and response.status_code == 200:
-                print(f"      ✅ Изменения успешно применены")
+            # 5. Обновляем настройки агрегации если есть
+            if 'aggregation' in rule_data and rule_data['aggregation']:
+                aggregation_data = rule_data['aggregation'].copy()
                 
-                # 5. Обновляем настройки агрегации если есть
-                if 'aggregation' in rule_data and rule_data['aggregation']:
-                    aggregation_data = rule_data['aggregation'].copy()
-                    
-                    # Применяем маппинг глобальных списков в агрегации
-                    if global_list_mapping and 'global_list_id' in aggregation_data:
-                        gl_id = aggregation_data['global_list_id']
-                        if str(gl_id) in global_list_mapping:
-                            aggregation_data['global_list_id'] = global_list_mapping[str(gl_id)]
-                            print(f"      Обновлен глобальный список в агрегации")
-                    
-                    agg_response = self.update_rule_aggregation(template_id, target_rule_id, aggregation_data)
-                    
-                    if agg_response and agg_response.status_code == 200:
-                        print(f"      ✅ Настройки агрегации обновлены")
-                    else:
-                        error_msg = agg_response.text if agg_response else "Неизвестная ошибка"
-                        print(f"      ⚠️ Ошибка при обновлении агрегации: {error_msg}")
+                # Применяем маппинг глобальных списков в агрегации
+                if global_list_mapping and 'global_list_id' in aggregation_data:
+                    gl_id = aggregation_data['global_list_id']
+                    if str(gl_id) in global_list_mapping:
+                        aggregation_data['global_list_id'] = global_list_mapping[str(gl_id)]
+                        print(f"      Обновлен глобальный список в агрегации")
                 
-                imported_count += 1
-            else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"      ✗ Ошибка при обновлении правила: {error_msg}")
-                failed_count += 1
+                work.update(('template_rule_aggregation', template_id, target_rule_id),
+                            lambda data, rule_id=target_rule_id: self.update_rule_aggregation(template_id, rule_id, data),
+                            aggregation_data, f"Агрегация правила '{rule_name}'")
         
-        return imported_count, failed_count
+        committed, commit_failed = self._commit_rule_changes(work, rule_keys)
+        return imported_count + committed, failed_count + commit_failed
 
     def _import_user_rules_to_template(self, template_id, user_rules_data, action_mapping, preserve_state=True,
-                                      source_tenant_id=None, target_tenant_id=None):
+                                      source_tenant_id=None, target_tenant_id=None, work=None):
         """Импортирует пользовательские правила в шаблон, используя логику 'Копирование правил'"""
         if not user_rules_data:
             return 0, 0
@@ -639,6 +664,11 @@ class PolicyTemplateManager(BaseManager):
                 success_count = 0
                 total_files = 0
                 
+                # Набор правил и список его правил запрашиваются один раз для всех файлов
+                rules_set_id = rules_manager.get_policy_template_id()
+                if rules_set_id:
+                    rules_manager.begin_import_context(rules_set_id)
+                
                 # Получаем список экспортированных файлов
                 for filename in os.listdir(temp_dir):
                     if filename.endswith('.ptafpro'):
@@ -647,14 +677,35 @@ class PolicyTemplateManager(BaseManager):
                         
                         print(f"      Импорт файла {filename} ({total_files})...")
                         
+                        try:
+                            with open(file_path, 'r', encoding='utf-8') as f:
+                                import_data = json.load(f)
+                        except Exception as e:
+                            print(f"      ✗ Ошибка при чтении файла: {e}")
+                            continue
+                        
                         # Используем import_single_rule_with_actions с action_mapping
                         success = rules_manager.import_single_rule_with_actions(
-                            file_path, action_mapping, False, preserve_state, None
+                            file_path, action_mapping, False, preserve_state, None, import_data=import_data
                         )
                         
                         if success:
                             success_count += 1
                             print(f"      ✅ Правило успешно импортировано")
+                            rule_id = rules_manager.last_imported_rule_id
+                            if work is not None and rules_set_id and rule_id:
+                                # Записанное состояние позволит не повторять его на шаге 3, если набор
+                                # пользовательских правил тенанта и есть целевой шаблон (иначе ключи не совпадут)
+                                written_rule = import_data.get('rule_data', import_data)
+                                written_config = written_rule.get('configuration', {})
+                                written_state = {'configuration': {
+                                    'code': written_config.get('code', ''),
+                                    'actions': written_config.get('actions', []),
+                                    'parameters': written_config.get('parameters', [])
+                                }}
+                                if preserve_state and 'enabled' in written_rule:
+                                    written_state['enabled'] = written_rule['enabled']
+                                work.observe(('user_rule', rules_set_id, rule_id), written_state)
                         else:
                             print(f"      ✗ Ошибка при импорте правила")
                 
@@ -664,6 +715,7 @@ class PolicyTemplateManager(BaseManager):
                 print(f"      ✗ Ошибка при копировании правил: {e}")
                 return 0, len(user_rules_data)
             finally:
+                rules_manager.end_import_context()
                 # Очищаем временные файлы
                 try:
                     shutil.rmtree(temp_dir, ignore_errors=True)
@@ -695,13 +747,17 @@ class PolicyTemplateManager(BaseManager):
 
 
     def _import_user_rules_changes(self, target_template_id, user_rules_data, action_mapping, 
-                                global_list_mapping=None, preserve_state=True):
+                                global_list_mapping=None, preserve_state=True, work=None):
         """Применяет изменения к пользовательским правилам в целевом шаблоне"""
         if not user_rules_data:
             return 0, 0  # imported_count, failed_count
         
         imported_count = 0
         failed_count = 0
+        # Обновления существующих правил сливаются по правилу и отправляются вместе в конце
+        if work is None:
+            work = PatchUnitOfWork()
+        rule_keys = {}
         
         print(f"\n  Импорт изменений в {len(user_rules_data)} пользовательских правил:")
         
@@ -908,42 +964,36 @@ class PolicyTemplateManager(BaseManager):
                         aggregation_copy['global_list_id'] = global_list_mapping[str(gl_id)]
                 
                 # Для обновления агрегации нужен отдельный запрос
-                agg_response = self.update_rule_aggregation(
-                    target_template_id, target_rule_id, aggregation_copy
-                )
-                
-                if agg_response and agg_response.status_code == 200:
-                    print(f"      ✅ Настройки агрегации обновлены")
-                else:
-                    error_msg = agg_response.text if agg_response else "Неизвестная ошибка"
-                    print(f"      ⚠️ Ошибка при обновлении агрегации: {error_msg}")
+                work.update(('template_rule_aggregation', target_template_id, target_rule_id),
+                            lambda data, rule_id=target_rule_id: self.update_rule_aggregation(
+                                target_template_id, rule_id, data),
+                            aggregation_copy, f"Агрегация правила '{rule_name}'")
             
             if not update_data:
                 print(f"      ⚠️ Нет данных для обновления, пропускаем")
                 failed_count += 1
                 continue
             
-            # ШАГ 4: Отправляем запрос на обновление
+            # ШАГ 4: Откладываем запрос на обновление
             if template_type == 'with_user_rules':
-                response = self.update_user_rule(target_template_id, target_rule_id, update_data)
+                key = ('user_rule', target_template_id, target_rule_id)
+                send = self.update_user_rule
             else:
                 # Для обычного шаблона
                 if target_rule.get('is_user_rule', False):
-                    response = self.update_policy_user_rule_in_template(
-                        target_template_id, target_rule_id, update_data
-                    )
+                    key = ('policy_user_rule', target_template_id, target_rule_id)
+                    send = self.update_policy_user_rule_in_template
                 else:
-                    response = self.update_rule(target_template_id, target_rule_id, update_data)
+                    key = ('template_rule', target_template_id, target_rule_id)
+                    send = self.update_rule
             
-            if response and response.status_code == 200:
-                print(f"      ✅ Изменения успешно применены")
-                imported_count += 1
-            else:
-                error_msg = response.text if response else "Неизвестная ошибка"
-                print(f"      ✗ Ошибка при обновлении правила: {error_msg}")
-                failed_count += 1
+            work.observe(key, target_rule)
+            work.update(key, lambda data, send=send, rule_id=target_rule_id: send(target_template_id, rule_id, data),
+                        update_data, f"Правило '{rule_name}'")
+            rule_keys.setdefault(key, []).append(rule_name)
         
-        return imported_count, failed_count
+        committed, commit_failed = self._commit_rule_changes(work, rule_keys)
+        return imported_count + committed, failed_count + commit_failed
 
 
     def import_template(self, file_path, target_tenant_id=None, preserve_state=True):
@@ -1038,13 +1088,16 @@ class PolicyTemplateManager(BaseManager):
             
             print(f"\n4. Импортируем правила...")
             
+            # Общая единица работы: шаги 2 и 3 не повторяют то, что уже записано на шаге 1
+            work = PatchUnitOfWork()
+            
             # ШАГ 1: Копирование пользовательских правил через RulesManager
             user_imported_1, user_failed_1 = 0, 0
             if has_user_rules and user_rules_data:
                 print(f"\n  ШАГ 1: Копирование пользовательских правил (через RulesManager)...")
                 user_imported_1, user_failed_1 = self._import_user_rules_to_template(
                     target_template_id, user_rules_data, action_mapping, preserve_state,
-                    source_tenant_id, target_tenant_id
+                    source_tenant_id, target_tenant_id, work
                 )
             
             # ШАГ 2: Применение изменений к системным правилам
@@ -1053,7 +1106,7 @@ class PolicyTemplateManager(BaseManager):
                 print(f"\n  ШАГ 2: Применение изменений к системным правилам...")
                 system_imported, system_failed = self._import_system_rules_with_overrides(
                     target_template_id, system_rules_data, action_mapping, 
-                    global_list_mapping, preserve_state
+                    global_list_mapping, preserve_state, work
                 )
             
             # ШАГ 3: Применение изменений к пользовательским правилам
@@ -1062,7 +1115,7 @@ class PolicyTemplateManager(BaseManager):
                 print(f"\n  ШАГ 3: Применение изменений к пользовательским правилам...")
                 user_imported_2, user_failed_2 = self._import_user_rules_changes(
                     target_template_id, user_rules_data, action_mapping, 
-                    global_list_mapping, preserve_state
+                    global_list_mapping, preserve_state, work
                 )
             
             # Суммируем результаты
@@ -16,9 +16,13 @@ from roles_manager import RolesManager
 from backends_manager import BackendsManager
 from backup_manager import BackupManager
 from global_lists_manager import GlobalListsManager
+from parallel_executor import DEFAULT_MAX_WORKERS
+from catalogue_cache import get_catalogue_cache
+from snapshot_store import STORAGE_FILES
+from snapshot_retention import configure_retention, wait_for_compaction
 
 class PTAFClient:
-    def __init__(self, config_file="ptaf_api_client_config.json", debug=False):
+    def __init__(self, config_file="ptaf_api_client_config.json", debug=False, refresh_catalogue=False):
         self.config = self.load_config(config_file)
         self.debug = debug
         
@@ -34,16 +38,19 @@ class PTAFClient:
         
         self.base_client = BaseAPIClient(self.auth_manager, debug)
         self.api_client = APIClient(self.auth_manager, self.base_client.make_request)
+        self.catalogue_cache = get_catalogue_cache(self.api_client, ttl=self.config.get("catalogue_cache_ttl"),
+                                                   refresh=refresh_catalogue)
+        configure_retention(self.config.get("snapshot_retention"))
         self.traffic_settings_manager = TrafficSettingsManager(self.api_client)
         self.rules_manager = RulesManager(self.api_client)
         self.policy_template_manager = PolicyTemplateManager(self.api_client)
         self.policies_manager = PoliciesManager(self.api_client)
         self.actions_manager = ActionsManager(self.api_client)
         self.global_lists_manager = GlobalListsManager(self.api_client)
-        self.snapshot_manager = SnapshotManager(self.api_client)
+        self.snapshot_manager = SnapshotManager(self.api_client, self.config.get("snapshot_storage", STORAGE_FILES))
         self.roles_manager = RolesManager(self.api_client)
         self.backends_manager = BackendsManager(self.api_client)
-        self.backup_manager = BackupManager(self.api_client)
+        self.backup_manager = BackupManager(self.api_client, self.config.get("snapshot_storage", STORAGE_FILES))
         self.tenant_manager = TenantManager(self.auth_manager, self.base_client.make_request)
 
     def load_config(self, config_file):
@@ -71,13 +78,19 @@ class PTAFClient:
         """Экспортирует правила с сохранением связей с действиями"""
         return self.rules_manager.export_rules_with_actions(export_dir, preserve_state)
 
-    def import_rules(self, directory_path, include_actions=False, preserve_state=False):
+    def import_rules(self, directory_path, include_actions=False, preserve_state=False, resume=None):
         """Импортирует правила из директории"""
-        return self.rules_manager.import_rules(directory_path, include_actions, preserve_state)
+        return self.rules_manager.import_rules(directory_path, include_actions, preserve_state, resume)
 
-    def delete_all_user_rules(self):
+    def watch_rules_directory(self, directory_path, include_actions=False, preserve_state=False,
+                              enable_after_import=False, delete_removed=False, import_existing=False):
+        """Следит за директорией и импортирует измененные правила"""
+        return self.rules_manager.watch_directory(directory_path, include_actions, preserve_state,
+                                                  enable_after_import, delete_removed, import_existing)
+
+    def delete_all_user_rules(self, parallel=None, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None):
         """Удаляет все пользовательские правила"""
-        return self.rules_manager.delete_all_user_rules()
+        return self.rules_manager.delete_all_user_rules(parallel, max_workers, rate_limit)
 
     def manage_policy_templates_extended(self):
         """Расширенное управление шаблонами политик и политиками безопасности"""
@@ -87,6 +100,10 @@ class PTAFClient:
         """Управление операциями с действиями"""
         return self.actions_manager.manage_actions_operations()
 
+    def rollout_actions(self, max_workers=None, rate_limit=None):
+        """Применение операции с действием в нескольких тенантах"""
+        return self.actions_manager.rollout_action_to_tenants(max_workers, rate_limit)
+
     def manage_snapshots(self):
         """Управление получением конфигураций"""
         return self.snapshot_manager.manage_snapshots()
@@ -99,9 +116,44 @@ class PTAFClient:
         """Управление переносом объектов между тенантами"""
         return self.snapshot_manager.manage_tenant_transfer()
 
-    def get_snapshots_from_cli(self):
+    def get_snapshots_from_cli(self, tenant_workers=None):
         """Получает конфигурации со всех тенантов (для CLI)"""
-        return self.snapshot_manager.get_snapshots_from_cli()
+        return self.snapshot_manager.get_snapshots_from_cli(tenant_workers)
+
+    def run_snapshot_daemon(self, tenant_workers=None, interval=None, health_port=None):
+        """Служба периодического получения снапшотов (параметры по умолчанию - из "snapshot_daemon")"""
+        from snapshot_daemon import DEFAULT_INTERVAL, DEFAULT_JITTER, HEALTH_FILE, SnapshotDaemon
+        from snapshot_collector import DEFAULT_TENANT_WORKERS
+        settings = self.config.get("snapshot_daemon", {})
+        daemon = SnapshotDaemon(
+            self.api_client,
+            interval=interval or settings.get("interval", DEFAULT_INTERVAL),
+            jitter=settings.get("jitter", DEFAULT_JITTER),
+            tenant_workers=tenant_workers or settings.get("tenant_workers", DEFAULT_TENANT_WORKERS),
+            storage=self.config.get("snapshot_storage", STORAGE_FILES),
+            health_file=settings.get("health_file", HEALTH_FILE),
+            health_port=health_port or settings.get("health_port")
+        )
+        return daemon.run()
+
+    def compact_snapshots(self):
+        """Очистка старых снапшотов по политике хранения (для CLI, без подтверждения)"""
+        from snapshot_retention import RetentionPolicy, SnapshotCompactor, get_retention_policy
+        compactor = SnapshotCompactor(get_retention_policy() or RetentionPolicy(),
+                                      store=self.snapshot_manager.backup_manager.store)
+        stats = compactor.run()
+        SnapshotCompactor.print_summary(stats)
+        return stats
+
+    def diff_snapshots(self, old_path, new_path):
+        """Сравнение двух снапшотов (для CLI): сводка на экран, полный отчет в JSON"""
+        from snapshot_diff import compare_snapshots, print_report, save_report
+        store = self.snapshot_manager.backup_manager.store
+        report = compare_snapshots(old_path, new_path, store_root=store.root if store else None)
+        print_report(report)
+        if not report['identical']:
+            print(f"📁 Отчет сохранен: {os.path.abspath(save_report(report))}")
+        return report
 
     def print_failed_files(self):
         """Выводит список проблемных файлов"""
@@ -127,7 +179,17 @@ def main():
     parser = argparse.ArgumentParser(description="PTAF PRO API Client")
     parser.add_argument(
         "--source",
-        help="Путь к директории с JSON файлами правил для импорта"
+        help="Путь к директории с JSON файлами правил или к пакету .ptafbundle для импорта"
+    )
+    parser.add_argument(
+        "--watch",
+        metavar="DIR",
+        help="Следить за директорией и автоматически импортировать измененные .ptafpro файлы"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Продолжить прерванный импорт (--source) по журналу импорта"
     )
     parser.add_argument(
         "--export",
@@ -139,6 +201,16 @@ def main():
         action="store_true",
         help="Удалить все пользовательские правила"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help=f"Количество параллельных потоков для массовых операций (по умолчанию {DEFAULT_MAX_WORKERS})"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="Ограничение частоты запросов в массовых операциях (запросов в секунду)"
+    )
     parser.add_argument(
         "--policy-template",
         action="store_true",
@@ -154,11 +226,42 @@ def main():
         action="store_true",
         help="Управление действиями в правилах"
     )
+    parser.add_argument(
+        "--action-rollout",
+        action="store_true",
+        help="Добавить или заменить действие во всех шаблонах и политиках выбранных тенантов"
+    )
     parser.add_argument(
         "--snapshot",
         action="store_true",
         help="Получить конфигурации со всех доступных тенантов"
     )
+    parser.add_argument(
+        "--snapshot-daemon",
+        action="store_true",
+        help="Постоянно работающая служба снапшотов: опрос тенантов по расписанию, сохраняются только изменения"
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        help="Интервал опроса тенантов службой снапшотов в секундах (по умолчанию 3600)"
+    )
+    parser.add_argument(
+        "--health-port",
+        type=int,
+        help="Порт HTTP для проверки состояния службы снапшотов (GET /health)"
+    )
+    parser.add_argument(
+        "--compact-snapshots",
+        action="store_true",
+        help="Удалить снапшоты и бекапы настроек трафика, не попавшие в ротацию, и архивировать старые файлы"
+    )
+    parser.add_argument(
+        "--snapshot-diff",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Сравнить два снапшота (файлы, файлы в архивах или манифесты хранилища)"
+    )
     parser.add_argument(
         "--restore",
         action="store_true",
@@ -189,6 +292,11 @@ def main():
         action="store_true",
         help="Работа с правилами"
     )
+    parser.add_argument(
+        "--refresh-catalogue",
+        action="store_true",
+        help="Сбросить кэш справочников (типы действий, системные шаблоны) и загрузить их заново"
+    )
     parser.add_argument(
         "--config",
         default="ptaf_api_client_config.json",
@@ -202,7 +310,7 @@ def main():
     args = parser.parse_args()
 
     try:
-        client = PTAFClient(config_file=args.config, debug=args.debug)
+        client = PTAFClient(config_file=args.config, debug=args.debug, refresh_catalogue=args.refresh_catalogue)
         
         # Сначала получаем токены
         if not client.auth_manager.get_jwt_tokens(client.base_client.make_request):
@@ -210,9 +318,9 @@ def main():
             return
 
         # Если нет аргументов - запускаем интерактивный режим
-        if not any([args.source, args.export, args.delete_all, args.policy_template,
-                    args.traffic_settings, args.actions, args.snapshot, args.restore, 
-                    args.transfer, args.dangerous, args.tenants, args.global_lists, args.rules]):
+        if not any([args.source, args.watch, args.export, args.delete_all, args.policy_template,
+                    args.traffic_settings, args.actions, args.action_rollout, args.snapshot, args.snapshot_daemon,
+                    args.compact_snapshots, args.snapshot_diff, args.restore, args.transfer, args.dangerous, args.tenants, args.global_lists, args.rules]):
             while True:
                 print("\nГлавное меню:")
                 print("1. Работа с правилами")
@@ -302,7 +410,7 @@ def main():
                         client.export_rules_with_actions(preserve_state=False)
                 else:
                     # Для экспорта без действий не спрашиваем о состоянии
-                    export_dir = input("Введите путь для экспорта [exported_rules]: ").strip()
+                    export_dir = input("Введите путь для экспорта (директория или файл .ptafbundle) [exported_rules]: ").strip()
                     if not export_dir:
                         export_dir = "exported_rules"
                     client.export_rules(export_dir=export_dir, preserve_state=False)
@@ -323,17 +431,37 @@ def main():
                     choice = input("\nПеренести правила в исходном состоянии (включено/выключено)? (y/n): ").lower()
                     if choice == 'y':
                         preserve_state = True
-                        client.import_rules(directory_path=args.source, include_actions=True, preserve_state=True)
+                        client.import_rules(directory_path=args.source, include_actions=True, preserve_state=True,
+                                            resume=args.resume or None)
                     else:
-                        client.import_rules(directory_path=args.source, include_actions=True, preserve_state=False)
+                        client.import_rules(directory_path=args.source, include_actions=True, preserve_state=False,
+                                            resume=args.resume or None)
                 else:
-                    client.import_rules(directory_path=args.source, include_actions=False, preserve_state=False)
+                    client.import_rules(directory_path=args.source, include_actions=False, preserve_state=False,
+                                        resume=args.resume or None)
+            
+            elif args.watch:
+                if not client.select_tenant():
+                    print("Не удалось выбрать тенант")
+                    return
+                
+                include_actions = input("\nВосстанавливать связи с действиями? (y/n): ").lower() == 'y'
+                preserve_state = input("Сохранять состояние правил из файлов (включено/выключено)? (y/n): ").lower() == 'y'
+                enable_after_import = False
+                if not preserve_state:
+                    enable_after_import = input("Включать импортированные правила? (y/n): ").lower() == 'y'
+                delete_removed = input("Удалять правила, файлы которых удалены из директории? (y/n): ").lower() == 'y'
+                import_existing = input("Импортировать все текущие файлы при запуске? (y/n): ").lower() == 'y'
+                client.watch_rules_directory(args.watch, include_actions, preserve_state, enable_after_import,
+                                             delete_removed, import_existing)
             
             elif args.delete_all:
                 if not client.select_tenant():
                     print("Не удалось выбрать тенант")
                     return
-                client.delete_all_user_rules()
+                client.delete_all_user_rules(parallel=True if args.workers else None,
+                                             max_workers=args.workers or DEFAULT_MAX_WORKERS,
+                                             rate_limit=args.rate_limit)
             
             elif args.traffic_settings:
                 if not client.select_tenant():
@@ -347,8 +475,26 @@ def main():
                     return
                 client.manage_actions_operations()
             
+            elif args.action_rollout:
+                if not client.select_tenant():
+                    print("Не удалось выбрать тенант")
+                    return
+                client.rollout_actions(max_workers=args.workers, rate_limit=args.rate_limit)
+            
             elif args.snapshot:
-                client.get_snapshots_from_cli()
+                client.get_snapshots_from_cli(tenant_workers=args.workers)
+                # Фоновая очистка после сбора должна завершиться до выхода
+                wait_for_compaction()
+            
+            elif args.snapshot_daemon:
+                client.run_snapshot_daemon(tenant_workers=args.workers, interval=args.interval,
+                                           health_port=args.health_port)
+            
+            elif args.compact_snapshots:
+                client.compact_snapshots()
+            
+            elif args.snapshot_diff:
+                client.diff_snapshots(*args.snapshot_diff)
             
             elif args.restore:
                 if not client.select_tenant():
@@ -0,0 +1,63 @@
+# retry_queue.py
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from parallel_executor import TRANSIENT_STATUS_CODES
+
+DEFAULT_RETRY_ROUNDS = 3
+DEFAULT_RETRY_BACKOFF = 2.0
+DEFAULT_RETRY_WORKERS = 4
+
+
+def is_transient_failure(code):
+    """Определяет, имеет ли смысл повторить запрос с таким кодом ответа
+
+    Повторяются только 429 и ошибки сервера; 401 до этого места не доходит,
+    если токен удалось обновить (make_request повторяет запрос сам), поэтому
+    4xx - окончательная ошибка.
+    """
+    return code in TRANSIENT_STATUS_CODES
+
+
+class RetryQueue:
+    """Очередь файлов, импорт которых не удался из-за временной ошибки
+
+    Файлы обрабатываются в конце импорта несколькими раундами с
+    экспоненциальной паузой между ними, внутри раунда - параллельно.
+    """
+
+    def __init__(self, max_rounds=DEFAULT_RETRY_ROUNDS, backoff=DEFAULT_RETRY_BACKOFF,
+                 max_workers=DEFAULT_RETRY_WORKERS):
+        self.max_rounds = max_rounds
+        self.backoff = backoff
+        self.max_workers = max(1, max_workers)
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        """Ставит элемент в очередь на повтор"""
+        if item not in self.items:
+            self.items.append(item)
+
+    def rounds(self):
+        """Отдает (номер раунда, последний ли он, элементы), выдерживая паузу перед каждым раундом"""
+        for round_number in range(1, self.max_rounds + 1):
+            if not self.items:
+                return
+            delay = self.backoff * (2 ** (round_number - 1))
+            print(f"\nПовтор {len(self.items)} файлов через {delay:.0f} с "
+                  f"(попытка {round_number}/{self.max_rounds})...")
+            time.sleep(delay)
+            items, self.items = self.items, []
+            yield round_number, round_number == self.max_rounds, items
+
+    def run(self, func, items):
+        """Выполняет func для элементов параллельно, возвращает [(элемент, результат)] по мере готовности"""
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(func, item): item for item in items}
+            for future in as_completed(futures):
+                results.append((futures[future], future.result()))
+        return results
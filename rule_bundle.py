@@ -0,0 +1,245 @@
+# rule_bundle.py
+import os
+import json
+import zipfile
+import datetime
+
+BUNDLE_EXTENSION = ".ptafbundle"
+BUNDLE_INDEX_NAME = "index.json"
+BUNDLE_FORMAT = "ptafbundle"
+BUNDLE_VERSION = 1
+
+
+def is_bundle_path(path):
+    """Проверяет, указывает ли путь на файл пакета правил"""
+    return bool(path) and path.lower().endswith(BUNDLE_EXTENSION)
+
+
+def rule_name_from_data(data, filename):
+    """Извлекает имя правила из данных файла (обычный формат или with_actions)"""
+    if isinstance(data, dict):
+        if isinstance(data.get('rule_data'), dict) and data['rule_data'].get('name'):
+            return data['rule_data']['name']
+        if data.get('name'):
+            return data['name']
+    return filename
+
+
+def rule_id_from_data(data):
+    """Извлекает ID правила из данных файла (None, если его нет)"""
+    if isinstance(data, dict):
+        metadata = data.get('export_metadata')
+        if isinstance(metadata, dict) and metadata.get('rule_id') is not None:
+            return metadata['rule_id']
+        if data.get('id') is not None:
+            return data['id']
+    return None
+
+
+def add_index_entry(index, rule_name, data, filename):
+    """Добавляет правило в индекс {имя: запись}, не затирая правило с тем же именем
+
+    Повторное имя дополняется ID правила (или именем записи), первое правило
+    с этим именем остается доступным по исходному имени.
+    """
+    key = rule_name
+    if key in index:
+        rule_id = rule_id_from_data(data)
+        key = f"{rule_name} (ID: {rule_id})" if rule_id is not None else f"{rule_name} ({filename})"
+        if key in index:
+            key = f"{rule_name} ({filename})"
+        print(f"⚠️ Повторное имя правила '{rule_name}', в индексе сохранено как '{key}'")
+    index[key] = filename
+    return key
+
+
+class RuleBundleWriter:
+    """Потоковая запись правил в один файл пакета (.ptafbundle)
+
+    Пакет - это zip-архив, в котором каждое правило хранится отдельной записью
+    в том же виде, что и файл .ptafpro, а index.json содержит соответствие
+    имени правила и записи архива (повторные имена дополняются ID правила).
+    Индекс дописывается при закрытии пакета.
+    """
+
+    def __init__(self, bundle_path, metadata=None):
+        self.bundle_path = bundle_path
+        self.metadata = metadata or {}
+        self.index = {}
+        directory = os.path.dirname(os.path.abspath(bundle_path))
+        os.makedirs(directory, exist_ok=True)
+        self._zip = zipfile.ZipFile(bundle_path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def add_rule(self, filename, rule_data, rule_name=None):
+        """Добавляет правило в пакет и возвращает имя записи"""
+        member = filename
+        counter = 1
+        base_name, ext = os.path.splitext(filename)
+        while member in self._zip.NameToInfo:
+            member = f"{base_name}_{counter}{ext}"
+            counter += 1
+
+        payload = json.dumps(rule_data, ensure_ascii=False, separators=(',', ':'))
+        self._zip.writestr(member, payload.encode('utf-8'))
+
+        if rule_name is None:
+            rule_name = rule_name_from_data(rule_data, member)
+        add_index_entry(self.index, rule_name, rule_data, member)
+        return member
+
+    def close(self):
+        """Записывает индекс и закрывает пакет"""
+        if self._zip is None:
+            return
+        index_data = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "created": datetime.datetime.now().isoformat(),
+            "metadata": self.metadata,
+            "rules": self.index
+        }
+        self._zip.writestr(BUNDLE_INDEX_NAME, json.dumps(index_data, ensure_ascii=False, indent=2))
+        self._zip.close()
+        self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class RuleBundleReader:
+    """Чтение правил из пакета без распаковки на диск"""
+
+    def __init__(self, bundle_path):
+        self.bundle_path = bundle_path
+        self._zip = zipfile.ZipFile(bundle_path, 'r')
+        self.metadata = {}
+        self._index = None
+
+    def list_files(self):
+        """Возвращает список записей с правилами"""
+        return [name for name in self._zip.namelist()
+                if name.endswith('.ptafpro') and not name.endswith('/')]
+
+    def read_file(self, filename):
+        """Читает одну запись пакета"""
+        with self._zip.open(filename) as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def iter_rules(self):
+        """Последовательно отдает (имя записи, данные правила)"""
+        for filename in self.list_files():
+            yield filename, self.read_file(filename)
+
+    def _load_index(self):
+        """Загружает индекс пакета, либо строит его по содержимому архива"""
+        if self._index is not None:
+            return self._index
+
+        if BUNDLE_INDEX_NAME in self._zip.NameToInfo:
+            with self._zip.open(BUNDLE_INDEX_NAME) as f:
+                index_data = json.loads(f.read().decode('utf-8'))
+            self.metadata = index_data.get('metadata', {})
+            self._index = index_data.get('rules', {})
+        else:
+            # Обычный zip с файлами .ptafpro - индекс строим один раз
+            self._index = {}
+            for filename, data in self.iter_rules():
+                add_index_entry(self._index, rule_name_from_data(data, filename), data, filename)
+        return self._index
+
+    def get_rule(self, rule_name):
+        """Возвращает данные правила по имени через индекс"""
+        filename = self._load_index().get(rule_name)
+        if not filename:
+            return None
+        return self.read_file(filename)
+
+    def rule_names(self):
+        """Возвращает имена правил из индекса"""
+        return list(self._load_index().keys())
+
+    def extract_file(self, filename, target_dir):
+        """Сохраняет одну запись пакета как обычный файл .ptafpro (байты без изменений)"""
+        os.makedirs(target_dir, exist_ok=True)
+        target_path = os.path.join(target_dir, os.path.basename(filename))
+        with self._zip.open(filename) as src, open(target_path, 'wb') as dst:
+            dst.write(src.read())
+        return target_path
+
+    def close(self):
+        """Закрывает пакет"""
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class RuleDirectoryReader:
+    """Чтение правил из директории с файлами .ptafpro (прежний формат)"""
+
+    def __init__(self, directory_path):
+        self.directory_path = directory_path
+        self._index = None
+
+    def list_files(self):
+        """Возвращает список файлов с правилами"""
+        return sorted(f for f in os.listdir(self.directory_path) if f.endswith('.ptafpro'))
+
+    def read_file(self, filename):
+        """Читает один файл правила"""
+        with open(os.path.join(self.directory_path, filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def iter_rules(self):
+        """Последовательно отдает (имя файла, данные правила)"""
+        for filename in self.list_files():
+            yield filename, self.read_file(filename)
+
+    def get_rule(self, rule_name):
+        """Возвращает данные правила по имени"""
+        if self._index is None:
+            self._index = {}
+            for filename, data in self.iter_rules():
+                add_index_entry(self._index, rule_name_from_data(data, filename), data, filename)
+        filename = self._index.get(rule_name)
+        if not filename:
+            return None
+        return self.read_file(filename)
+
+    def close(self):
+        """Совместимость с RuleBundleReader"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def open_rule_source(path):
+    """Открывает источник правил: пакет .ptafbundle или директорию с .ptafpro"""
+    if is_bundle_path(path) and os.path.isfile(path):
+        return RuleBundleReader(path)
+    return RuleDirectoryReader(path)
+
+
+def pack_directory(directory_path, bundle_path):
+    """Упаковывает директорию с файлами .ptafpro в пакет правил"""
+    source = RuleDirectoryReader(directory_path)
+    count = 0
+    with RuleBundleWriter(bundle_path, {"source_directory": os.path.abspath(directory_path)}) as writer:
+        for filename, data in source.iter_rules():
+            writer.add_rule(filename, data)
+            count += 1
+    return count
@@ -0,0 +1,178 @@
+# rule_copy.py
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from parallel_executor import DEFAULT_MAX_WORKERS, ParallelExecutor
+
+
+class RuleCopyPipeline:
+    """Потоковое копирование пользовательских правил между тенантами в памяти
+
+    Этап чтения параллельно получает детали правил исходного тенанта, этап
+    записи параллельно создает или обновляет их в целевом тенанте по мере
+    поступления. Шаблоны, списки правил и действия запрашиваются один раз.
+    Каждый тенант обслуживается собственным клиентом, поэтому текущий тенант
+    общего клиента не переключается.
+    """
+
+    def __init__(self, api_client, include_actions=False, preserve_state=False,
+                 max_workers=DEFAULT_MAX_WORKERS, rate_limit=None):
+        self.api_client = api_client
+        self.include_actions = include_actions
+        self.preserve_state = preserve_state
+        self.max_workers = max_workers
+        self.fetcher = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit)
+        self.writer = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit)
+
+        self.source_actions = {}
+        self.action_index = None
+        self.target_rules = {}
+        self.target_template_id = None
+        self.created_count = 0
+        self.updated_count = 0
+        self.failed = []
+
+    def _connect(self, tenant_id, tenant_name):
+        """Создает клиента для тенанта"""
+        client = self.api_client.clone_for_tenant(tenant_id)
+        if client is None:
+            print(f"❌ Не удалось авторизоваться в тенанте '{tenant_name}' ({tenant_id})")
+        return client
+
+    def _map_actions(self, action_ids):
+        """Переводит ID действий исходного тенанта в ID целевого"""
+        mapped = []
+        for action_id in action_ids:
+            source_action = self.source_actions.get(action_id)
+            if not source_action:
+                print(f"  ⚠️ Действие ID {action_id} не найдено в исходном тенанте")
+                continue
+            target_action = self.action_index.find_or_create({
+                'name': source_action.get('name'),
+                'type_id': source_action.get('type_id'),
+                'configuration': source_action.get('configuration')
+            })
+            if target_action:
+                mapped.append(target_action.get('id'))
+        return mapped
+
+    def _write_rule(self, target_client, rule, rule_details):
+        """Создает или обновляет одно правило в целевом тенанте, возвращает (статус, ответ)"""
+        rule_name = rule.get('name', 'Без названия')
+        configuration = dict(rule_details.get('configuration') or {})
+        if self.include_actions:
+            configuration['actions'] = self._map_actions(configuration.get('actions', []))
+        else:
+            configuration['actions'] = []
+
+        rule_id = self.target_rules.get(rule_name)
+        if rule_id:
+            payload = {
+                "configuration": {
+                    "code": configuration.get("code", ""),
+                    "actions": configuration.get("actions", []),
+                    "parameters": configuration.get("parameters", [])
+                }
+            }
+            if self.preserve_state:
+                payload['enabled'] = rule.get('enabled', True)
+            response = self.writer.call_with_retry(
+                lambda data: target_client.update_user_rule_raw(self.target_template_id, rule_id, data), payload)
+            return ('updated' if response is not None and response.status_code == 200 else 'failed'), response
+
+        payload = dict(rule_details)
+        payload.pop('id', None)
+        payload['configuration'] = configuration
+        if self.preserve_state:
+            payload['enabled'] = rule.get('enabled', True)
+        else:
+            payload.pop('enabled', None)
+        # Создание не повторяется: после 5xx или обрыва правило могло быть уже создано
+        response = self.writer.call_with_retry(
+            lambda data: target_client.create_user_rule_raw(self.target_template_id, data), payload,
+            max_retries=0)
+        return ('created' if response is not None and response.status_code == 201 else 'failed'), response
+
+    def _record_failure(self, rule_name, response, stage):
+        """Запоминает ошибку копирования правила"""
+        if response is None:
+            error = "Не удалось выполнить запрос"
+        else:
+            error = f"Ошибка {response.status_code}: {response.text[:200] if response.text else ''}"
+        print(f"❌ {stage} '{rule_name}': {error}")
+        self.failed.append({'rule': rule_name, 'stage': stage, 'error': error})
+
+    def copy(self, source_tenant_id, target_tenant_id, source_name="", target_name=""):
+        """Копирует все пользовательские правила из одного тенанта в другой"""
+        from rules_manager import RulesManager
+        from actions_manager import ActionsManager
+
+        source_client = self._connect(source_tenant_id, source_name)
+        target_client = self._connect(target_tenant_id, target_name)
+        if source_client is None or target_client is None:
+            return False
+
+        source_manager = RulesManager(source_client)
+        target_manager = RulesManager(target_client)
+
+        source_template_id = source_manager.get_policy_template_id()
+        self.target_template_id = target_manager.get_policy_template_id()
+        if not source_template_id or not self.target_template_id:
+            print("Не удалось получить ID шаблона политики в одном из тенантов")
+            return False
+
+        source_rules = source_manager.get_existing_rules(source_template_id)
+        target_rules = target_manager.get_existing_rules(self.target_template_id)
+        if source_rules is None or target_rules is None:
+            print("Не удалось получить списки правил")
+            return False
+
+        user_rules = [rule for rule in source_rules if not rule.get('is_system', True) and rule.get('id')]
+        if not user_rules:
+            print("Нет пользовательских правил для копирования")
+            return False
+
+        self.target_rules = {rule['name']: rule['id'] for rule in target_rules if 'name' in rule and 'id' in rule}
+
+        if self.include_actions:
+            self.source_actions = {action.get('id'): action
+                                   for action in source_manager.get_available_actions() or []}
+            self.action_index = ActionsManager(target_client).build_action_index()
+
+        print(f"\nКопирование {len(user_rules)} правил ({self.max_workers} потоков на чтение и запись)...")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as write_pool:
+            write_futures = {}
+
+            def on_fetched(rule, response):
+                # Правило сразу передается на запись, не дожидаясь остальных
+                if response is None or response.status_code != 200:
+                    self._record_failure(rule.get('name', 'Без названия'), response, "Чтение правила")
+                    return
+                future = write_pool.submit(self._write_rule, target_client, rule, response.json())
+                write_futures[future] = rule
+
+            self.fetcher.map(lambda rule: source_client.get_user_rule_details_raw(source_template_id, rule['id']),
+                             user_rules, on_fetched)
+
+            for future in as_completed(write_futures):
+                rule = write_futures[future]
+                rule_name = rule.get('name', 'Без названия')
+                try:
+                    status, response = future.result()
+                except Exception as e:
+                    status, response = 'failed', None
+                    print(f"❌ Исключение при записи правила '{rule_name}': {e}")
+
+                if status == 'created':
+                    self.created_count += 1
+                    print(f"✅ Правило '{rule_name}' создано")
+                elif status == 'updated':
+                    self.updated_count += 1
+                    print(f"✅ Правило '{rule_name}' обновлено")
+                else:
+                    self._record_failure(rule_name, response, "Запись правила")
+
+        print(f"\nИтог копирования:")
+        print(f"Создано: {self.created_count}, обновлено: {self.updated_count}, ошибок: {len(self.failed)}")
+        print(f"Всего правил в исходном тенанте: {len(user_rules)}")
+        return (self.created_count + self.updated_count) > 0
@@ -0,0 +1,224 @@
+# rule_validator.py
+import os
+import json
+import zipfile
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Меньше этого числа файлов проверяем в текущем процессе - запуск пула дороже самой проверки
+PARALLEL_THRESHOLD = 200
+CHUNK_SIZE = 100
+
+FORMAT_PLAIN = "plain"
+FORMAT_WITH_ACTIONS = "with_actions"
+
+
+def _check_rule_body(rule, prefix=""):
+    """Проверяет обязательные поля тела правила"""
+    errors = []
+    if not isinstance(rule, dict):
+        return [f"{prefix}правило должно быть JSON объектом"]
+
+    name = rule.get('name')
+    if not isinstance(name, str) or not name.strip():
+        errors.append(f"{prefix}отсутствует имя правила (name)")
+
+    configuration = rule.get('configuration')
+    if not isinstance(configuration, dict):
+        errors.append(f"{prefix}отсутствует секция configuration")
+    else:
+        code = configuration.get('code')
+        if not isinstance(code, str) or not code.strip():
+            errors.append(f"{prefix}отсутствует configuration.code")
+        if 'actions' in configuration and not isinstance(configuration['actions'], list):
+            errors.append(f"{prefix}configuration.actions должен быть списком")
+        if 'parameters' in configuration and not isinstance(configuration['parameters'], list):
+            errors.append(f"{prefix}configuration.parameters должен быть списком")
+
+    if 'enabled' in rule and not isinstance(rule['enabled'], bool):
+        errors.append(f"{prefix}поле enabled должно быть true/false")
+    return errors
+
+
+def validate_rule_data(data, include_actions=False):
+    """Проверяет данные одного файла правила. Возвращает (имя, формат, ошибки)"""
+    if not isinstance(data, dict):
+        return None, None, ["файл должен содержать JSON объект"]
+
+    if 'rule_data' in data or 'actions_info' in data:
+        rule_format = FORMAT_WITH_ACTIONS
+        errors = []
+        if 'rule_data' not in data:
+            errors.append("отсутствует секция rule_data")
+        if 'actions_info' not in data:
+            errors.append("отсутствует секция actions_info")
+
+        rule = data.get('rule_data')
+        if 'rule_data' in data:
+            errors.extend(_check_rule_body(rule, "rule_data: "))
+
+        actions_info = data.get('actions_info')
+        if 'actions_info' in data:
+            if not isinstance(actions_info, dict):
+                errors.append("actions_info должен быть объектом {id действия: описание}")
+            else:
+                for action_id, action in actions_info.items():
+                    if not isinstance(action, dict) or not action.get('name'):
+                        errors.append(f"actions_info[{action_id}]: отсутствует имя действия")
+                    elif not action.get('type_id'):
+                        errors.append(f"actions_info[{action_id}]: отсутствует type_id действия '{action.get('name')}'")
+
+        if not include_actions:
+            errors.append("файл в формате с действиями, а импорт выполняется без восстановления действий")
+
+        name = rule.get('name') if isinstance(rule, dict) else None
+        return name, rule_format, errors
+
+    errors = _check_rule_body(data)
+    return data.get('name'), FORMAT_PLAIN, errors
+
+
+def _validate_loaded(file_label, loader, include_actions):
+    """Читает и проверяет одну запись, исключения превращаются в ошибки"""
+    try:
+        data = loader()
+    except json.JSONDecodeError as e:
+        return {'file': file_label, 'rule': None, 'format': None,
+                'errors': [f"некорректный JSON: {e.msg} (строка {e.lineno}, позиция {e.colno})"]}
+    except UnicodeDecodeError:
+        return {'file': file_label, 'rule': None, 'format': None,
+                'errors': ["файл не в кодировке UTF-8"]}
+    except Exception as e:
+        return {'file': file_label, 'rule': None, 'format': None,
+                'errors': [f"не удалось прочитать файл: {e}"]}
+
+    name, rule_format, errors = validate_rule_data(data, include_actions)
+    return {'file': file_label, 'rule': name, 'format': rule_format, 'errors': errors}
+
+
+def _validate_directory_chunk(directory_path, filenames, include_actions):
+    """Проверяет часть файлов директории (выполняется в дочернем процессе)"""
+    results = []
+    for filename in filenames:
+        file_path = os.path.join(directory_path, filename)
+
+        def loader(path=file_path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        results.append(_validate_loaded(filename, loader, include_actions))
+    return results
+
+
+def _validate_bundle_chunk(bundle_path, members, include_actions):
+    """Проверяет часть записей пакета (выполняется в дочернем процессе)"""
+    results = []
+    with zipfile.ZipFile(bundle_path, 'r') as bundle:
+        for member in members:
+
+            def loader(name=member):
+                with bundle.open(name) as f:
+                    return json.loads(f.read().decode('utf-8'))
+
+            results.append(_validate_loaded(member, loader, include_actions))
+    return results
+
+
+class RuleValidator:
+    """Офлайн-проверка файлов правил перед импортом"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def validate(self, source, filenames, include_actions=False):
+        """Проверяет указанные файлы источника (директории или пакета)
+
+        Возвращает словарь с ключами valid (список корректных файлов) и
+        invalid (список {'file', 'rule', 'errors'}), порядок файлов сохраняется.
+        """
+        if hasattr(source, 'bundle_path'):
+            worker, location = _validate_bundle_chunk, os.path.abspath(source.bundle_path)
+        else:
+            worker, location = _validate_directory_chunk, os.path.abspath(source.directory_path)
+
+        chunks = [filenames[i:i + CHUNK_SIZE] for i in range(0, len(filenames), CHUNK_SIZE)]
+        results = None
+        if len(filenames) >= PARALLEL_THRESHOLD:
+            results = self._run_parallel(worker, location, chunks, include_actions)
+        if results is None:
+            results = []
+            for chunk in chunks:
+                results.extend(worker(location, chunk, include_actions))
+
+        return self._build_report(results)
+
+    def _run_parallel(self, worker, location, chunks, include_actions):
+        """Запускает проверку в пуле процессов, None - если пул недоступен"""
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(worker, location, chunk, include_actions) for chunk in chunks]
+                results = []
+                for future in futures:
+                    results.extend(future.result())
+                return results
+        except (OSError, NotImplementedError, RuntimeError) as e:
+            print(f"⚠️ Пул процессов недоступен ({e}), проверка выполняется последовательно")
+            return None
+
+    def _build_report(self, results):
+        """Собирает итоговый отчет и ищет дубликаты имен правил"""
+        seen_names = {}
+        valid = []
+        invalid = []
+        for result in results:
+            errors = list(result['errors'])
+            name = result['rule']
+            if name and not errors:
+                if name in seen_names:
+                    errors.append(f"дубликат имени правила, уже задано в {seen_names[name]}")
+                else:
+                    seen_names[name] = result['file']
+
+            if errors:
+                invalid.append({'file': result['file'], 'rule': name or 'N/A', 'errors': errors})
+            else:
+                valid.append(result['file'])
+
+        return {'valid': valid, 'invalid': invalid, 'total': len(results)}
+
+
+def print_validation_report(report):
+    """Выводит результаты проверки"""
+    print(f"\nПроверка файлов: корректных {len(report['valid'])} из {report['total']}")
+    if not report['invalid']:
+        print("✅ Все файлы прошли проверку")
+        return
+
+    print(f"❌ Файлов с ошибками: {len(report['invalid'])}")
+    for i, item in enumerate(report['invalid'], 1):
+        print(f"{i}. {item['file']} (правило: {item['rule']})")
+        for error in item['errors']:
+            print(f"   - {error}")
+
+
+def save_validation_report(report, directory_path):
+    """Сохраняет отчет о проверке в файл"""
+    report_file = os.path.join(directory_path, "validation_report.txt")
+    try:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write("ОТЧЕТ О ПРОВЕРКЕ ФАЙЛОВ ПРАВИЛ\n")
+            f.write("=" * 50 + "\n\n")
+            f.write(f"Дата и время проверки: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"Всего файлов: {report['total']}\n")
+            f.write(f"Корректных: {len(report['valid'])}\n")
+            f.write(f"С ошибками: {len(report['invalid'])}\n\n")
+
+            for i, item in enumerate(report['invalid'], 1):
+                f.write(f"{i}. {item['file']}\n")
+                f.write(f"   Правило: {item['rule']}\n")
+                for error in item['errors']:
+                    f.write(f"   - {error}\n")
+                f.write("\n")
+        print(f"Отчет о проверке сохранен в файл: {report_file}")
+    except Exception as e:
+        print(f"Не удалось сохранить отчет о проверке: {e}")
@@ -0,0 +1,219 @@
+# rule_watcher.py
+import os
+import json
+import time
+import hashlib
+
+from rule_validator import validate_rule_data
+
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_DEBOUNCE = 1.5
+
+
+class RuleDirectoryWatcher:
+    """Следит за директорией с .ptafpro файлами и импортирует только измененные правила
+
+    Изменения определяются дешевым опросом stat (mtime и размер), а затем
+    подтверждаются хешем содержимого, поэтому простое касание файла не
+    вызывает импорт. Файл импортируется, когда он не менялся в течение
+    интервала debounce. Шаблон политики и индекс правил загружаются один
+    раз и обновляются по мере импорта.
+    """
+
+    def __init__(self, rules_manager, directory_path, include_actions=False, preserve_state=False,
+                 enable_after_import=False, poll_interval=DEFAULT_POLL_INTERVAL, debounce=DEFAULT_DEBOUNCE,
+                 delete_removed=False):
+        self.rules_manager = rules_manager
+        self.directory_path = os.path.abspath(directory_path)
+        self.include_actions = include_actions
+        self.preserve_state = preserve_state
+        self.enable_after_import = enable_after_import
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.delete_removed = delete_removed
+
+        # имя файла -> {'stat': (mtime_ns, size), 'hash': sha256, 'rule': имя правила}
+        self.index = {}
+        # имя файла -> (stat, время последнего изменения stat)
+        self.pending = {}
+        self.template_id = None
+        self._context_ready = False
+
+    def _scan(self):
+        """Возвращает {имя файла: (mtime_ns, size)} для .ptafpro файлов директории"""
+        result = {}
+        with os.scandir(self.directory_path) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.ptafpro'):
+                    stat = entry.stat()
+                    result[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    def _read_file(self, filename):
+        """Читает файл и возвращает (байты, хеш)"""
+        with open(os.path.join(self.directory_path, filename), 'rb') as f:
+            raw = f.read()
+        return raw, hashlib.sha256(raw).hexdigest()
+
+    def _refresh_context(self):
+        """Загружает шаблон политики и индекс правил, если они еще не загружены"""
+        if self._context_ready:
+            return True
+        if self.template_id is None:
+            self.template_id = self.rules_manager.get_policy_template_id()
+            if not self.template_id:
+                print("Не удалось получить ID шаблона политики")
+                return False
+        self._context_ready = self.rules_manager.begin_import_context(self.template_id)
+        return self._context_ready
+
+    def build_baseline(self, import_existing=False):
+        """Строит начальный индекс директории; при import_existing все файлы считаются новыми"""
+        for filename, stat in self._scan().items():
+            if import_existing:
+                self.pending[filename] = (stat, 0.0)
+                continue
+            try:
+                raw, digest = self._read_file(filename)
+                data = json.loads(raw.decode('utf-8'))
+                rule_name = validate_rule_data(data, self.include_actions)[0]
+            except (OSError, ValueError):
+                digest, rule_name = None, None
+            self.index[filename] = {'stat': stat, 'hash': digest, 'rule': rule_name}
+        print(f"Отслеживается файлов: {len(self.index) + len(self.pending)}")
+
+    def poll_once(self):
+        """Один цикл опроса: находит изменения и обрабатывает устоявшиеся файлы"""
+        now = time.monotonic()
+        current = self._scan()
+
+        for filename, stat in current.items():
+            known = self.index.get(filename)
+            if known and known['stat'] == stat:
+                self.pending.pop(filename, None)
+                continue
+            pending = self.pending.get(filename)
+            if pending is None or pending[0] != stat:
+                # Файл еще меняется - отсчет debounce начинается заново
+                self.pending[filename] = (stat, now)
+
+        for filename in [name for name in self.pending if name not in current]:
+            self.pending.pop(filename, None)
+
+        ready = [name for name, (stat, changed_at) in self.pending.items() if now - changed_at >= self.debounce]
+        deleted = [name for name in self.index if name not in current]
+        if ready or deleted:
+            self._process_batch(sorted(ready), deleted)
+
+    def _process_batch(self, ready, deleted):
+        """Импортирует измененные файлы и обрабатывает удаленные"""
+        changed = []
+        for filename in ready:
+            stat = self.pending.pop(filename)[0]
+            try:
+                raw, digest = self._read_file(filename)
+            except OSError:
+                continue
+
+            known = self.index.get(filename)
+            if known and known['hash'] == digest:
+                known['stat'] = stat
+                continue
+
+            entry = {'stat': stat, 'hash': digest, 'rule': None}
+            self.index[filename] = entry
+            try:
+                data = json.loads(raw.decode('utf-8'))
+            except ValueError as e:
+                print(f"❌ {filename}: некорректный JSON ({e}), файл пропущен до следующего изменения")
+                continue
+
+            rule_name, _, errors = validate_rule_data(data, self.include_actions)
+            entry['rule'] = rule_name
+            if errors:
+                print(f"❌ {filename}: {'; '.join(errors)}")
+                continue
+            changed.append((filename, data))
+
+        if not changed and not (deleted and self.delete_removed):
+            for filename in deleted:
+                print(f"Файл удален: {filename}")
+                self.index.pop(filename, None)
+            return
+
+        stamp = time.strftime('%H:%M:%S')
+        print(f"\n[{stamp}] Изменено файлов: {len(changed)}, удалено: {len(deleted)}")
+        if not self._refresh_context():
+            print("⚠️ Не удалось обновить контекст импорта, изменения будут обработаны в следующем цикле")
+            for filename, _ in changed:
+                # Сбрасываем индекс файла, чтобы он снова попал в очередь
+                self.index.pop(filename, None)
+            return
+
+        failed = False
+        for filename, data in changed:
+            file_path = os.path.join(self.directory_path, filename)
+            previous_failure = self.rules_manager._last_failure()
+            if self.include_actions and 'rule_data' in data:
+                success = self.rules_manager.import_single_rule_with_actions(
+                    file_path, None, self.enable_after_import, self.preserve_state, None, import_data=data)
+            else:
+                success = self.rules_manager.import_single_rule(
+                    file_path, None, self.enable_after_import, self.preserve_state, None, rule_data=data)
+            if not success:
+                failed = True
+                failure = self.rules_manager._last_failure()
+                if failure is previous_failure or failure is None or failure['transient']:
+                    # Временная ошибка: сбрасываем индекс файла, чтобы повторить импорт в следующем цикле;
+                    # окончательная ошибка повторяется только после изменения файла
+                    self.index.pop(filename, None)
+
+        for filename in deleted:
+            entry = self.index.pop(filename, None)
+            rule_name = entry.get('rule') if entry else None
+            print(f"Файл удален: {filename}")
+            if self.delete_removed and rule_name:
+                self._delete_rule(rule_name)
+
+        if failed:
+            # После ошибки индекс правил мог устареть - перечитаем его в следующем цикле
+            self.rules_manager.end_import_context()
+            self._context_ready = False
+
+    def _delete_rule(self, rule_name):
+        """Удаляет правило, файл которого удален из директории"""
+        context_rules = self.rules_manager._import_existing_rules(self.template_id) or {}
+        rule_id = context_rules.get(rule_name)
+        if not rule_id:
+            print(f"  Правило '{rule_name}' не найдено на сервере")
+            return
+        response = self.rules_manager.delete_rule(self.template_id, rule_id)
+        if response and response.status_code == 204:
+            context_rules.pop(rule_name, None)
+            print(f"  ✅ Правило '{rule_name}' удалено")
+        else:
+            print(f"  ❌ Не удалось удалить правило '{rule_name}'")
+
+    def run(self, import_existing=False):
+        """Запускает наблюдение до прерывания (Ctrl+C)"""
+        if not os.path.isdir(self.directory_path):
+            print(f"Директория не найдена: {self.directory_path}")
+            return False
+
+        print(f"\nНаблюдение за директорией: {self.directory_path}")
+        print(f"Интервал опроса: {self.poll_interval} с, задержка перед импортом: {self.debounce} с")
+        if not self._refresh_context():
+            return False
+        self.build_baseline(import_existing)
+        print("Для остановки нажмите Ctrl+C")
+
+        try:
+            while True:
+                self.poll_once()
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            print("\nНаблюдение остановлено")
+        finally:
+            self.rules_manager.end_import_context()
+            self._context_ready = False
+        return True
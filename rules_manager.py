@@ -3,16 +3,39 @@ import os
 import json
 import shutil
 import datetime
-import tempfile
+import threading
 from base_manager import BaseManager
+from rule_bundle import (BUNDLE_EXTENSION, RuleBundleReader, RuleBundleWriter, is_bundle_path,
+                         open_rule_source, rule_name_from_data)
+from rule_validator import RuleValidator, print_validation_report, save_validation_report
+from import_journal import ImportJournal, journal_path_for
+from parallel_executor import DEFAULT_MAX_WORKERS, ParallelExecutor
+from import_report import ImportReportWriter
+from retry_queue import RetryQueue, is_transient_failure
+from unit_of_work import PatchUnitOfWork
 
 class RulesManager(BaseManager):
     def __init__(self, api_client):
         super().__init__(api_client)
-        self.failed_files = []
-        self.success_files = []
-        self.exported_files = []
+        # Результаты операций пишутся потоково, в памяти только счетчики;
+        # отчет создается при первом обращении, чтобы не держать файл зря
+        self._report = None
         self.problem_dir_created = False
+        self._action_indexes = {}
+        self._import_context = None
+        # Очередь повтора активна во время импорта файлов
+        self._retry_queue = None
+        # Отложенные файлы, создание правила по которым могло пройти на сервере
+        self._pending_creates = {}
+        # Результат последнего файла в текущем потоке (повторный импорт идет параллельно)
+        self._outcome = threading.local()
+        # Общие индексы действий и контекст импорта меняются из потоков повторного импорта
+        self._state_lock = threading.Lock()
+    
+    @property
+    def last_imported_rule_id(self):
+        """ID правила, импортированного последним в текущем потоке"""
+        return getattr(self._outcome, 'rule_id', None)
     
     def get_policy_template_id(self):
         """Получает ID первого доступного шаблона политики"""
@@ -56,6 +79,49 @@ class RulesManager(BaseManager):
         response = self.api_client.get_actions()
         return self._parse_response_items(response)
     
+    def _import_template_id(self):
+        """ID шаблона для импорта: из контекста импорта или запросом к API"""
+        if self._import_context is not None:
+            return self._import_context['template_id']
+        return self.get_policy_template_id()
+    
+    def _import_existing_rules(self, template_id):
+        """Словарь {имя: id} существующих правил: из контекста импорта или запросом к API"""
+        if self._import_context is not None and self._import_context['template_id'] == template_id:
+            return self._import_context['rules']
+        existing_rules = self.get_existing_rules(template_id)
+        if existing_rules is None:
+            return None
+        return {rule['name']: rule['id'] for rule in existing_rules if 'name' in rule and 'id' in rule}
+    
+    def begin_import_context(self, template_id, existing_rules=None):
+        """Запоминает шаблон и список правил, чтобы не запрашивать их для каждого файла"""
+        if existing_rules is None:
+            existing_rules = self.get_existing_rules(template_id)
+            if existing_rules is None:
+                self._import_context = None
+                return False
+        self._import_context = {
+            'template_id': template_id,
+            'rules': {rule['name']: rule['id'] for rule in existing_rules if 'name' in rule and 'id' in rule}
+        }
+        return True
+    
+    def end_import_context(self):
+        """Сбрасывает контекст импорта"""
+        self._import_context = None
+    
+    def _get_action_index(self):
+        """Возвращает индекс действий текущего тенанта (один на тенант)"""
+        tenant_id = self.api_client.auth_manager.tenant_id
+        with self._state_lock:
+            action_index = self._action_indexes.get(tenant_id)
+            if action_index is None:
+                from actions_manager import ActionsManager
+                action_index = ActionsManager(self.api_client).build_action_index()
+                self._action_indexes[tenant_id] = action_index
+        return action_index
+    
     def get_action_details(self, action_ids):
         """Получает детали действий по их ID"""
         if not action_ids:
@@ -79,7 +145,18 @@ class RulesManager(BaseManager):
         
         return action_dict
     
-    def export_single_rule(self, template_id, rule, export_dir, preserve_state=False):
+    def _write_exported_rule(self, export_dir, filename, data, bundle_writer=None):
+        """Сохраняет экспортированное правило в файл или в пакет правил"""
+        if bundle_writer is not None:
+            member = bundle_writer.add_rule(filename, data)
+            return f"{os.path.abspath(bundle_writer.bundle_path)}::{member}"
+        
+        filepath = os.path.join(export_dir, filename)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return os.path.abspath(filepath)
+    
+    def export_single_rule(self, template_id, rule, export_dir, preserve_state=False, bundle_writer=None):
         """Экспортирует одно правило"""
         rule_id = rule.get('id')
         rule_name = rule.get('name', 'unnamed_rule')
@@ -89,6 +166,7 @@ class RulesManager(BaseManager):
         rule_details = self.get_rule_details(template_id, rule_id)
         if not rule_details:
             print(f"Не удалось получить детали правила {rule_name} (ID: {rule_id})")
+            self._record_failure(rule_name, rule_name, "Не удалось получить детали правила")
             return False
         
         # Удаляем ID из экспортируемых данных
@@ -103,45 +181,26 @@ class RulesManager(BaseManager):
         safe_name = "".join(c if c.isalnum() or c in ('_', '-') else '_' for c in rule_name)
         safe_name = safe_name.replace(' ', '_')
         filename = f"{safe_name}.ptafpro"
-        filepath = os.path.join(export_dir, filename)
         
-        # Получаем абсолютный путь
-        absolute_filepath = os.path.abspath(filepath)
-        
-        # Сохраняем правило в файл
+        # Сохраняем правило в файл или пакет
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(rule_details, f, ensure_ascii=False, indent=2)
+            absolute_filepath = self._write_exported_rule(export_dir, filename, rule_details, bundle_writer)
             print(f"Правило '{rule_name}' экспортировано:")
             print(f"  Состояние: {'включено' if rule_enabled else 'выключено'}")
             print(f"📁 Путь: {absolute_filepath}")
-            self.exported_files.append(absolute_filepath)
+            self.report.record_success(absolute_filepath, rule_name, rule_id)
             return True
         except Exception as e:
             print(f"Ошибка при сохранении правила '{rule_name}': {e}")
+            self._record_failure(filename, rule_name, str(e))
             return False
     
-    def export_single_rule_with_actions(self, template_id, rule, export_dir, preserve_state=False):
-        """Экспортирует одно правило с сохранением информации о связанных действиями"""
+    def _build_export_with_actions(self, template_id, rule, rule_details, action_details, preserve_state=False):
+        """Формирует имя файла и данные экспорта правила с действиями"""
         rule_id = rule.get('id')
         rule_name = rule.get('name', 'unnamed_rule')
-        rule_enabled = rule.get('enabled', True)  # Получаем состояние правила
-        
-        # Получаем детали правила
-        rule_details = self.get_rule_details(template_id, rule_id)
-        if not rule_details:
-            print(f"Не удалось получить детали правила {rule_name} (ID: {rule_id})")
-            return False
-        
-        # Извлекаем ID действий из правила
-        action_ids = []
-        if 'configuration' in rule_details and 'actions' in rule_details['configuration']:
-            action_ids = rule_details['configuration']['actions']
-        
-        # Получаем детали связанных действий
-        action_details = {}
-        if action_ids:
-            action_details = self.get_action_details(action_ids)
+        rule_enabled = rule.get('enabled', True)
+        action_ids = rule_details.get('configuration', {}).get('actions', [])
         
         # Подготовка данных для экспорта
         export_data = {
@@ -175,24 +234,120 @@ class RulesManager(BaseManager):
             filename = f"{safe_name}_with_actions{state_suffix}.ptafpro"
         else:
             filename = f"{safe_name}_with_actions.ptafpro"
-        filepath = os.path.join(export_dir, filename)
         
-        # Получаем абсолютный путь
-        absolute_filepath = os.path.abspath(filepath)
+        return filename, export_data
+    
+    def export_single_rule_with_actions(self, template_id, rule, export_dir, preserve_state=False, bundle_writer=None):
+        """Экспортирует одно правило с сохранением информации о связанных действиями"""
+        rule_id = rule.get('id')
+        rule_name = rule.get('name', 'unnamed_rule')
+        rule_enabled = rule.get('enabled', True)  # Получаем состояние правила
+        
+        # Получаем детали правила
+        rule_details = self.get_rule_details(template_id, rule_id)
+        if not rule_details:
+            print(f"Не удалось получить детали правила {rule_name} (ID: {rule_id})")
+            self._record_failure(rule_name, rule_name, "Не удалось получить детали правила")
+            return False
+        
+        # Извлекаем ID действий из правила
+        action_ids = []
+        if 'configuration' in rule_details and 'actions' in rule_details['configuration']:
+            action_ids = rule_details['configuration']['actions']
+        
+        # Получаем детали связанных действий
+        action_details = {}
+        if action_ids:
+            action_details = self.get_action_details(action_ids)
+        
+        filename, export_data = self._build_export_with_actions(template_id, rule, rule_details,
+                                                                action_details, preserve_state)
         
-        # Сохраняем правило в файл
+        # Сохраняем правило в файл или пакет
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
+            absolute_filepath = self._write_exported_rule(export_dir, filename, export_data, bundle_writer)
             print(f"Правило '{rule_name}' с {len(action_ids)} действиями экспортировано:")
             print(f"  Состояние: {'включено' if rule_enabled else 'выключено'}")
             print(f"📁 Путь: {absolute_filepath}")
-            self.exported_files.append(absolute_filepath)
+            self.report.record_success(absolute_filepath, rule_name, rule_id)
             return True
         except Exception as e:
             print(f"Ошибка при сохранении правила '{rule_name}' с действиями: {e}")
+            self._record_failure(filename, rule_name, str(e))
             return False
     
+    @property
+    def report(self):
+        """Текущий отчет; без начатой операции - временный, создается при первой записи"""
+        if self._report is None:
+            with self._state_lock:
+                if self._report is None:
+                    self._report = ImportReportWriter()
+        return self._report
+    
+    def _start_report(self, report_path, operation, metadata=None):
+        """Начинает новый потоковый отчет, закрывая предыдущий"""
+        if self._report is not None:
+            self._report.close()
+        self._report = ImportReportWriter(report_path, operation, metadata)
+        return self._report
+    
+    def _record_failure(self, file_path, rule_name, error, code=None, response=None, transient=None):
+        """Фиксирует ошибку обработки файла в отчете
+        
+        Временные ошибки (сеть, 429, 5xx) во время импорта не
+        считаются окончательными: файл ставится в очередь на повтор.
+        """
+        if transient is None:
+            transient = is_transient_failure(code)
+        self._outcome.failure = {
+            'file': file_path,
+            'rule': rule_name,
+            'error': error,
+            'code': code,
+            'response': response,
+            'transient': transient,
+            'create': getattr(self._outcome, 'creating', False)
+        }
+        if transient and self._retry_queue is not None:
+            self.report.record_retry(file_path, rule_name, error, code)
+            return
+        self.report.record_failure(file_path, rule_name, error, code, response)
+    
+    def _last_failure(self):
+        """Возвращает последнюю ошибку, зафиксированную в текущем потоке"""
+        return getattr(self._outcome, 'failure', None)
+    
+    def _defer_to_retry(self):
+        """Проверяет, отложен ли последний файл текущего потока для повтора"""
+        failure = self._last_failure()
+        return self._retry_queue is not None and failure is not None and failure['transient']
+    
+    def _open_export_target(self, export_dir, template_id, preserve_state=False):
+        """Готовит место экспорта: директорию или пакет правил (.ptafbundle)"""
+        metadata = {
+            'tenant_id': self.api_client.auth_manager.tenant_id,
+            'template_id': template_id,
+            'preserve_state': preserve_state
+        }
+        if is_bundle_path(export_dir):
+            print(f"Экспорт в пакет правил: {os.path.abspath(export_dir)}")
+            self._start_report(f"{os.path.abspath(export_dir)}.report.jsonl", "export", metadata)
+            return RuleBundleWriter(export_dir, metadata)
+        
+        os.makedirs(export_dir, exist_ok=True)
+        self._start_report(os.path.join(export_dir, "export_report.jsonl"), "export", metadata)
+        return None
+    
+    def _close_export_target(self, bundle_writer):
+        """Закрывает пакет правил после экспорта и завершает отчет"""
+        if bundle_writer is not None:
+            bundle_writer.close()
+            print(f"📦 Пакет правил сохранен: {os.path.abspath(bundle_writer.bundle_path)}")
+        self.report.finish()
+        print(f"Экспортировано: {self.report.success_count}, ошибок: {self.report.failure_count}")
+        print(f"Отчет об экспорте: {self.report.report_path}")
+    
     def export_rules_with_actions(self, export_dir="exported_rules_with_actions", preserve_state=False):
         """Экспортирует правила с сохранением информации о связанных действиями"""
         if not self.api_client.auth_manager.access_token:
@@ -219,8 +374,8 @@ class RulesManager(BaseManager):
             print("Нет пользовательских правил для экспорта")
             return False
         
-        # Создаем директорию для экспорта
-        os.makedirs(export_dir, exist_ok=True)
+        # Создаем директорию для экспорта или пакет правил
+        bundle_writer = self._open_export_target(export_dir, template_id, preserve_state)
         
         # Экспортируем все правила
         success_count = 0
@@ -228,20 +383,23 @@ class RulesManager(BaseManager):
         disabled_count = 0
         total_actions = 0
         
-        for rule in user_rules:
-            rule_enabled = rule.get('enabled', True)
-            if preserve_state:
-                if rule_enabled:
-                    enabled_count += 1
-                else:
-                    disabled_count += 1
-            
-            if self.export_single_rule_with_actions(template_id, rule, export_dir, preserve_state):
-                success_count += 1
-                # Подсчитываем количество действий
-                rule_details = self.get_rule_details(template_id, rule.get('id'))
-                if rule_details and 'configuration' in rule_details and 'actions' in rule_details['configuration']:
-                    total_actions += len(rule_details['configuration']['actions'])
+        try:
+            for rule in user_rules:
+                rule_enabled = rule.get('enabled', True)
+                if preserve_state:
+                    if rule_enabled:
+                        enabled_count += 1
+                    else:
+                        disabled_count += 1
+                
+                if self.export_single_rule_with_actions(template_id, rule, export_dir, preserve_state, bundle_writer):
+                    success_count += 1
+                    # Подсчитываем количество действий
+                    rule_details = self.get_rule_details(template_id, rule.get('id'))
+                    if rule_details and 'configuration' in rule_details and 'actions' in rule_details['configuration']:
+                        total_actions += len(rule_details['configuration']['actions'])
+        finally:
+            self._close_export_target(bundle_writer)
         
         print(f"\nЭкспортировано {success_count} из {len(user_rules)} правил")
         print(f"Всего сохранено {total_actions} связей с действиями")
@@ -275,32 +433,106 @@ class RulesManager(BaseManager):
             print("Нет пользовательских правил для экспорта")
             return False
         
-        # Создаем директорию для экспорта
-        os.makedirs(export_dir, exist_ok=True)
+        # Создаем директорию для экспорта или пакет правил
+        bundle_writer = self._open_export_target(export_dir, template_id, preserve_state)
         
         # Экспортируем все правила
         success_count = 0
         enabled_count = 0
         disabled_count = 0
         
-        for rule in user_rules:
-            rule_enabled = rule.get('enabled', True)
-            if preserve_state:
-                if rule_enabled:
-                    enabled_count += 1
-                else:
-                    disabled_count += 1
-            
-            if self.export_single_rule(template_id, rule, export_dir, preserve_state):
-                success_count += 1
+        try:
+            for rule in user_rules:
+                rule_enabled = rule.get('enabled', True)
+                if preserve_state:
+                    if rule_enabled:
+                        enabled_count += 1
+                    else:
+                        disabled_count += 1
+                
+                if self.export_single_rule(template_id, rule, export_dir, preserve_state, bundle_writer):
+                    success_count += 1
+        finally:
+            self._close_export_target(bundle_writer)
         
         print(f"\nЭкспортировано {success_count} из {len(user_rules)} правил")
         if preserve_state:
             print(f"Состояние правил: {enabled_count} включено, {disabled_count} выключено")
         return success_count > 0
     
-    def delete_all_user_rules(self):
-        """Удаляет все пользовательские правила из шаблона"""
+    def _safety_export_rules(self, template_id, user_rules, executor):
+        """Параллельно сохраняет удаляемые правила в пакет для возможного восстановления"""
+        tenant_id = self.api_client.auth_manager.tenant_id or "default"
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        bundle_path = os.path.join("deleted_rules_backup", str(tenant_id),
+                                   f"deleted_rules_{timestamp}{BUNDLE_EXTENSION}")
+        
+        # Действия загружаем один раз для всех правил
+        actions_by_id = {}
+        for action in self.get_available_actions() or []:
+            if action.get('id'):
+                actions_by_id[action['id']] = {
+                    'name': action.get('name'),
+                    'type_id': action.get('type_id'),
+                    'configuration': action.get('configuration')
+                }
+        
+        print(f"\nСохранение резервной копии {len(user_rules)} правил перед удалением...")
+        exported_ids = set()
+        writer = RuleBundleWriter(bundle_path, {
+            'tenant_id': tenant_id,
+            'template_id': template_id,
+            'preserve_state': True,
+            'reason': 'delete_all_user_rules'
+        })
+        
+        def on_result(rule, response):
+            rule_name = rule.get('name', 'Без названия')
+            if response is None or response.status_code != 200:
+                code = response.status_code if response is not None else "нет ответа"
+                print(f"❌ Не удалось получить детали правила '{rule_name}' ({code})")
+                return
+            rule_details = response.json()
+            action_ids = rule_details.get('configuration', {}).get('actions', [])
+            action_details = {str(action_id): actions_by_id[action_id]
+                              for action_id in action_ids if action_id in actions_by_id}
+            filename, export_data = self._build_export_with_actions(template_id, rule, rule_details,
+                                                                    action_details, preserve_state=True)
+            writer.add_rule(filename, export_data, rule_name)
+            exported_ids.add(rule.get('id'))
+        
+        try:
+            executor.map(lambda rule: self.api_client.get_user_rule_details_raw(template_id, rule['id']),
+                         user_rules, on_result)
+        finally:
+            writer.close()
+        
+        print(f"📦 Резервная копия: {os.path.abspath(bundle_path)} ({len(exported_ids)} из {len(user_rules)} правил)")
+        return bundle_path, exported_ids
+
+    def _delete_rules_parallel(self, template_id, user_rules, executor):
+        """Параллельно удаляет правила с ограничением частоты и повторами"""
+        deleted = []
+        
+        def on_result(rule, response):
+            rule_name = rule.get('name', 'Без названия')
+            if response is not None and response.status_code == 204:
+                print(f"Правило '{rule_name}' успешно удалено")
+                deleted.append(rule)
+            elif response is not None:
+                print(f"Ошибка при удалении правила '{rule_name}': {response.status_code} {response.text[:200]}")
+            else:
+                print(f"Ошибка при удалении правила '{rule_name}': Не удалось выполнить запрос")
+        
+        executor.map(lambda rule: self.api_client.delete_user_rule_raw(template_id, rule['id']),
+                     user_rules, on_result)
+        return len(deleted)
+
+    def delete_all_user_rules(self, parallel=None, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None):
+        """Удаляет все пользовательские правила из шаблона
+        
+        parallel: True - параллельное удаление, False - последовательное, None - спросить.
+        """
         if not self.api_client.auth_manager.access_token:
             if not self.api_client.auth_manager.get_jwt_tokens(self.api_client.make_request):
                 return False
@@ -338,6 +570,26 @@ class RulesManager(BaseManager):
             print("Удаление отменено")
             return False
 
+        if parallel is None:
+            parallel = input(f"\nУдалять параллельно ({max_workers} потоков)? (y/n): ").lower() == 'y'
+        
+        # Перед удалением сохраняем резервную копию всех удаляемых правил
+        executor = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit)
+        rules_with_id = [rule for rule in user_rules if rule.get('id')]
+        bundle_path, exported_ids = self._safety_export_rules(template_id, rules_with_id, executor)
+        if len(exported_ids) < len(rules_with_id):
+            if not self._confirm_action(
+                    f"Резервная копия неполная ({len(exported_ids)} из {len(rules_with_id)}). Продолжить удаление?"):
+                print("Удаление отменено")
+                return False
+
+        if parallel:
+            deleted_count = self._delete_rules_parallel(template_id, rules_with_id, executor)
+            print(f"\nУдалено {deleted_count} из {len(user_rules)} правил")
+            print(f"Для восстановления импортируйте пакет {os.path.abspath(bundle_path)} "
+                  f"с сохранением действий и состояния")
+            return deleted_count > 0
+
         # Удаляем правила
         deleted_count = 0
         for rule in user_rules:
@@ -358,8 +610,192 @@ class RulesManager(BaseManager):
                 print(f"Ошибка при удалении правила '{rule_name}': {error_msg}")
 
         print(f"\nУдалено {deleted_count} из {len(user_rules)} правил")
+        print(f"Для восстановления импортируйте пакет {os.path.abspath(bundle_path)} "
+              f"с сохранением действий и состояния")
         return deleted_count > 0
 
+    # ==================== НАБЛЮДЕНИЕ ЗА ДИРЕКТОРИЕЙ ====================
+    
+    def watch_directory(self, directory_path, include_actions=False, preserve_state=False,
+                        enable_after_import=False, delete_removed=False, import_existing=False):
+        """Следит за директорией и импортирует измененные .ptafpro файлы до Ctrl+C"""
+        from rule_watcher import RuleDirectoryWatcher
+        self._action_indexes = {}
+        report_path = os.path.join(os.path.abspath(directory_path), "watch_report.jsonl")
+        self._start_report(report_path, "watch", {'directory': os.path.abspath(directory_path)})
+        watcher = RuleDirectoryWatcher(self, directory_path, include_actions, preserve_state,
+                                       enable_after_import, delete_removed=delete_removed)
+        result = watcher.run(import_existing)
+        
+        self.report.finish()
+        print(f"\nИмпортировано изменений: {self.report.success_count}, ошибок: {self.report.failure_count}")
+        self.print_failed_files()
+        return result
+    
+    # ==================== МАССОВОЕ ВКЛЮЧЕНИЕ/ВЫКЛЮЧЕНИЕ ====================
+    
+    def _rule_action_ids(self, rule):
+        """Возвращает ID действий правила из элемента списка или деталей (None, если их нет)"""
+        configuration = rule.get('configuration')
+        if isinstance(configuration, dict) and 'actions' in configuration:
+            return configuration.get('actions') or []
+        if 'actions' in rule:
+            return rule.get('actions') or []
+        return None
+    
+    def load_desired_states(self, source_path):
+        """Читает желаемое состояние правил {имя: enabled} из экспорта (директория или пакет)"""
+        desired_states = {}
+        with open_rule_source(source_path) as source:
+            for filename, data in source.iter_rules():
+                rule_data = data.get('rule_data', data) if isinstance(data, dict) else {}
+                if isinstance(rule_data, dict) and 'enabled' in rule_data:
+                    desired_states[rule_name_from_data(data, filename)] = bool(rule_data['enabled'])
+        return desired_states
+    
+    def plan_bulk_state_change(self, template_id, rules, enabled=None, name_pattern=None, action_id=None,
+                               desired_states=None, executor=None):
+        """Определяет правила, состояние которых действительно нужно изменить
+        
+        Возвращает (список (правило, новое состояние), количество правил, уже находящихся в нужном состоянии).
+        """
+        candidates = []
+        for rule in rules:
+            if desired_states is not None:
+                if rule.get('name') not in desired_states:
+                    continue
+                target_state = desired_states[rule.get('name')]
+            else:
+                if name_pattern is not None and not name_pattern.search(rule.get('name', '')):
+                    continue
+                target_state = enabled
+            candidates.append((rule, target_state))
+        
+        if action_id is not None and candidates:
+            # Если в списке правил нет действий, догружаем детали только для кандидатов
+            missing = [rule for rule, _ in candidates if self._rule_action_ids(rule) is None]
+            details = {}
+            if missing:
+                executor = executor or ParallelExecutor()
+                for rule, response in executor.map(
+                        lambda item: self.api_client.get_user_rule_details_raw(template_id, item['id']), missing):
+                    if response is not None and response.status_code == 200:
+                        details[rule['id']] = response.json()
+            
+            filtered = []
+            for rule, state in candidates:
+                action_ids = self._rule_action_ids(rule)
+                if action_ids is None:
+                    action_ids = self._rule_action_ids(details.get(rule['id'], {})) or []
+                if action_id in action_ids or str(action_id) in [str(a) for a in action_ids]:
+                    filtered.append((rule, state))
+            candidates = filtered
+        
+        # Уже находящиеся в нужном состоянии считаются среди прошедших все фильтры
+        changes = [(rule, state) for rule, state in candidates if rule.get('enabled', True) != state]
+        unchanged = len(candidates) - len(changes)
+        return changes, unchanged
+    
+    def bulk_set_rule_state(self, template_id, changes, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None):
+        """Параллельно применяет изменения состояния правил, возвращает количество успешных"""
+        executor = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit)
+        states = {rule['id']: state for rule, state in changes}
+        success = []
+        
+        def on_result(rule, response):
+            rule_name = rule.get('name', 'Без названия')
+            status_text = "включено" if states[rule['id']] else "выключено"
+            if response is not None and response.status_code == 200:
+                print(f"✅ Правило '{rule_name}': {status_text}")
+                success.append(rule)
+            else:
+                code = response.status_code if response is not None else "нет ответа"
+                print(f"❌ Не удалось изменить состояние правила '{rule_name}' ({code})")
+        
+        executor.map(lambda rule: self.api_client.update_user_rule_raw(template_id, rule['id'],
+                                                                       {"enabled": states[rule['id']]}),
+                     [rule for rule, _ in changes], on_result)
+        return len(success)
+    
+    def _bulk_state_menu(self):
+        """Меню массового включения/выключения правил"""
+        import re
+        print("\n=== МАССОВОЕ ВКЛЮЧЕНИЕ/ВЫКЛЮЧЕНИЕ ПРАВИЛ ===")
+        
+        # Используем TenantManager для выбора тенанта
+        from tenants import TenantManager
+        tenant_manager = TenantManager(self.api_client.auth_manager, self.api_client.make_request)
+        if not tenant_manager.select_tenant_interactive():
+            print("Не удалось выбрать тенант")
+            return
+        
+        print("\nОтбор правил:")
+        print("1. По имени (регулярное выражение)")
+        print("2. По ID действия")
+        print("3. По файлу состояния из экспорта (директория или .ptafbundle)")
+        filter_choice = input("Выберите способ (1-3): ").strip()
+        
+        enabled = None
+        name_pattern = None
+        action_id = None
+        desired_states = None
+        
+        if filter_choice == '1':
+            try:
+                name_pattern = re.compile(input("Регулярное выражение для имени правила: ").strip())
+            except re.error as e:
+                print(f"Некорректное регулярное выражение: {e}")
+                return
+        elif filter_choice == '2':
+            action_id = input("ID действия: ").strip()
+            if not action_id:
+                print("ID действия не указан")
+                return
+        elif filter_choice == '3':
+            source_path = input("Путь к экспорту с сохраненным состоянием: ").strip()
+            if not source_path or not os.path.exists(source_path):
+                print("Указанный путь не существует")
+                return
+            desired_states = self.load_desired_states(source_path)
+            if not desired_states:
+                print("В экспорте нет правил с сохраненным состоянием")
+                return
+            print(f"Загружено состояние {len(desired_states)} правил")
+        else:
+            print("Некорректный выбор")
+            return
+        
+        if desired_states is None:
+            enabled = input("Включить (y) или выключить (n) выбранные правила? (y/n): ").lower() == 'y'
+        
+        template_id = self.get_policy_template_id()
+        if not template_id:
+            print("Не удалось получить ID шаблона политики")
+            return
+        
+        # Один запрос списка правил - текущее состояние берется из него
+        rules = self.get_existing_rules(template_id)
+        if rules is None:
+            return
+        user_rules = [rule for rule in rules if not rule.get('is_system', True) and rule.get('id')]
+        
+        changes, unchanged = self.plan_bulk_state_change(template_id, user_rules, enabled, name_pattern,
+                                                         action_id, desired_states)
+        if not changes:
+            print(f"\nНет правил, требующих изменения (уже в нужном состоянии: {unchanged})")
+            return
+        
+        print(f"\nБудет изменено состояние {len(changes)} правил (уже в нужном состоянии: {unchanged}):")
+        for rule, state in changes:
+            print(f"- {rule.get('name', 'Без названия')} -> {'включено' if state else 'выключено'}")
+        
+        if not self._confirm_action(f"Применить изменения к {len(changes)} правилам?"):
+            print("Операция отменена")
+            return
+        
+        success_count = self.bulk_set_rule_state(template_id, changes)
+        print(f"\nИзменено {success_count} из {len(changes)} правил")
+
     def _create_problem_directory(self, original_dir):
         """Создает директорию для проблемных файлов"""
         problem_dir = os.path.join(original_dir, "problem")
@@ -374,7 +810,8 @@ class RulesManager(BaseManager):
         return problem_dir
 
     def _save_import_report(self, directory_path, success_count, total_count):
-        """Сохраняет отчет об импорте в файл"""
+        """Завершает потоковый отчет и сохраняет его текстовую сводку в файл"""
+        self.report.finish(total=total_count)
         report_file = os.path.join(directory_path, "import_report.txt")
         try:
             with open(report_file, 'w', encoding='utf-8') as f:
@@ -387,20 +824,20 @@ class RulesManager(BaseManager):
                 
                 f.write(f"ИТОГИ:\n")
                 f.write(f"  Успешно импортировано: {success_count}\n")
-                f.write(f"  Не удалось импортировать: {len(self.failed_files)}\n")
+                f.write(f"  Не удалось импортировать: {self.report.failure_count}\n")
                 f.write(f"  Всего файлов: {total_count}\n\n")
                 
-                if self.success_files:
+                if self.report.success_count:
                     f.write("УСПЕШНО ИМПОРТИРОВАНЫ:\n")
                     f.write("-" * 30 + "\n")
-                    for i, file_path in enumerate(self.success_files, 1):
-                        f.write(f"{i}. {os.path.basename(file_path)}\n")
+                    for i, event in enumerate(self.report.iter_events('success'), 1):
+                        f.write(f"{i}. {os.path.basename(event['file'])}\n")
                     f.write("\n")
                 
-                if self.failed_files:
+                if self.report.failure_count:
                     f.write("ПРОБЛЕМНЫЕ ФАЙЛЫ:\n")
                     f.write("=" * 50 + "\n")
-                    for i, fail in enumerate(self.failed_files, 1):
+                    for i, fail in enumerate(self.report.iter_failures(), 1):
                         f.write(f"{i}. {fail['file']}\n")
                         f.write(f"   Правило: {fail['rule']}\n")
                         f.write(f"   Причина: {fail['error']}\n")
@@ -411,6 +848,8 @@ class RulesManager(BaseManager):
                         f.write("\n")
             
             print(f"Отчет об импорте сохранен в файл: {report_file}")
+            if self.report.report_path:
+                print(f"Журнал результатов (JSONL): {self.report.report_path}")
             return report_file
         except Exception as e:
             print(f"Ошибка при сохранении отчета: {e}")
@@ -445,29 +884,26 @@ class RulesManager(BaseManager):
                 }
             }
             
-            response = self.update_rule(template_id, rule_id, update_data)
+            # Обновление и включение правила уходят одним запросом
+            work = PatchUnitOfWork()
+            key = ('user_rule', template_id, rule_id)
+            send = lambda data: self.update_rule(template_id, rule_id, data)
+            work.update(key, send, update_data, f"Правило '{rule_name}'")
+            if enable_after_import:
+                work.update(key, send, {"enabled": True})
+            response = work.commit()[0].response
             if response and response.status_code == 200:
                 print(f"✅ Правило '{rule_name}' успешно обновлено после обновления токена")
-                self.success_files.append(file_path)
-                
-                if enable_after_import:
-                    self.enable_rule(template_id, rule_id, True)
+                self._register_success(file_path, rule_name, rule_id=rule_id)
                 return True
         else:
-            # Создание нового правило
+            # Создание нового правило (сразу включенным, без отдельного запроса)
+            if enable_after_import:
+                rule_data['enabled'] = True
             response = self.create_rule(template_id, rule_data)
             if response and response.status_code == 201:
                 print(f"✅ Правило '{rule_name}' успешно создано после обновления токена")
-                self.success_files.append(file_path)
-                
-                if enable_after_import:
-                    try:
-                        new_rule = response.json()
-                        rule_id = new_rule.get('id')
-                        if rule_id:
-                            self.enable_rule(template_id, rule_id, True)
-                    except:
-                        pass
+                self._register_success(file_path, rule_name, response=response)
                 return True
         
         # Если повторная попытка тоже не удалась
@@ -475,13 +911,7 @@ class RulesManager(BaseManager):
             error_msg = f"Ошибка при повторном импорте правила (код {response.status_code})"
             print(f"❌ {error_msg}: {rule_name}")
             
-            self.failed_files.append({
-                'file': file_path,
-                'rule': rule_name,
-                'error': error_msg,
-                'code': response.status_code,
-                'response': response.text[:200] if response.text else ""
-            })
+            self._record_failure(file_path, rule_name, error_msg, response.status_code, response.text[:200] if response.text else "")
             
             if problem_dir:
                 self._move_to_problem_directory(file_path, problem_dir, error_msg, response.text[:200] if response.text else "")
@@ -490,6 +920,9 @@ class RulesManager(BaseManager):
     
     def _move_to_problem_directory(self, file_path, problem_dir, error_reason="", server_response=""):
         """Перемещает файл в problem директорию"""
+        if self._defer_to_retry():
+            print("Файл поставлен в очередь на повтор")
+            return None
         try:
             filename = os.path.basename(file_path)
             new_path = os.path.join(problem_dir, filename)
@@ -506,41 +939,70 @@ class RulesManager(BaseManager):
             print(f"Файл перемещен в проблемную директорию: {new_path}")
             
             # Создаем файл с описанием ошибки
-            error_file = f"{os.path.splitext(new_path)[0]}_error.txt"
-            with open(error_file, 'w', encoding='utf-8') as f:
-                f.write(f"Файл: {filename}\n")
-                f.write(f"Ошибка: {error_reason}\n")
-                if server_response:
-                    f.write(f"Ответ сервера: {server_response}\n")
-                f.write(f"Время: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            self._write_problem_error_file(new_path, filename, error_reason, server_response)
             
             return new_path
         except Exception as e:
             print(f"Не удалось переместить файл в проблемную директорию: {e}")
             return None
+    
+    def _register_success(self, file_path, rule_name, rule_id=None, response=None):
+        """Фиксирует успешный импорт файла и ID правила на сервере"""
+        if rule_id is None and response is not None:
+            try:
+                rule_id = response.json().get('id')
+            except (ValueError, AttributeError):
+                rule_id = None
+        self._outcome.rule_id = rule_id
+        # Новое правило сразу попадает в контекст, следующий файл с тем же именем его обновит
+        with self._state_lock:
+            if self._import_context is not None and rule_id:
+                self._import_context['rules'][rule_name] = rule_id
+        self.report.record_success(file_path, rule_name, rule_id)
+    
+    def _write_problem_error_file(self, problem_path, filename, error_reason="", server_response=""):
+        """Создает файл с описанием ошибки рядом с проблемным файлом"""
+        error_file = f"{os.path.splitext(problem_path)[0]}_error.txt"
+        with open(error_file, 'w', encoding='utf-8') as f:
+            f.write(f"Файл: {filename}\n")
+            f.write(f"Ошибка: {error_reason}\n")
+            if server_response:
+                f.write(f"Ответ сервера: {server_response}\n")
+            f.write(f"Время: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    
+    def _save_bundle_entry_to_problem_directory(self, bundle_reader, filename, problem_dir):
+        """Сохраняет проблемную запись пакета в problem директорию как файл .ptafpro"""
+        if self._defer_to_retry():
+            print("Запись пакета поставлена в очередь на повтор")
+            return None
+        try:
+            new_path = bundle_reader.extract_file(filename, problem_dir)
+            last_fail = self._last_failure() or {}
+            self._write_problem_error_file(new_path, filename, last_fail.get('error', ''),
+                                           last_fail.get('response') or "")
+            print(f"Запись пакета сохранена в проблемную директорию: {new_path}")
+            return new_path
+        except Exception as e:
+            print(f"Не удалось сохранить запись пакета в проблемную директорию: {e}")
+            return None
 
     def import_single_rule(self, file_path, selected_action_ids=None, enable_after_import=False, 
-                           preserve_state=False, problem_dir=None):
+                           preserve_state=False, problem_dir=None, rule_data=None):
         """Импортирует одно правило из файла (стандартный формат)"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                rule_data = json.load(f)
+            if rule_data is None:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    rule_data = json.load(f)
             
             rule_name = rule_data.get('name', os.path.basename(file_path))
             print(f"Правило: {rule_name}")
             
             # Получаем ID шаблона политики
-            template_id = self.get_policy_template_id()
+            template_id = self._import_template_id()
             if not template_id:
                 error_msg = "Не удалось получить ID шаблона политики"
                 print(f"❌ {error_msg}")
-                self.failed_files.append({
-                    'file': file_path,
-                    'rule': rule_name,
-                    'error': error_msg,
-                    'code': None,
-                    'response': None
-                })
+                self._record_failure(file_path, rule_name, error_msg, transient=True)
                 
                 if problem_dir:
                     self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -557,24 +1019,16 @@ class RulesManager(BaseManager):
                 rule_data['configuration']['actions'] = selected_action_ids
             
             # Получаем список существующих правил
-            existing_rules = self.get_existing_rules(template_id)
-            if existing_rules is None:
+            existing_rules_dict = self._import_existing_rules(template_id)
+            if existing_rules_dict is None:
                 error_msg = "Не удалось получить список существующих правил"
                 print(f"❌ {error_msg}")
-                self.failed_files.append({
-                    'file': file_path,
-                    'rule': rule_name,
-                    'error': error_msg,
-                    'code': None,
-                    'response': None
-                })
+                self._record_failure(file_path, rule_name, error_msg, transient=True)
                 
                 if problem_dir:
                     self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
                 return False
             
-            existing_rules_dict = {rule['name']: rule['id'] for rule in existing_rules if 'name' in rule and 'id' in rule}
-            
             if rule_name in existing_rules_dict:
                 # Обновление существующего правила
                 rule_id = existing_rules_dict[rule_name]
@@ -594,17 +1048,11 @@ class RulesManager(BaseManager):
                     update_data['enabled'] = True
                     print(f"  Состояние: включено (новое)")
                 
-                response = self.update_rule(template_id, rule_id, update_data)
+                response = self.api_client.update_user_rule_raw(template_id, rule_id, update_data)
                 if response is None:
                     error_msg = "Не удалось выполнить запрос на обновление (нет ответа от сервера)"
                     print(f"❌ {error_msg}")
-                    self.failed_files.append({
-                        'file': file_path,
-                        'rule': rule_name,
-                        'error': error_msg,
-                        'code': None,
-                        'response': None
-                    })
+                    self._record_failure(file_path, rule_name, error_msg, transient=True)
                     
                     if problem_dir:
                         self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -624,21 +1072,16 @@ class RulesManager(BaseManager):
                         print(f"✅ Правило '{rule_name}' успешно обновлено ({status_text})")
                     else:
                         print(f"✅ Правило '{rule_name}' успешно обновлено")
-                    self.success_files.append(file_path)
+                    self._register_success(file_path, rule_name, rule_id=rule_id)
                     return True
                 else:
                     # Используем ErrorHandler для обработки других ошибок
-                    if not self.api_client.error_handler.handle_common_error(response, f"Обновление правила '{rule_name}'"):
-                        self.failed_files.append({
-                            'file': file_path,
-                            'rule': rule_name,
-                            'error': f"Ошибка {response.status_code}",
-                            'code': response.status_code,
-                            'response': response.text[:200] if response.text else ""
-                        })
-                        
-                        if problem_dir:
-                            self._move_to_problem_directory(file_path, problem_dir, f"Ошибка {response.status_code}", response.text[:200] if response.text else "")
+                    # (временные ошибки повторяются из очереди, остальные 4xx окончательные)
+                    self.api_client.error_handler.handle_common_error(response, f"Обновление правила '{rule_name}'")
+                    self._record_failure(file_path, rule_name, f"Ошибка {response.status_code}", response.status_code, response.text[:200] if response.text else "")
+                    
+                    if problem_dir:
+                        self._move_to_problem_directory(file_path, problem_dir, f"Ошибка {response.status_code}", response.text[:200] if response.text else "")
                     return False
             else:
                 # Создание нового правила
@@ -648,17 +1091,13 @@ class RulesManager(BaseManager):
                 elif enable_after_import:
                     rule_data['enabled'] = True
                 
-                response = self.create_rule(template_id, rule_data)
+                # Отметка для очереди повтора: создание могло пройти, даже если ответа нет
+                self._outcome.creating = True
+                response = self.api_client.create_user_rule_raw(template_id, rule_data)
                 if response is None:
                     error_msg = "Не удалось выполнить запрос на создание (нет ответа от сервера)"
                     print(f"❌ {error_msg}")
-                    self.failed_files.append({
-                        'file': file_path,
-                        'rule': rule_name,
-                        'error': error_msg,
-                        'code': None,
-                        'response': None
-                    })
+                    self._record_failure(file_path, rule_name, error_msg, transient=True)
                     
                     if problem_dir:
                         self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -678,33 +1117,22 @@ class RulesManager(BaseManager):
                         print(f"✅ Правило '{rule_name}' успешно создано ({status_text})")
                     else:
                         print(f"✅ Правило '{rule_name}' успешно создано")
-                    self.success_files.append(file_path)
+                    self._register_success(file_path, rule_name, response=response)
                     return True
                 else:
                     # Используем ErrorHandler для обработки других ошибок
-                    if not self.api_client.error_handler.handle_common_error(response, f"Создание правила '{rule_name}'"):
-                        self.failed_files.append({
-                            'file': file_path,
-                            'rule': rule_name,
-                            'error': f"Ошибка {response.status_code}",
-                            'code': response.status_code,
-                            'response': response.text[:200] if response.text else ""
-                        })
-                        
-                        if problem_dir:
-                            self._move_to_problem_directory(file_path, problem_dir, f"Ошибка {response.status_code}", response.text[:200] if response.text else "")
+                    # (временные ошибки повторяются из очереди, остальные 4xx окончательные)
+                    self.api_client.error_handler.handle_common_error(response, f"Создание правила '{rule_name}'")
+                    self._record_failure(file_path, rule_name, f"Ошибка {response.status_code}", response.status_code, response.text[:200] if response.text else "")
+                    
+                    if problem_dir:
+                        self._move_to_problem_directory(file_path, problem_dir, f"Ошибка {response.status_code}", response.text[:200] if response.text else "")
                     return False
         
         except json.JSONDecodeError as e:
             error_msg = f"Ошибка чтения JSON: {str(e)}"
             print(f"❌ Ошибка при чтении файла {file_path}: {error_msg}")
-            self.failed_files.append({
-                'file': file_path,
-                'rule': os.path.basename(file_path),
-                'error': error_msg,
-                'code': None,
-                'response': None
-            })
+            self._record_failure(file_path, os.path.basename(file_path), error_msg)
             
             if problem_dir:
                 self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -712,29 +1140,25 @@ class RulesManager(BaseManager):
         except Exception as e:
             error_msg = f"Неожиданная ошибка: {str(e)}"
             print(f"❌ Неожиданная ошибка при обработке файла {file_path}: {error_msg}")
-            self.failed_files.append({
-                'file': file_path,
-                'rule': os.path.basename(file_path),
-                'error': error_msg,
-                'code': None,
-                'response': None
-            })
+            self._record_failure(file_path, os.path.basename(file_path), error_msg)
             
             if problem_dir:
                 self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
             return False
 
     def import_single_rule_with_actions(self, file_path, action_mapping=None, enable_after_import=False, 
-                                        preserve_state=False, problem_dir=None):
+                                        preserve_state=False, problem_dir=None, import_data=None):
         """Импортирует одно правило из файла с восстановлением связей с действиями"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                import_data = json.load(f)
+            if import_data is None:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    import_data = json.load(f)
             
             # Проверяем формат файла
             if 'rule_data' not in import_data or 'actions_info' not in import_data:
                 print(f"Файл {os.path.basename(file_path)} имеет неверный формат для импорта с действиями")
-                return self.import_single_rule(file_path, None, enable_after_import, preserve_state, problem_dir)
+                return self.import_single_rule(file_path, None, enable_after_import, preserve_state, problem_dir,
+                                               rule_data=import_data)
             
             rule_data = import_data['rule_data']
             actions_info = import_data['actions_info']
@@ -752,17 +1176,11 @@ class RulesManager(BaseManager):
                                     'enabled' in rule_data)
             
             # Получаем ID шаблона политики
-            template_id = self.get_policy_template_id()
+            template_id = self._import_template_id()
             if not template_id:
                 error_msg = "Не удалось получить ID шаблона политики"
                 print(f"❌ {error_msg}")
-                self.failed_files.append({
-                    'file': file_path,
-                    'rule': rule_name,
-                    'error': error_msg,
-                    'code': None,
-                    'response': None
-                })
+                self._record_failure(file_path, rule_name, error_msg, transient=True)
                 
                 if problem_dir:
                     self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -783,11 +1201,8 @@ class RulesManager(BaseManager):
                         # Пытаемся найти действие по информации из файла
                         action_info = actions_info.get(str(original_action_id))
                         if action_info:
-                            # Используем ActionsManager для поиска/создания
-                            from actions_manager import ActionsManager
-                            actions_manager = ActionsManager(self.api_client)
-                            
-                            target_action = actions_manager.find_or_create_action(action_info)
+                            # Ищем/создаем действие через общий индекс тенанта
+                            target_action = self._get_action_index().find_or_create(action_info)
                             if target_action:
                                 restored_action_ids.append(target_action.get('id'))
                                 action_mapping[str(original_action_id)] = target_action.get('id')
@@ -802,11 +1217,8 @@ class RulesManager(BaseManager):
                         action_type_id = action_info.get('type_id')
                         
                         if action_name and action_type_id:
-                            # Используем ActionsManager для поиска/создания
-                            from actions_manager import ActionsManager
-                            actions_manager = ActionsManager(self.api_client)
-                            
-                            target_action = actions_manager.find_or_create_action(action_info)
+                            # Ищем/создаем действие через общий индекс тенанта
+                            target_action = self._get_action_index().find_or_create(action_info)
                             if target_action:
                                 restored_action_ids.append(target_action.get('id'))
                             else:
@@ -821,24 +1233,16 @@ class RulesManager(BaseManager):
             rule_data['configuration']['actions'] = restored_action_ids
             
             # Получаем список существующих правил
-            existing_rules = self.get_existing_rules(template_id)
-            if existing_rules is None:
+            existing_rules_dict = self._import_existing_rules(template_id)
+            if existing_rules_dict is None:
                 error_msg = "Не удалось получить список существующих правил"
                 print(f"❌ {error_msg}")
-                self.failed_files.append({
-                    'file': file_path,
-                    'rule': rule_name,
-                    'error': error_msg,
-                    'code': None,
-                    'response': None
-                })
+                self._record_failure(file_path, rule_name, error_msg, transient=True)
                 
                 if problem_dir:
                     self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
                 return False
             
-            existing_rules_dict = {rule['name']: rule['id'] for rule in existing_rules if 'name' in rule and 'id' in rule}
-            
             if rule_name in existing_rules_dict:
                 # Обновление существующего правила
                 rule_id = existing_rules_dict[rule_name]
@@ -858,17 +1262,11 @@ class RulesManager(BaseManager):
                     update_data['enabled'] = True
                     print(f"  Состояние: включено (новое)")
                 
-                response = self.update_rule(template_id, rule_id, update_data)
+                response = self.api_client.update_user_rule_raw(template_id, rule_id, update_data)
                 if response is None:
                     error_msg = "Не удалось выполнить запрос на обновление (нет ответа от сервера)"
                     print(f"❌ {error_msg}")
-                    self.failed_files.append({
-                        'file': file_path,
-                        'rule': rule_name,
-                        'error': error_msg,
-                        'code': None,
-                        'response': None
-                    })
+                    self._record_failure(file_path, rule_name, error_msg, transient=True)
                     
                     if problem_dir:
                         self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -881,18 +1279,12 @@ class RulesManager(BaseManager):
                         print(f"✅ Правило '{rule_name}' успешно обновлено ({status_text}, {action_text})")
                     else:
                         print(f"✅ Правило '{rule_name}' успешно обновлено ({action_text})")
-                    self.success_files.append(file_path)
+                    self._register_success(file_path, rule_name, rule_id=rule_id)
                     return True
                 else:
                     error_msg = f"Ошибка {response.status_code}"
                     print(f"❌ {error_msg} при обновлении правила '{rule_name}'")
-                    self.failed_files.append({
-                        'file': file_path,
-                        'rule': rule_name,
-                        'error': error_msg,
-                        'code': response.status_code,
-                        'response': response.text[:200] if response.text else ""
-                    })
+                    self._record_failure(file_path, rule_name, error_msg, response.status_code, response.text[:200] if response.text else "")
                     
                     if problem_dir:
                         self._move_to_problem_directory(file_path, problem_dir, error_msg, response.text[:200] if response.text else "")
@@ -905,17 +1297,13 @@ class RulesManager(BaseManager):
                 elif enable_after_import:
                     rule_data['enabled'] = True
                 
-                response = self.create_rule(template_id, rule_data)
+                # Отметка для очереди повтора: создание могло пройти, даже если ответа нет
+                self._outcome.creating = True
+                response = self.api_client.create_user_rule_raw(template_id, rule_data)
                 if response is None:
                     error_msg = "Не удалось выполнить запрос на создание (нет ответа от сервера)"
                     print(f"❌ {error_msg}")
-                    self.failed_files.append({
-                        'file': file_path,
-                        'rule': rule_name,
-                        'error': error_msg,
-                        'code': None,
-                        'response': None
-                    })
+                    self._record_failure(file_path, rule_name, error_msg, transient=True)
                     
                     if problem_dir:
                         self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -928,18 +1316,12 @@ class RulesManager(BaseManager):
                         print(f"✅ Правило '{rule_name}' успешно создано ({status_text}, {action_text})")
                     else:
                         print(f"✅ Правило '{rule_name}' успешно создано ({action_text})")
-                    self.success_files.append(file_path)
+                    self._register_success(file_path, rule_name, response=response)
                     return True
                 else:
                     error_msg = f"Ошибка {response.status_code}"
                     print(f"❌ {error_msg} при создании правила '{rule_name}'")
-                    self.failed_files.append({
-                        'file': file_path,
-                        'rule': rule_name,
-                        'error': error_msg,
-                        'code': response.status_code,
-                        'response': response.text[:200] if response.text else ""
-                    })
+                    self._record_failure(file_path, rule_name, error_msg, response.status_code, response.text[:200] if response.text else "")
                     
                     if problem_dir:
                         self._move_to_problem_directory(file_path, problem_dir, error_msg, response.text[:200] if response.text else "")
@@ -948,13 +1330,7 @@ class RulesManager(BaseManager):
         except json.JSONDecodeError as e:
             error_msg = f"Ошибка чтения JSON: {str(e)}"
             print(f"❌ Ошибка при чтении файла {file_path}: {error_msg}")
-            self.failed_files.append({
-                'file': file_path,
-                'rule': os.path.basename(file_path),
-                'error': error_msg,
-                'code': None,
-                'response': None
-            })
+            self._record_failure(file_path, os.path.basename(file_path), error_msg)
             
             if problem_dir:
                 self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
@@ -962,29 +1338,264 @@ class RulesManager(BaseManager):
         except Exception as e:
             error_msg = f"Неожиданная ошибка: {str(e)}"
             print(f"❌ Неожиданная ошибка при обработке файла {file_path}: {error_msg}")
-            self.failed_files.append({
-                'file': file_path,
-                'rule': os.path.basename(file_path),
-                'error': error_msg,
-                'code': None,
-                'response': None
-            })
+            self._record_failure(file_path, os.path.basename(file_path), error_msg)
             
             if problem_dir:
                 self._move_to_problem_directory(file_path, problem_dir, error_msg, None)
             return False
 
 
-    def import_rules(self, directory_path, include_actions=False, preserve_state=False):
-        """Импортирует правила из указанной директории"""
-        if not os.path.isdir(directory_path):
-            print(f"Директория не найдена: {directory_path}")
+    def _import_source_entry(self, source, filename, include_actions, selected_action_ids,
+                             enable_after_import, preserve_state, problem_dir):
+        """Импортирует одну запись из директории или пакета правил"""
+        if not isinstance(source, RuleBundleReader):
+            file_path = os.path.abspath(os.path.join(source.directory_path, filename))
+            if include_actions:
+                # Импорт с восстановлением действий
+                return self.import_single_rule_with_actions(file_path, None, enable_after_import,
+                                                            preserve_state, problem_dir)
+            # Стандартный импорт
+            return self.import_single_rule(file_path, selected_action_ids, enable_after_import,
+                                           preserve_state, problem_dir)
+        
+        # Запись пакета читается прямо из архива, без распаковки на диск
+        entry_label = f"{os.path.abspath(source.bundle_path)}::{filename}"
+        try:
+            data = source.read_file(filename)
+        except Exception as e:
+            error_msg = f"Ошибка чтения записи пакета: {str(e)}"
+            print(f"{filename}: {error_msg}")
+            self._record_failure(entry_label, 'N/A', error_msg)
             return False
         
-        # Сбрасываем списки файлов перед новым импортом
-        self.failed_files = []
-        self.success_files = []
+        if include_actions:
+            success = self.import_single_rule_with_actions(entry_label, None, enable_after_import,
+                                                           preserve_state, None, import_data=data)
+        else:
+            success = self.import_single_rule(entry_label, selected_action_ids, enable_after_import,
+                                              preserve_state, None, rule_data=data)
+        
+        if not success and problem_dir:
+            self._save_bundle_entry_to_problem_directory(source, filename, problem_dir)
+        return success
+
+    def _import_files(self, source, filenames, journal, include_actions, selected_action_ids,
+                      enable_after_import, preserve_state, problem_dir):
+        """Импортирует файлы по очереди, фиксируя каждый шаг в журнале импорта
+        
+        Файлы с временными ошибками откладываются и повторяются в конце,
+        в problem директорию попадают только окончательные ошибки.
+        """
+        entry_args = (include_actions, selected_action_ids, enable_after_import, preserve_state, problem_dir)
+        success_count = 0
+        self._retry_queue = RetryQueue()
+        self._pending_creates = {}
+        try:
+            for i, filename in enumerate(filenames, 1):
+                print(f"\n[{i}/{len(filenames)}] ", end="")
+                journal.begin(filename)
+                success, rule_id, failure = self._import_entry_outcome(source, filename, entry_args)
+                if self._apply_entry_outcome(journal, filename, success, rule_id, failure):
+                    success_count += 1
+            
+            success_count += self._process_retry_queue(source, journal, entry_args)
+        except KeyboardInterrupt:
+            print(f"\n\n⚠️ Импорт прерван. Прогресс сохранен в журнале: {journal.journal_path}")
+            print("Для продолжения запустите импорт повторно с опцией --resume")
+        finally:
+            self._retry_queue = None
+        return success_count
+    
+    def _import_entry_outcome(self, source, filename, entry_args):
+        """Импортирует запись и возвращает (успех, ID правила, ошибка) текущего потока"""
+        self._outcome.rule_id = None
+        self._outcome.failure = None
+        self._outcome.creating = False
+        success = self._import_source_entry(source, filename, *entry_args)
+        return success, self._outcome.rule_id, self._last_failure()
+    
+    def _apply_entry_outcome(self, journal, filename, success, rule_id, failure):
+        """Фиксирует результат записи в журнале, временные ошибки ставит в очередь повтора"""
+        if success:
+            journal.commit(filename, rule_id=rule_id)
+            return True
+        journal.fail(filename, error=failure['error'] if failure else None)
+        if failure and failure['transient'] and self._retry_queue is not None:
+            self._retry_queue.add(filename)
+            if failure['create']:
+                self._pending_creates[filename] = failure
+        return False
+    
+    def _refresh_import_rules(self):
+        """Перечитывает список правил шаблона в контексте импорта, возвращает успех"""
+        with self._state_lock:
+            context = self._import_context
+        if context is None:
+            return False
+        existing_rules = self.get_existing_rules(context['template_id'])
+        if existing_rules is None:
+            return False
+        with self._state_lock:
+            context['rules'].update({rule['name']: rule['id'] for rule in existing_rules
+                                     if 'name' in rule and 'id' in rule})
+        return True
+    
+    def _verify_pending_creates(self, filenames):
+        """Готовит повтор неудавшихся созданий, возвращает файлы, которые можно повторить
+        
+        Правило могло быть создано, хотя ответ не получен или содержит 5xx:
+        перед повтором список правил перечитывается, и такое правило будет
+        обновлено, а не создано повторно. Если список получить не удалось,
+        повтор создания пропускается и ошибка считается окончательной.
+        """
+        creates = [name for name in filenames if name in self._pending_creates]
+        if not creates or self._refresh_import_rules():
+            for filename in creates:
+                self._pending_creates.pop(filename, None)
+            return filenames
+        
+        print(f"⚠️ Не удалось обновить список правил, повтор создания {len(creates)} правил пропущен")
+        for filename in creates:
+            failure = self._pending_creates.pop(filename)
+            self.report.record_failure(filename, failure['rule'],
+                                       f"Правило могло быть создано, повтор пропущен: {failure['error']}",
+                                       failure['code'], failure['response'])
+        return [name for name in filenames if name not in creates]
+    
+    def _process_retry_queue(self, source, journal, entry_args):
+        """Повторяет отложенные файлы раундами с паузой, внутри раунда - параллельно"""
+        queue = self._retry_queue
+        success_count = 0
+        for round_number, is_last, filenames in queue.rounds():
+            filenames = self._verify_pending_creates(filenames)
+            if is_last:
+                # В последнем раунде ошибки окончательные и попадают в problem директорию
+                self._retry_queue = None
+            for filename in filenames:
+                journal.begin(filename)
+            results = queue.run(lambda name: self._import_entry_outcome(source, name, entry_args), filenames)
+            for filename, (success, rule_id, failure) in results:
+                if self._apply_entry_outcome(journal, filename, success, rule_id, failure):
+                    success_count += 1
+        
+        if success_count:
+            print(f"\nПосле повтора импортировано файлов: {success_count}")
+        return success_count
+
+    def _read_source_rule_name(self, source, filename):
+        """Читает имя правила из файла источника (для сверки журнала)"""
+        try:
+            return rule_name_from_data(source.read_file(filename), None)
+        except Exception:
+            return None
+
+    def _source_matches_server(self, source, filename, template_id, rule_id):
+        """Проверяет, что код и параметры правила на сервере совпадают с файлом (импорт уже выполнен)"""
+        try:
+            data = source.read_file(filename)
+        except Exception:
+            return False
+        rule_data = data.get('rule_data', data) if isinstance(data, dict) else {}
+        server_rule = self.get_rule_details(template_id, rule_id)
+        if not server_rule:
+            return False
+        expected = rule_data.get('configuration', {}) or {}
+        actual = server_rule.get('configuration', {}) or {}
+        # Действия сравнить нельзя: при импорте они сопоставляются с действиями тенанта и получают другие ID
+        return all(expected.get(key) == actual.get(key) for key in ('code', 'parameters') if key in expected)
+
+    def _resume_from_journal(self, journal, source, json_files, template_id):
+        """Сверяет незавершенные записи журнала с сервером и убирает импортированные файлы"""
+        if journal.in_doubt:
+            print(f"\nЗаписей журнала без подтверждения: {len(journal.in_doubt)}, сверка с сервером...")
+            existing_rules_dict = self._import_existing_rules(template_id)
+            if existing_rules_dict is None:
+                print("⚠️ Не удалось получить список правил, такие файлы будут импортированы повторно")
+            else:
+                confirmed = journal.reconcile(
+                    existing_rules_dict,
+                    lambda filename: self._read_source_rule_name(source, filename),
+                    lambda filename, rule_id: self._source_matches_server(source, filename, template_id, rule_id))
+                print(f"Подтверждено по данным сервера: {confirmed}")
+        
+        return [f for f in json_files if not journal.is_committed(f)]
+
+    def import_rules(self, directory_path, include_actions=False, preserve_state=False, resume=None):
+        """Импортирует правила из указанной директории или пакета .ptafbundle
+        
+        resume: True - продолжить по журналу, False - начать заново,
+        None - спросить, если найден журнал прерванного импорта.
+        """
+        is_bundle = is_bundle_path(directory_path) and os.path.isfile(directory_path)
+        if not is_bundle and not os.path.isdir(directory_path):
+            print(f"Директория или пакет правил не найдены: {directory_path}")
+            return False
+        
+        source = open_rule_source(directory_path)
+        journal = ImportJournal(journal_path_for(directory_path))
+        try:
+            return self._import_rules_from_source(source, journal, directory_path, include_actions,
+                                                  preserve_state, resume)
+        finally:
+            self.end_import_context()
+            # Журнал успешного импорта удаляется, иначе следующий импорт предложит его продолжить
+            journal.finish()
+            source.close()
+
+    def _preflight_validate(self, source, json_files, include_actions, report_dir, problem_dir):
+        """Проверяет файлы правил до начала сетевого импорта, возвращает корректные"""
+        print(f"\nПроверка {len(json_files)} файлов перед импортом...")
+        report = RuleValidator().validate(source, json_files, include_actions)
+        print_validation_report(report)
+        if not report['invalid']:
+            return json_files
+        
+        save_validation_report(report, report_dir)
+        if not report['valid']:
+            print("Нет корректных файлов для импорта")
+            return []
+        
+        choice = input("\nПродолжить импорт только корректных файлов? (y/n): ").lower()
+        if choice != 'y':
+            print("Импорт отменен")
+            return []
+        
+        # Некорректные файлы сразу попадают в отчет и problem директорию
+        is_bundle = isinstance(source, RuleBundleReader)
+        for item in report['invalid']:
+            error_msg = "; ".join(item['errors'])
+            if is_bundle:
+                file_label = f"{os.path.abspath(source.bundle_path)}::{item['file']}"
+            else:
+                file_label = os.path.abspath(os.path.join(source.directory_path, item['file']))
+            self._record_failure(file_label, item['rule'], error_msg)
+            
+            if problem_dir:
+                if is_bundle:
+                    self._save_bundle_entry_to_problem_directory(source, item['file'], problem_dir)
+                else:
+                    self._move_to_problem_directory(file_label, problem_dir, error_msg, None)
+        
+        return report['valid']
+
+    def _import_rules_from_source(self, source, journal, directory_path, include_actions, preserve_state,
+                                  resume=None):
+        """Интерактивный импорт правил из открытого источника"""
+        source_path = os.path.abspath(directory_path)
+        # Отчет и проблемные файлы пакета сохраняются рядом с ним
+        if isinstance(source, RuleBundleReader):
+            directory_path = os.path.dirname(os.path.abspath(directory_path))
+        
+        # Каждый импорт пишет свой отчет, внешние инструменты могут читать его по ходу работы
+        self._start_report(os.path.join(directory_path, "import_report.jsonl"), "import", {
+            'source': source_path,
+            'tenant_id': self.api_client.auth_manager.tenant_id,
+            'include_actions': include_actions,
+            'preserve_state': preserve_state
+        })
         self.problem_dir_created = False
+        # Индекс действий строится заново для каждого импорта
+        self._action_indexes = {}
         
         # Сохраняем текущий тенант для возможного восстановления
         original_tenant_id = self.api_client.auth_manager.tenant_id
@@ -992,6 +1603,36 @@ class RulesManager(BaseManager):
         # Создаем директорию для проблемных файлов
         problem_dir = self._create_problem_directory(directory_path)
         
+        # Получаем список файлов правил в директории или пакете
+        json_files = source.list_files()
+        
+        if not json_files:
+            print("В указанном источнике нет .ptafpro файлов")
+            return False
+        
+        # Журнал импорта позволяет продолжить прерванный импорт
+        if resume is None and ImportJournal.exists_for(source_path):
+            choice = input("\nНайден журнал прерванного импорта. Продолжить с места остановки? (y/n): ").lower()
+            resume = choice == 'y'
+        if journal.open(resume, {"source": source_path, "tenant_id": original_tenant_id}) is None:
+            print(f"❌ Журнал прерванного импорта относится к другому тенанту "
+                  f"({journal.metadata.get('tenant_id')}), продолжение невозможно. "
+                  f"Выберите тенант журнала или начните импорт заново")
+            return False
+        
+        if resume:
+            done_count = len([f for f in json_files if journal.is_committed(f)])
+            json_files = [f for f in json_files if not journal.is_committed(f)]
+            print(f"\nПродолжение импорта: пропущено ранее импортированных файлов: {done_count}")
+            if not json_files and not journal.in_doubt:
+                print("✅ Все файлы уже импортированы")
+                return True
+        
+        # Проверяем все файлы до любых обращений к API
+        json_files = self._preflight_validate(source, json_files, include_actions, directory_path, problem_dir)
+        if not json_files:
+            return False
+        
         # Определяем, нужно ли спрашивать о действиях
         ask_about_actions = not include_actions
         
@@ -1007,6 +1648,23 @@ class RulesManager(BaseManager):
         
         print(f"\nИспользуется шаблон политики с ID: {template_id}")
         
+        # Шаблон и список правил запрашиваются один раз на весь импорт
+        if not self.begin_import_context(template_id):
+            print("Не удалось получить список существующих правил")
+            if original_tenant_id:
+                self.api_client.auth_manager.tenant_id = original_tenant_id
+                self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
+            return False
+        
+        if resume:
+            json_files = self._resume_from_journal(journal, source, json_files, template_id)
+            if not json_files:
+                print("✅ Все файлы уже импортированы")
+                if original_tenant_id:
+                    self.api_client.auth_manager.tenant_id = original_tenant_id
+                    self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
+                return True
+        
         selected_action_ids = None
         
         # Если не импортируем с действиями, спрашиваем о выборе действий
@@ -1064,17 +1722,6 @@ class RulesManager(BaseManager):
         else:
             print("\nСостояние правил будет сохранено из исходных файлов")
         
-        # Получаем список JSON файлов в директории
-        json_files = [f for f in os.listdir(directory_path) if f.endswith('.ptafpro')]
-        
-        if not json_files:
-            print("В указанной директории нет .ptafpro файлов")
-            # Восстанавливаем исходный тенант
-            if original_tenant_id:
-                self.api_client.auth_manager.tenant_id = original_tenant_id
-                self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
-            return False
-        
         # Выводим список файлов для выбора
         print("\nДоступные файлы для импорта:")
         for i, filename in enumerate(json_files, 1):
@@ -1091,21 +1738,9 @@ class RulesManager(BaseManager):
             
             if choice == '1':
                 # Импорт всех файлов
-                success_count = 0
-                for i, filename in enumerate(json_files, 1):
-                    print(f"\n[{i}/{len(json_files)}] ", end="")
-                    file_path = os.path.abspath(os.path.join(directory_path, filename))
-                    
-                    if include_actions:
-                        # Импорт с восстановлением действий
-                        if self.import_single_rule_with_actions(file_path, enable_after_import, 
-                                                               preserve_state, problem_dir):
-                            success_count += 1
-                    else:
-                        # Стандартный импорт
-                        if self.import_single_rule(file_path, selected_action_ids, enable_after_import,
-                                                  preserve_state, problem_dir):
-                            success_count += 1
+                success_count = self._import_files(source, json_files, journal, include_actions,
+                                                   selected_action_ids, enable_after_import,
+                                                   preserve_state, problem_dir)
                 
                 # Восстанавливаем исходный тенант
                 if original_tenant_id:
@@ -1113,7 +1748,7 @@ class RulesManager(BaseManager):
                     self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
                 
                 # Выводим итоговую статистику
-                fail_count = len(self.failed_files)
+                fail_count = self.report.failure_count
                 total_count = len(json_files)
                 
                 print(f"\nИтог:")
@@ -1140,22 +1775,10 @@ class RulesManager(BaseManager):
                         print("Некорректные номера файлов")
                         continue
                     
-                    success_count = 0
-                    for i, index in enumerate(valid_indices, 1):
-                        print(f"\n[{i}/{len(valid_indices)}] ", end="")
-                        filename = json_files[index]
-                        file_path = os.path.abspath(os.path.join(directory_path, filename))
-                        
-                        if include_actions:
-                            # Импорт с восстановлением действий
-                            if self.import_single_rule_with_actions(file_path, enable_after_import,
-                                                                   preserve_state, problem_dir):
-                                success_count += 1
-                        else:
-                            # Стандартный импорт
-                            if self.import_single_rule(file_path, selected_action_ids, enable_after_import,
-                                                      preserve_state, problem_dir):
-                                success_count += 1
+                    selected_files = [json_files[index] for index in valid_indices]
+                    success_count = self._import_files(source, selected_files, journal, include_actions,
+                                                       selected_action_ids, enable_after_import,
+                                                       preserve_state, problem_dir)
                     
                     # Восстанавливаем исходный тенант
                     if original_tenant_id:
@@ -1193,12 +1816,12 @@ class RulesManager(BaseManager):
 
     def print_failed_files(self):
         """Выводит список проблемных файлов с причинами ошибок"""
-        if not self.failed_files:
+        if not self.report.failure_count:
             print("\nНет проблемных файлов!")
             return
         
         print("\nСписок проблемных файлов:")
-        for i, fail in enumerate(self.failed_files, 1):
+        for i, fail in enumerate(self.report.iter_failures(), 1):
             print(f"{i}. {fail['file']}")
             print(f"   Правило: {fail['rule']}")
             print(f"   Причина: {fail['error']}")
@@ -1215,10 +1838,11 @@ class RulesManager(BaseManager):
             print("1. Импорт правил")
             print("2. Экспорт правил")
             print("3. Копирование правил в другой тенант")
-            print("4. (Опасное) Удалить все пользовательские правила")
-            print("5. Вернуться в главное меню")
+            print("4. Массовое включение/выключение правил")
+            print("5. (Опасное) Удалить все пользовательские правила")
+            print("6. Вернуться в главное меню")
             
-            choice = input("\nВыберите действие (1-5): ")
+            choice = input("\nВыберите действие (1-6): ")
             
             if choice == '1':
                 self._import_rules_menu()
@@ -1227,8 +1851,10 @@ class RulesManager(BaseManager):
             elif choice == '3':
                 self._copy_rules_menu()
             elif choice == '4':
-                self._delete_all_rules_menu()
+                self._bulk_state_menu()
             elif choice == '5':
+                self._delete_all_rules_menu()
+            elif choice == '6':
                 return
             else:
                 print("Некорректный выбор. Попробуйте снова.")
@@ -1244,9 +1870,10 @@ class RulesManager(BaseManager):
             print("Не удалось выбрать тенант")
             return
         
-        source_dir = input("Введите путь к директории с JSON файлами: ").strip()
-        if not source_dir or not os.path.isdir(source_dir):
-            print("Указанная директория не существует")
+        source_dir = input("Введите путь к директории с JSON файлами или пакету .ptafbundle: ").strip()
+        if not source_dir or not (os.path.isdir(source_dir) or
+                                  (is_bundle_path(source_dir) and os.path.isfile(source_dir))):
+            print("Указанная директория или пакет правил не существует")
             return
         
         # Спрашиваем, нужно ли сохранить связи с действиями
@@ -1301,12 +1928,12 @@ class RulesManager(BaseManager):
                 print("Состояние правил НЕ будет сохранено")
         
         if include_actions:
-            export_dir = input("Введите путь для экспорта [exported_rules_with_actions]: ").strip()
+            export_dir = input("Введите путь для экспорта (директория или файл .ptafbundle) [exported_rules_with_actions]: ").strip()
             if not export_dir:
                 export_dir = "exported_rules_with_actions"
             self.export_rules_with_actions(export_dir, preserve_state)
         else:
-            export_dir = input("Введите путь для экспорта [exported_rules]: ").strip()
+            export_dir = input("Введите путь для экспорта (директория или файл .ptafbundle) [exported_rules]: ").strip()
             if not export_dir:
                 export_dir = "exported_rules"
             self.export_rules(export_dir, preserve_state)
@@ -1366,100 +1993,17 @@ class RulesManager(BaseManager):
         
         print(f"\nКопирование правил из '{source_tenant_name}' в '{target_tenant_name}'...")
         
-        # Создаем временную директорию для экспорта
-        temp_dir = tempfile.mkdtemp()
-        
+        # Правила передаются из тенанта в тенант в памяти, без временных файлов
+        from rule_copy import RuleCopyPipeline
+        pipeline = RuleCopyPipeline(self.api_client, include_actions, preserve_state)
         try:
-            # Переключаемся на исходный тенант и экспортируем правила
-            original_tenant_id = self.api_client.auth_manager.tenant_id
-            
-            self.api_client.auth_manager.tenant_id = source_tenant_id
-            if not self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request):
-                print(f"Не удалось переключиться на исходный тенант {source_tenant_id}")
-                return False
-            
-            if include_actions:
-                export_result = self.export_rules_with_actions(temp_dir, preserve_state)
-            else:
-                export_result = self.export_rules(temp_dir, preserve_state)
-            
-            if not export_result:
-                print("Не удалось экспортировать правила из исходного тенанта")
-                self.api_client.auth_manager.tenant_id = original_tenant_id
-                self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
-                return False
-            
-            # Если нужно копировать с действиями, создаем маппинг действий
-            action_mapping = {}
-            if include_actions:
-                from actions_manager import ActionsManager
-                actions_manager = ActionsManager(self.api_client)
-                action_mapping = actions_manager.copy_actions_between_tenants(source_tenant_id, target_tenant_id)
-            
-            # Переключаемся на целевой тенант и импортируем правила
-            self.api_client.auth_manager.tenant_id = target_tenant_id
-            if not self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request):
-                print(f"Не удалось переключиться на целевой тенант {target_tenant_id}")
-                self.api_client.auth_manager.tenant_id = original_tenant_id
-                self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
-                return False
-            
-            # Импортируем правила
-            success_count = 0
-            total_files = 0
-            
-            for filename in os.listdir(temp_dir):
-                if filename.endswith('.ptafpro'):
-                    total_files += 1
-                    file_path = os.path.join(temp_dir, filename)
-                    print(f"\nИмпорт файла {filename} ({total_files})...")
-                    
-                    if include_actions:
-                        success = self.import_single_rule_with_actions(
-                            file_path, action_mapping, False, preserve_state, None
-                        )
-                    else:
-                        success = self.import_single_rule(
-                            file_path, None, False, preserve_state, None
-                        )
-                    
-                    if success:
-                        success_count += 1
-            
-            # Восстанавливаем исходный тенант
-            self.api_client.auth_manager.tenant_id = original_tenant_id
-            self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
-            
-            # Удаляем временную директорию
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
-            
-            print(f"\nИтог копирования:")
-            print(f"Успешно импортировано: {success_count} из {total_files} правил")
-            print(f"Маппинг действий создан для: {len(action_mapping)} действий")
-            
-            if success_count > 0:
+            if pipeline.copy(source_tenant_id, target_tenant_id, source_tenant_name, target_tenant_name):
                 print(f"✅ Правила успешно скопированы из '{source_tenant_name}' в '{target_tenant_name}'")
                 return True
-            else:
-                print(f"❌ Не удалось скопировать правила")
-                return False
-            
+            print(f"❌ Не удалось скопировать правила")
+            return False
         except Exception as e:
             print(f"Ошибка при копировании правил: {e}")
-            # Восстанавливаем исходный тенант
-            if 'original_tenant_id' in locals():
-                self.api_client.auth_manager.tenant_id = original_tenant_id
-                self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
-            
-            # Удаляем временную директорию
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
-            
             return False
 
     def _delete_all_rules_menu(self):
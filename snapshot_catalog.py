@@ -0,0 +1,299 @@
+# snapshot_catalog.py
+import os
+import json
+import hashlib
+import sqlite3
+import zipfile
+import threading
+
+CATALOG_PATH = "snapshot_catalog.sqlite3"
+TIMESTAMP_FORMAT = "%Y-%m-%d-%H-%M-%S"
+
+RESOURCE_FILE_SUFFIXES = {
+    'snapshot': '-snapshot.json',
+    'backends': '-backends.json',
+    'roles': '-roles.json',
+    'custom_actions': '-custom_actions.json'
+}
+TRAFFIC_SETTINGS_DIR = "traffic_settings"
+TRAFFIC_SETTINGS_SUFFIXES = {'traffic_settings': '-traffic_settings.json'}
+
+# Файл внутри архива записывается в каталог как "<архив>::<имя файла>"
+ARCHIVE_MEMBER_SEPARATOR = "::"
+ARCHIVE_PREFIX = "archive-"
+ARCHIVE_SUFFIX = ".zip"
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tenant_id TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    size INTEGER,
+    checksum TEXT,
+    path TEXT NOT NULL,
+    storage TEXT NOT NULL,
+    UNIQUE (path, resource)
+);
+CREATE INDEX IF NOT EXISTS snapshots_by_tenant ON snapshots (tenant_id, resource, timestamp);
+CREATE INDEX IF NOT EXISTS snapshots_by_time ON snapshots (timestamp);
+CREATE INDEX IF NOT EXISTS snapshots_by_checksum ON snapshots (checksum);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# Отметка о том, что в каталог уже записаны снапшоты, сохраненные до его появления
+BACKFILLED_KEY = "backfilled"
+
+
+def format_timestamp(moment):
+    """Время в формате каталога (совпадает с форматом имен файлов снапшотов)"""
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def archive_member_path(archive_path, member):
+    return f"{archive_path}{ARCHIVE_MEMBER_SEPARATOR}{member}"
+
+
+def split_archive_path(path):
+    """Возвращает (архив, имя файла) для файла внутри архива или (path, None)"""
+    archive_path, separator, member = path.partition(ARCHIVE_MEMBER_SEPARATOR)
+    return (archive_path, member) if separator else (path, None)
+
+
+def snapshot_path_exists(path):
+    """Проверяет наличие файла снапшота, в том числе внутри архива"""
+    archive_path, member = split_archive_path(path)
+    if member is None:
+        return os.path.exists(path)
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            archive.getinfo(member)
+        return True
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+
+
+def load_snapshot_file(path):
+    """Читает JSON файл снапшота, в том числе из архива"""
+    archive_path, member = split_archive_path(path)
+    if member is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    with zipfile.ZipFile(archive_path) as archive:
+        return json.loads(archive.read(member).decode('utf-8'))
+
+
+class SnapshotCatalog:
+    """Индекс сохраненных снапшотов в SQLite
+
+    Каждое сохранение ресурса (файл или манифест хранилища) записывается в
+    каталог с тенантом, типом ресурса, временем, размером, контрольной суммой
+    и путем. Поиск по тенанту, периоду, типу и контрольной сумме выполняется
+    по индексам, без обхода директорий, в том числе по всем тенантам сразу.
+    """
+
+    def __init__(self, db_path=CATALOG_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        # Одно соединение на процесс, запись из потоков сборщика - под блокировкой
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # ==================== ЗАПИСЬ ====================
+
+    def record(self, tenant_id, resource, timestamp, path, storage, size=None, checksum=None):
+        """Добавляет (или обновляет) запись о сохраненном ресурсе"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO snapshots (tenant_id, resource, timestamp, size, checksum, path, storage) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(tenant_id), resource, timestamp, size, checksum, path, storage))
+
+    def remove(self, path):
+        """Удаляет записи о файле или манифесте"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM snapshots WHERE path = ?", (path,))
+
+    def move(self, old_path, new_path):
+        """Переносит записи на новый путь (файл перемещен в архив)"""
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE OR REPLACE snapshots SET path = ? WHERE path = ?", (new_path, old_path))
+
+    def is_backfilled(self):
+        """Записаны ли в каталог снапшоты, сохраненные до его появления (см. rebuild)"""
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM meta WHERE key = ?", (BACKFILLED_KEY,)).fetchone() \
+                is not None
+
+    def _mark_backfilled(self):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')", (BACKFILLED_KEY,))
+
+    # ==================== ПОИСК ====================
+
+    def query(self, tenant_id=None, resource=None, since=None, until=None, checksum=None, storage=None,
+              limit=None):
+        """Ищет записи по фильтрам (since/until - datetime), возвращает словари от новых к старым"""
+        conditions = []
+        params = []
+        for column, value in (('tenant_id', tenant_id), ('resource', resource), ('checksum', checksum),
+                              ('storage', storage)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(str(value))
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(format_timestamp(since))
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(format_timestamp(until))
+
+        sql = "SELECT tenant_id, resource, timestamp, size, checksum, path, storage FROM snapshots"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(sql, params).fetchall()]
+
+    def latest(self, tenant_id, resource):
+        """Последняя запись о ресурсе тенанта или None"""
+        rows = self.query(tenant_id=tenant_id, resource=resource, limit=1)
+        return rows[0] if rows else None
+
+    def checksum_of(self, path, resource='snapshot'):
+        """Контрольная сумма ресурса по пути файла или манифеста (None, если неизвестна)"""
+        with self._lock:
+            row = self._connection.execute("SELECT checksum FROM snapshots WHERE path = ? AND resource = ?",
+                                           (path, resource)).fetchone()
+        return row[0] if row else None
+
+    def groups(self):
+        """Тройки (тенант, ресурс, способ хранения), для которых есть записи"""
+        with self._lock:
+            return [tuple(row) for row in self._connection.execute(
+                "SELECT DISTINCT tenant_id, resource, storage FROM snapshots ORDER BY tenant_id, resource, storage")]
+
+    def known_paths(self):
+        with self._lock:
+            return {row[0] for row in self._connection.execute("SELECT DISTINCT path FROM snapshots")}
+
+    def tenants(self):
+        """Тенанты, для которых есть снапшоты: [(тенант, число записей, последнее время)]"""
+        with self._lock:
+            return [tuple(row) for row in self._connection.execute(
+                "SELECT tenant_id, COUNT(*), MAX(timestamp) FROM snapshots GROUP BY tenant_id ORDER BY tenant_id")]
+
+    # ==================== ПЕРЕСТРОЕНИЕ ====================
+
+    def _rebuild_files(self, base_dir, suffixes, checksum, skip_paths):
+        """Записывает в каталог файлы и архивы <base_dir>/<тенант>/, возвращает число записей"""
+        from snapshot_store import STORAGE_FILES
+        count = 0
+        if not os.path.isdir(base_dir):
+            return count
+
+        def resource_of(filename):
+            for resource, suffix in suffixes.items():
+                if filename.endswith(suffix):
+                    return resource, filename[:-len(suffix)]
+            return None, None
+
+        for tenant_id in os.listdir(base_dir):
+            tenant_dir = os.path.join(base_dir, tenant_id)
+            if not os.path.isdir(tenant_dir):
+                continue
+            for filename in os.listdir(tenant_dir):
+                path = os.path.abspath(os.path.join(tenant_dir, filename))
+                if filename.startswith(ARCHIVE_PREFIX) and filename.endswith(ARCHIVE_SUFFIX):
+                    try:
+                        with zipfile.ZipFile(path) as archive:
+                            members = [(info.filename, info.file_size, archive.read(info.filename))
+                                       for info in archive.infolist()
+                                       if archive_member_path(path, info.filename) not in skip_paths]
+                    except (OSError, zipfile.BadZipFile):
+                        continue
+                    for member, size, raw in members:
+                        resource, timestamp = resource_of(member)
+                        if resource:
+                            try:
+                                digest = checksum(json.loads(raw.decode('utf-8')))
+                            except ValueError:
+                                digest = None
+                            self.record(tenant_id, resource, timestamp, archive_member_path(path, member),
+                                        STORAGE_FILES, size=size, checksum=digest)
+                            count += 1
+                    continue
+
+                resource, timestamp = resource_of(filename)
+                if resource and path not in skip_paths:
+                    try:
+                        digest = checksum(load_snapshot_file(path))
+                    except (OSError, ValueError):
+                        digest = None
+                    self.record(tenant_id, resource, timestamp, path, STORAGE_FILES,
+                                size=os.path.getsize(path), checksum=digest)
+                    count += 1
+        return count
+
+    def rebuild(self, base_dir="snapshot", store=None, traffic_dir=TRAFFIC_SETTINGS_DIR, only_missing=False):
+        """Заполняет каталог по уже существующим файлам, архивам и манифестам, возвращает число записей
+
+        only_missing - записывать только пути, которых еще нет в каталоге
+        (досинхронизация без повторного чтения известных файлов).
+        """
+        from snapshot_store import STORAGE_STORE, canonical_bytes
+
+        def checksum(data):
+            return hashlib.sha256(canonical_bytes(data)).hexdigest()
+
+        skip_paths = self.known_paths() if only_missing else set()
+        count = self._rebuild_files(base_dir, RESOURCE_FILE_SUFFIXES, checksum, skip_paths)
+        count += self._rebuild_files(traffic_dir, TRAFFIC_SETTINGS_SUFFIXES, checksum, skip_paths)
+
+        if store is not None and os.path.isdir(store.manifests_dir):
+            for tenant_id in os.listdir(store.manifests_dir):
+                for path, timestamp in store.list_manifests(tenant_id):
+                    if os.path.abspath(path) in skip_paths:
+                        continue
+                    try:
+                        objects = store.load_manifest(path).get('objects', {})
+                    except (OSError, ValueError):
+                        continue
+                    for resource, entry in objects.items():
+                        try:
+                            raw = canonical_bytes(store.resolve(entry))
+                        except (OSError, ValueError, KeyError):
+                            raw = None
+                        self.record(tenant_id, resource, timestamp, os.path.abspath(path), STORAGE_STORE,
+                                    size=len(raw) if raw is not None else None,
+                                    checksum=hashlib.sha256(raw).hexdigest() if raw is not None else None)
+                        count += 1
+        self._mark_backfilled()
+        return count
+
+
+def get_snapshot_catalog(db_path=CATALOG_PATH):
+    """Возвращает общий каталог снапшотов (один на процесс и файл базы)"""
+    with _catalogs_lock:
+        catalog = _catalogs.get(db_path)
+        if catalog is None:
+            catalog = SnapshotCatalog(db_path)
+            _catalogs[db_path] = catalog
+        return catalog
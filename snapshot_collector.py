@@ -0,0 +1,139 @@
+# snapshot_collector.py
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from snapshot_store import STORAGE_FILES
+
+DEFAULT_TENANT_WORKERS = 4
+
+RESOURCE_SNAPSHOT = "snapshot"
+RESOURCE_BACKENDS = "backends"
+RESOURCE_ROLES = "roles"
+RESOURCE_CUSTOM_ACTIONS = "custom_actions"
+
+RESOURCES = (RESOURCE_SNAPSHOT, RESOURCE_BACKENDS, RESOURCE_ROLES, RESOURCE_CUSTOM_ACTIONS)
+
+
+class SnapshotCollector:
+    """Параллельное получение конфигураций нескольких тенантов
+
+    Каждый тенант обслуживается собственным клиентом с отдельными токенами,
+    поэтому общий клиент не переключается между тенантами. Четыре ресурса
+    тенанта (конфигурация, бекенды, роли, пользовательские действия)
+    запрашиваются одновременно, число одновременно обрабатываемых тенантов
+    ограничено. Ошибка в одном тенанте не влияет на остальные.
+    """
+
+    def __init__(self, api_client, tenant_workers=DEFAULT_TENANT_WORKERS, base_dir="snapshot",
+                 storage=STORAGE_FILES):
+        self.api_client = api_client
+        self.tenant_workers = max(1, tenant_workers)
+        self.base_dir = base_dir
+        self.storage = storage
+
+    @staticmethod
+    def _fetch_resource(client, resource):
+        """Запрашивает один ресурс тенанта, возвращает данные или None"""
+        if resource == RESOURCE_SNAPSHOT:
+            response = client.get_snapshot()
+            return response.json() if response and response.status_code == 200 else None
+        if resource == RESOURCE_BACKENDS:
+            response = client.get_backends()
+            return response.json() if response and response.status_code == 200 else None
+        if resource == RESOURCE_ROLES:
+            from roles_manager import RolesManager
+            return RolesManager(client).get_roles()
+        from actions_manager import ActionsManager
+        return ActionsManager(client).get_custom_actions()
+
+    def _timed_fetch(self, client, resource):
+        started = time.monotonic()
+        data = self._fetch_resource(client, resource)
+        return data, time.monotonic() - started
+
+    def _save_resources(self, client, tenant_id, data):
+        """Сохраняет полученные ресурсы тенанта, возвращает {ресурс: путь}"""
+        from backup_manager import BackupManager
+        backup_manager = BackupManager(client, self.storage)
+        return backup_manager.save_tenant_resources(tenant_id, data, base_dir=self.base_dir)
+
+    def collect_tenant(self, tenant):
+        """Получает и сохраняет конфигурацию одного тенанта, возвращает запись для сводки"""
+        tenant_id = tenant.get('id')
+        tenant_name = tenant.get('name', 'Без названия')
+        started = time.monotonic()
+        result = {'tenant_id': tenant_id, 'tenant_name': tenant_name, 'success': False, 'error': None,
+                  'timings': {}, 'files': {}}
+
+        auth_started = time.monotonic()
+        client = self.api_client.clone_for_tenant(tenant_id)
+        result['timings']['auth'] = time.monotonic() - auth_started
+        if client is None:
+            result['error'] = "Не удалось авторизоваться в тенанте"
+            result['duration'] = time.monotonic() - started
+            return result
+
+        data = {}
+        timings = {}
+        with ThreadPoolExecutor(max_workers=len(RESOURCES)) as executor:
+            futures = {executor.submit(self._timed_fetch, client, resource): resource for resource in RESOURCES}
+            for future in as_completed(futures):
+                resource = futures[future]
+                try:
+                    data[resource], timings[resource] = future.result()
+                except Exception as e:
+                    print(f"[{tenant_name}] Исключение при получении {resource}: {e}")
+                    data[resource] = None
+        result['timings'].update((resource, timings[resource]) for resource in RESOURCES if resource in timings)
+
+        if not data.get(RESOURCE_SNAPSHOT):
+            result['error'] = "Не удалось получить конфигурацию"
+        else:
+            files = self._save_resources(client, tenant_id, data)
+            result['files'] = {resource: path for resource, path in files.items() if path}
+            # Как и раньше, тенант считается сохраненным, если записаны хотя бы 2 файла
+            result['success'] = RESOURCE_SNAPSHOT in result['files'] and len(result['files']) >= 2
+            if not result['success']:
+                result['error'] = "Не удалось сохранить основные данные"
+
+        result['duration'] = time.monotonic() - started
+        return result
+
+    def collect(self, tenants):
+        """Получает конфигурации тенантов параллельно, возвращает записи сводки в порядке тенантов"""
+        print(f"\nПолучение конфигураций {len(tenants)} тенантов ({self.tenant_workers} параллельно)...")
+        started = time.monotonic()
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.tenant_workers) as executor:
+            futures = {executor.submit(self.collect_tenant, tenant): index for index, tenant in enumerate(tenants)}
+            for future in as_completed(futures):
+                index = futures[future]
+                tenant = tenants[index]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'tenant_id': tenant.get('id'), 'tenant_name': tenant.get('name', 'Без названия'),
+                              'success': False, 'error': str(e), 'timings': {}, 'files': {}, 'duration': 0.0}
+                mark = "✅" if result['success'] else "❌"
+                print(f"{mark} {result['tenant_name']}: {result['duration']:.1f} с")
+                results[index] = result
+
+        ordered = [results[index] for index in range(len(tenants))]
+        self.print_summary(ordered, time.monotonic() - started)
+        return ordered
+
+    @staticmethod
+    def print_summary(results, total_duration):
+        """Выводит сводку по тенантам со временем получения каждого ресурса"""
+        print("\n=== Итог получения конфигураций ===")
+        for result in results:
+            mark = "✅" if result['success'] else "❌"
+            timings = ", ".join(f"{name} {seconds:.1f} с" for name, seconds in result['timings'].items())
+            line = f"{mark} {result['tenant_name']} (ID: {result['tenant_id']}): {result['duration']:.1f} с"
+            if timings:
+                line += f" [{timings}]"
+            if result['error']:
+                line += f" - {result['error']}"
+            print(line)
+        success_count = sum(1 for result in results if result['success'])
+        print(f"\nИтог: успешно обработано {success_count} из {len(results)} тенантов за {total_duration:.1f} с")
@@ -0,0 +1,341 @@
+# snapshot_daemon.py
+import os
+import json
+import time
+import random
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from snapshot_collector import DEFAULT_TENANT_WORKERS, RESOURCE_SNAPSHOT, RESOURCES, SnapshotCollector
+from snapshot_store import STORAGE_FILES
+
+DEFAULT_INTERVAL = 3600
+DEFAULT_JITTER = 0.1
+HEALTH_FILE = "snapshot_daemon_health.json"
+# Как часто планировщик проверяет, каким тенантам пора делать снапшот
+TICK_SECONDS = 1.0
+# Ответ 304 на запрос конфигурации (в отличие от None - ошибки запроса)
+NOT_MODIFIED = object()
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+class TenantState:
+    """Состояние опроса одного тенанта: клиент с токенами, хэши ресурсов, время последних запусков"""
+
+    def __init__(self, tenant_id, tenant_name):
+        self.tenant_id = tenant_id
+        self.tenant_name = tenant_name
+        self.client = None
+        self.snapshot_etag = None
+        self.checksums = {}
+        self.next_due = 0.0
+        self.last_attempt = None
+        self.last_success = None
+        self.last_success_monotonic = None
+        self.last_change = None
+        self.failures = 0
+        self.last_error = None
+        self.polls = 0
+        self.saves = 0
+
+    def describe(self):
+        return {
+            'tenant_id': self.tenant_id,
+            'tenant_name': self.tenant_name,
+            'last_attempt': self.last_attempt,
+            'last_success': self.last_success,
+            'last_change': self.last_change,
+            'consecutive_failures': self.failures,
+            'last_error': self.last_error,
+            'polls': self.polls,
+            'saves': self.saves
+        }
+
+
+class SnapshotDaemon:
+    """Служба периодического получения снапшотов тенантов
+
+    Процесс работает постоянно: вход выполняется один раз, для каждого
+    тенанта держится собственный клиент с токенами и HTTP сессией. Тенанты
+    опрашиваются раз в interval секунд со случайным разбросом (jitter), не
+    больше tenant_workers одновременно. Конфигурация запрашивается с
+    If-None-Match (304 - не изменилась), для остальных ресурсов сравниваются
+    контрольные суммы с последним сохранением, поэтому записываются только
+    изменившиеся ресурсы, а тенант без изменений не порождает новых файлов.
+
+    Состояние службы (время последнего успешного опроса и последнего
+    изменения каждого тенанта, число ошибок подряд) записывается в
+    health_file и, если задан health_port, отдается по HTTP: GET /health
+    возвращает 200, если все тенанты успешно опрошены за последние два
+    интервала, иначе 503.
+    """
+
+    def __init__(self, api_client, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER,
+                 tenant_workers=DEFAULT_TENANT_WORKERS, storage=STORAGE_FILES, base_dir="snapshot",
+                 health_file=HEALTH_FILE, health_port=None):
+        from backup_manager import BackupManager
+        self.api_client = api_client
+        self.interval = max(1, interval)
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.tenant_workers = max(1, tenant_workers)
+        self.storage = storage
+        self.base_dir = base_dir
+        self.health_file = health_file
+        self.health_port = health_port
+        self.backup_manager = BackupManager(api_client, storage)
+        self.tenants = {}
+        self.started_at = None
+        self.last_tenant_refresh = None
+        self._lock = threading.Lock()
+        # Файл состояния пишут все потоки опроса: запись по очереди через один временный файл
+        self._health_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+
+    # ==================== ПЛАНИРОВАНИЕ ====================
+
+    def _next_delay(self):
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _refresh_tenants(self):
+        """Обновляет список тенантов: новые получают случайное время первого опроса"""
+        self.last_tenant_refresh = time.monotonic()
+        response = self.api_client.get_tenants()
+        tenants = self.api_client._parse_response_items(response)
+        if not tenants:
+            print("Не удалось получить список тенантов")
+            return False
+
+        now = time.monotonic()
+        seen = set()
+        with self._lock:
+            for tenant in tenants:
+                tenant_id = tenant.get('id')
+                seen.add(tenant_id)
+                state = self.tenants.get(tenant_id)
+                if state is None:
+                    state = TenantState(tenant_id, tenant.get('name', 'Без названия'))
+                    state.checksums = self._saved_checksums(tenant_id)
+                    # Первые опросы разнесены по времени, чтобы не начинать все тенанты одновременно
+                    state.next_due = now + random.uniform(0, self.interval * self.jitter)
+                    self.tenants[tenant_id] = state
+            for tenant_id in list(self.tenants):
+                if tenant_id not in seen:
+                    del self.tenants[tenant_id]
+        return True
+
+    def _saved_checksums(self, tenant_id):
+        """Контрольные суммы последних сохраненных выбранным способом ресурсов тенанта (из каталога)"""
+        checksums = {}
+        for resource in RESOURCES:
+            entries = self.backup_manager.catalog.query(tenant_id=tenant_id, resource=resource,
+                                                        storage=self.storage, limit=1)
+            if entries and entries[0].get('checksum'):
+                checksums[resource] = entries[0]['checksum']
+        return checksums
+
+    # ==================== ОПРОС ТЕНАНТА ====================
+
+    def _fetch_snapshot(self, state):
+        """Конфигурация тенанта или NOT_MODIFIED, если она не изменилась (304); исключение - при ошибке"""
+        response = state.client.get_snapshot_conditional(state.snapshot_etag)
+        if response is not None and response.status_code == 304:
+            return NOT_MODIFIED
+        if response is None or response.status_code != 200:
+            raise RuntimeError(f"конфигурация: {response.status_code if response is not None else 'нет ответа'}")
+        state.snapshot_etag = response.headers.get('ETag')
+        return response.json()
+
+    def _fetch(self, state, resource):
+        if resource == RESOURCE_SNAPSHOT:
+            return self._fetch_snapshot(state)
+        return SnapshotCollector._fetch_resource(state.client, resource)
+
+    def poll_tenant(self, state):
+        """Опрашивает тенант и сохраняет изменившиеся ресурсы, возвращает список сохраненных ресурсов"""
+        state.last_attempt = _now()
+        state.polls += 1
+        if state.client is None:
+            state.client = self.api_client.clone_for_tenant(state.tenant_id)
+            if state.client is None:
+                raise RuntimeError("не удалось авторизоваться в тенанте")
+
+        data = {}
+        with ThreadPoolExecutor(max_workers=len(RESOURCES)) as executor:
+            futures = {executor.submit(self._fetch, state, resource): resource for resource in RESOURCES}
+            for future in as_completed(futures):
+                data[futures[future]] = future.result()
+
+        changed = {}
+        unchanged = []
+        failed = []
+        checksums = {}
+        for resource in RESOURCES:
+            value = data.get(resource)
+            if value is NOT_MODIFIED:
+                unchanged.append(resource)
+                continue
+            if value is None:
+                # Ресурс не получен: в хранилище остается прежняя версия, а опрос считается неудачным
+                failed.append(resource)
+                unchanged.append(resource)
+                continue
+            checksum = self.backup_manager.resource_checksum(resource, value)
+            if not value:
+                # Пустые ресурсы (например, тенант без пользовательских действий) не сохраняются
+                state.checksums[resource] = checksum
+            elif checksum == state.checksums.get(resource):
+                unchanged.append(resource)
+            else:
+                changed[resource] = value
+                checksums[resource] = checksum
+
+        if changed:
+            saved = self.backup_manager.save_tenant_resources(state.tenant_id, changed, base_dir=self.base_dir,
+                                                              unchanged=unchanged)
+            if not saved:
+                raise RuntimeError("не удалось сохранить изменившиеся ресурсы")
+            state.checksums.update((resource, checksums[resource]) for resource in saved if resource in checksums)
+            state.last_change = _now()
+            state.saves += 1
+        if failed:
+            raise RuntimeError(f"не удалось получить: {', '.join(sorted(failed))}")
+        return sorted(changed)
+
+    def _run_tenant(self, state):
+        try:
+            changed = self.poll_tenant(state)
+        except Exception as e:
+            with self._lock:
+                state.failures += 1
+                state.last_error = str(e)
+                # Клиент пересоздается при следующем опросе: токены могли стать недействительными
+                state.client = None
+                state.snapshot_etag = None
+                state.next_due = time.monotonic() + min(self._next_delay(), 60 * 2 ** min(state.failures, 5))
+            print(f"❌ {state.tenant_name}: {e}")
+        else:
+            with self._lock:
+                state.failures = 0
+                state.last_error = None
+                state.last_success = _now()
+                state.last_success_monotonic = time.monotonic()
+                state.next_due = time.monotonic() + self._next_delay()
+            if changed:
+                print(f"💾 {state.tenant_name}: сохранены изменения ({', '.join(changed)})")
+        self.write_health()
+
+    # ==================== СОСТОЯНИЕ ====================
+
+    def health(self):
+        """Сводка состояния службы: healthy - все тенанты успешно опрошены за последние два интервала"""
+        now = time.monotonic()
+
+        def stale(state):
+            if state.last_success_monotonic is None:
+                # Тенант, который еще ни разу не опрашивался, не считается проблемным
+                return state.polls > 0
+            return now - state.last_success_monotonic > 2 * self.interval
+
+        with self._lock:
+            tenants = [state.describe() for state in self.tenants.values()]
+            stale_count = sum(1 for state in self.tenants.values() if stale(state))
+        return {
+            'healthy': bool(tenants) and not stale_count,
+            'started_at': self.started_at,
+            'updated_at': _now(),
+            'interval': self.interval,
+            'tenants': tenants
+        }
+
+    def write_health(self):
+        """Атомарно записывает сводку состояния в файл (вызывается из потоков опроса)"""
+        tmp_path = f"{self.health_file}.tmp"
+        with self._health_lock:
+            # Сводка снимается под блокировкой, чтобы более старая не перезаписала новую
+            health = self.health()
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(health, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.health_file)
+            except OSError as e:
+                print(f"Не удалось записать состояние службы: {e}")
+
+    def _start_health_server(self):
+        daemon = self
+
+        class HealthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/health'):
+                    self.send_error(404)
+                    return
+                health = daemon.health()
+                body = json.dumps(health, ensure_ascii=False).encode('utf-8')
+                self.send_response(200 if health['healthy'] else 503)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('', self.health_port), HealthHandler)
+        threading.Thread(target=self._server.serve_forever, name="snapshot-daemon-health", daemon=True).start()
+        print(f"Состояние службы: http://localhost:{self.health_port}/health")
+
+    # ==================== ЗАПУСК ====================
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Работает до остановки (Ctrl+C или stop())"""
+        from snapshot_retention import schedule_compaction
+        self.started_at = _now()
+        # Контрольные суммы прошлых сохранений берутся из каталога, в том числе для старых снапшотов
+        self.backup_manager._ensure_catalog()
+        if not self._refresh_tenants():
+            return False
+        if self.health_port:
+            self._start_health_server()
+        print(f"\nСлужба снапшотов запущена: {len(self.tenants)} тенантов, интервал {self.interval} с, "
+              f"до {self.tenant_workers} тенантов одновременно")
+        self.write_health()
+
+        in_flight = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.tenant_workers) as executor:
+                while not self._stop.is_set():
+                    if time.monotonic() - self.last_tenant_refresh >= self.interval:
+                        self._refresh_tenants()
+
+                    for tenant_id, future in list(in_flight.items()):
+                        if future.done():
+                            del in_flight[tenant_id]
+                            if not in_flight:
+                                schedule_compaction()
+
+                    now = time.monotonic()
+                    with self._lock:
+                        due = [state for tenant_id, state in self.tenants.items()
+                               if state.next_due <= now and tenant_id not in in_flight]
+                    for state in sorted(due, key=lambda state: state.next_due):
+                        if len(in_flight) >= self.tenant_workers:
+                            break
+                        in_flight[state.tenant_id] = executor.submit(self._run_tenant, state)
+
+                    self._stop.wait(TICK_SECONDS)
+        except KeyboardInterrupt:
+            print("\nОстановка службы снапшотов...")
+        finally:
+            self._stop.set()
+            if self._server is not None:
+                self._server.shutdown()
+            self.write_health()
+        return True
@@ -0,0 +1,141 @@
+# snapshot_delta.py
+import copy
+
+OP_SET = "set"
+OP_DELETE = "del"
+OP_ORDER = "order"
+
+
+def _is_keyed_list(value):
+    """Список объектов с уникальными id (правила, действия и т.п.) сравнивается поэлементно"""
+    if not isinstance(value, list) or not value:
+        return False
+    if not all(isinstance(item, dict) and 'id' in item for item in value):
+        return False
+    ids = [item['id'] for item in value]
+    try:
+        return len(set(ids)) == len(ids)
+    except TypeError:
+        return False
+
+
+def _diff(old, new, path, ops):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({'op': OP_DELETE, 'path': path + [key]})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({'op': OP_SET, 'path': path + [key], 'value': value})
+            elif old[key] != value:
+                _diff(old[key], value, path + [key], ops)
+        return
+
+    if _is_keyed_list(old) and (_is_keyed_list(new) or new == []):
+        old_items = {item['id']: item for item in old}
+        new_items = {item['id']: item for item in new}
+        for item_id in old_items:
+            if item_id not in new_items:
+                ops.append({'op': OP_DELETE, 'path': path + [{'id': item_id}]})
+        for item_id, item in new_items.items():
+            if item_id not in old_items:
+                ops.append({'op': OP_SET, 'path': path + [{'id': item_id}], 'value': item})
+            elif old_items[item_id] != item:
+                _diff(old_items[item_id], item, path + [{'id': item_id}], ops)
+        # Новые элементы добавляются в конец - порядок фиксируется, только если он другой
+        expected = [item_id for item_id in old_items if item_id in new_items]
+        expected += [item_id for item_id in new_items if item_id not in old_items]
+        actual = list(new_items)
+        if expected != actual:
+            ops.append({'op': OP_ORDER, 'path': path, 'value': actual})
+        return
+
+    ops.append({'op': OP_SET, 'path': path, 'value': new})
+
+
+def diff(old, new):
+    """Структурная разница двух JSON документов: список операций set/del/order по путям
+
+    Элемент пути - ключ словаря или {'id': ...} для элемента списка объектов
+    с уникальными id; остальные списки заменяются целиком.
+    """
+    ops = []
+    if old != new:
+        _diff(old, new, [], ops)
+    return ops
+
+
+def _child(container, step):
+    if isinstance(step, dict):
+        for item in container:
+            if item.get('id') == step['id']:
+                return item
+        raise KeyError(step['id'])
+    return container[step]
+
+
+def _set(container, step, value):
+    if isinstance(step, dict):
+        for index, item in enumerate(container):
+            if item.get('id') == step['id']:
+                container[index] = value
+                return
+        container.append(value)
+    else:
+        container[step] = value
+
+
+def _delete(container, step):
+    if isinstance(step, dict):
+        container[:] = [item for item in container if item.get('id') != step['id']]
+    else:
+        container.pop(step, None)
+
+
+def apply(base, ops):
+    """Применяет разницу к документу, возвращает новый документ (base не изменяется)"""
+    result = copy.deepcopy(base)
+    for op in ops:
+        path = op['path']
+        if op['op'] == OP_SET and not path:
+            result = copy.deepcopy(op['value'])
+            continue
+
+        target = result
+        for step in path[:-1] if op['op'] != OP_ORDER else path:
+            target = _child(target, step)
+
+        if op['op'] == OP_SET:
+            _set(target, path[-1], copy.deepcopy(op['value']))
+        elif op['op'] == OP_DELETE:
+            _delete(target, path[-1])
+        elif op['op'] == OP_ORDER:
+            items = {item['id']: item for item in target}
+            target[:] = [items[item_id] for item_id in op['value']]
+    return result
+
+
+def resolve_path(data, path):
+    """Возвращает значение по пути (элемент пути - ключ или {'id': ...}), KeyError - если его нет"""
+    for step in path:
+        data = _child(data, step)
+    return data
+
+
+def find_object(data, identifier, path=None):
+    """Находит в документе первый объект с id или name, равным identifier, возвращает (путь, объект)"""
+    path = path or []
+    if isinstance(data, dict):
+        if str(data.get('id')) == str(identifier) or data.get('name') == identifier:
+            return path, data
+        for key, value in data.items():
+            found = find_object(value, identifier, path + [key])
+            if found:
+                return found
+    elif isinstance(data, list):
+        for index, item in enumerate(data):
+            step = {'id': item['id']} if isinstance(item, dict) and 'id' in item else index
+            found = find_object(item, identifier, path + [step])
+            if found:
+                return found
+    return None
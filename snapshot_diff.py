@@ -0,0 +1,293 @@
+# snapshot_diff.py
+import os
+import json
+import time
+import hashlib
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_MODIFIED = "modified"
+
+KIND_RULE = "rule"
+KIND_ACTION = "action"
+KIND_LIST = "list"
+KIND_SETTING = "setting"
+
+DIFF_DIR = "snapshot_diffs"
+# Для списков простых значений (например, элементов глобального списка) в отчет попадает не больше значений
+MAX_LIST_VALUES = 20
+
+
+def _is_keyed_list(value):
+    """Список объектов с уникальными id сравнивается по id, а не по позиции"""
+    if not isinstance(value, list) or not value:
+        return False
+    if not all(isinstance(item, dict) and 'id' in item for item in value):
+        return False
+    ids = [item['id'] for item in value]
+    try:
+        return len(set(ids)) == len(ids)
+    except TypeError:
+        return False
+
+
+def _is_scalar_list(value):
+    return isinstance(value, list) and all(not isinstance(item, (dict, list)) for item in value)
+
+
+def subtree_hashes(document):
+    """Хэши всех словарей и списков документа {id(узел): хэш}, считаются один раз снизу вверх
+
+    Хэш списка не зависит от порядка элементов: списки, отличающиеся только
+    порядком, считаются одинаковыми.
+    """
+    hashes = {}
+
+    def digest(value):
+        # Простые значения входят в хэш родителя как есть, вложенные узлы - своими хэшами (bytes в JSON не бывает)
+        if isinstance(value, dict):
+            parts = ('d', [(key, digest(value[key]) if isinstance(value[key], (dict, list)) else value[key])
+                           for key in sorted(value)])
+        else:
+            parts = ('l', sorted(repr(digest(item) if isinstance(item, (dict, list)) else item) for item in value))
+        result = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).digest()
+        hashes[id(value)] = result
+        return result
+
+    if isinstance(document, (dict, list)):
+        digest(document)
+    return hashes
+
+
+class SnapshotDiff:
+    """Сравнение двух снапшотов по хэшам поддеревьев (дерево Меркла)
+
+    Хэши всех разделов, правил, действий и списков считаются за один проход;
+    при сравнении поддерево с одинаковым хэшем пропускается без обхода,
+    поэтому время сравнения определяется объемом изменений. Элементы
+    списков объектов сопоставляются по id. Порядок элементов в списках
+    не учитывается: перестановка без других изменений не считается
+    изменением ни для списков объектов с id, ни для остальных списков.
+    Результат - компактный список изменений (добавлено, удалено, изменено)
+    с видом объекта и путем к нему.
+    """
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.old_hashes = subtree_hashes(old)
+        self.new_hashes = subtree_hashes(new)
+        self.changes = []
+
+    def _same(self, old, new):
+        if isinstance(old, (dict, list)) and isinstance(new, (dict, list)):
+            return self.old_hashes[id(old)] == self.new_hashes[id(new)]
+        if isinstance(old, (dict, list)) or isinstance(new, (dict, list)):
+            return False
+        return type(old) is type(new) and old == new
+
+    @staticmethod
+    def _kind(path):
+        """Вид объекта по ближайшему имени раздела в пути"""
+        for step in reversed(path):
+            # "items" - обертка ответов API, вид определяется родительским разделом
+            if isinstance(step, str) and step != 'items':
+                section = step.lower()
+                if 'rule' in section:
+                    return KIND_RULE
+                if 'action' in section:
+                    return KIND_ACTION
+                if 'list' in section:
+                    return KIND_LIST
+                return KIND_SETTING
+        return KIND_SETTING
+
+    def _record(self, change, path, old=None, new=None):
+        record = {'change': change, 'kind': self._kind(path), 'path': path}
+        item = new if change != CHANGE_REMOVED else old
+        if isinstance(item, dict) and path and isinstance(path[-1], dict):
+            record['id'] = item.get('id')
+            if item.get('name') is not None:
+                record['name'] = item.get('name')
+        elif not isinstance(old, (dict, list)) and not isinstance(new, (dict, list)):
+            if change != CHANGE_ADDED:
+                record['old'] = old
+            if change != CHANGE_REMOVED:
+                record['new'] = new
+        self.changes.append(record)
+        return record
+
+    def _compare(self, old, new, path):
+        if self._same(old, new):
+            return
+
+        if isinstance(old, dict) and isinstance(new, dict):
+            for key in old:
+                if key not in new:
+                    self._record(CHANGE_REMOVED, path + [key], old=old[key])
+            for key, value in new.items():
+                if key not in old:
+                    self._record(CHANGE_ADDED, path + [key], new=value)
+                else:
+                    self._compare(old[key], value, path + [key])
+            return
+
+        if (_is_keyed_list(old) and (_is_keyed_list(new) or new == [])) or (old == [] and _is_keyed_list(new)):
+            self._compare_items(old, new, path)
+            return
+
+        record = self._record(CHANGE_MODIFIED, path, old=old, new=new)
+        if _is_scalar_list(old) and _is_scalar_list(new):
+            old_values = set(map(json.dumps, old))
+            new_values = set(map(json.dumps, new))
+            record['added_values'] = [json.loads(v) for v in sorted(new_values - old_values)[:MAX_LIST_VALUES]]
+            record['removed_values'] = [json.loads(v) for v in sorted(old_values - new_values)[:MAX_LIST_VALUES]]
+            record['added_count'] = len(new_values - old_values)
+            record['removed_count'] = len(old_values - new_values)
+
+    def _compare_items(self, old, new, path):
+        """Сравнивает списки объектов по id: правило, действие и т.п. - одна запись отчета"""
+        old_items = {item['id']: item for item in old}
+        new_items = {item['id']: item for item in new}
+        for item_id, item in old_items.items():
+            if item_id not in new_items:
+                self._record(CHANGE_REMOVED, path + [{'id': item_id}], old=item)
+        for item_id, item in new_items.items():
+            item_path = path + [{'id': item_id}]
+            if item_id not in old_items:
+                self._record(CHANGE_ADDED, item_path, new=item)
+                continue
+            previous = old_items[item_id]
+            if self._same(previous, item):
+                continue
+            record = self._record(CHANGE_MODIFIED, item_path, old=previous, new=item)
+            record['fields'] = sorted(str(key) for key in set(previous) | set(item)
+                                      if key not in previous or key not in item
+                                      or not self._same(previous[key], item[key]))
+            # Вложенные списки (например, правила внутри политики, элементы списка) расписываются отдельно
+            for key in record['fields']:
+                if key not in previous or key not in item:
+                    continue
+                if _is_keyed_list(previous[key]) or _is_keyed_list(item[key]) \
+                        or _is_scalar_list(previous[key]) and _is_scalar_list(item[key]):
+                    self._compare(previous[key], item[key], item_path + [key])
+
+    def run(self):
+        """Сравнивает снапшоты, возвращает список изменений"""
+        self.changes = []
+        self._compare(self.old, self.new, [])
+        return self.changes
+
+
+def load_snapshot_document(path, store_root=None):
+    """Читает снапшот из файла, архива или манифеста хранилища"""
+    from snapshot_catalog import load_snapshot_file
+    from snapshot_store import STORE_DIR, SnapshotStore
+    store = SnapshotStore(store_root or STORE_DIR)
+    if store.is_manifest(path):
+        return store.load_resource(path, 'snapshot')
+    return load_snapshot_file(path)
+
+
+def summarize(changes):
+    """Число изменений по видам объектов: {вид: {added, removed, modified}}"""
+    summary = {}
+    for change in changes:
+        counts = summary.setdefault(change['kind'], {CHANGE_ADDED: 0, CHANGE_REMOVED: 0, CHANGE_MODIFIED: 0})
+        counts[change['change']] += 1
+    return summary
+
+
+def diff_snapshot_files(old_path, new_path, store_root=None):
+    """Сравнивает два сохраненных снапшота, возвращает отчет"""
+    started = time.monotonic()
+    old = load_snapshot_document(old_path, store_root)
+    new = load_snapshot_document(new_path, store_root)
+    changes = SnapshotDiff(old, new).run()
+    return {
+        'old': old_path,
+        'new': new_path,
+        'identical': not changes,
+        'summary': summarize(changes),
+        'changes': changes,
+        'duration': round(time.monotonic() - started, 3)
+    }
+
+
+def _known_identical(old_path, new_path):
+    """Снапшоты с одинаковой контрольной суммой в каталоге совпадают - читать их не нужно
+
+    Пути должны быть абсолютными: в таком виде они хранятся в каталоге.
+    """
+    from snapshot_catalog import get_snapshot_catalog
+    catalog = get_snapshot_catalog()
+    old_checksum = catalog.checksum_of(old_path, 'snapshot')
+    return old_checksum is not None and old_checksum == catalog.checksum_of(new_path, 'snapshot')
+
+
+def compare_snapshots(old_path, new_path, store_root=None, in_process=False):
+    """Сравнивает снапшоты в отдельном процессе (большие снапшоты не блокируют основной), возвращает отчет"""
+    # Пути из командной строки бывают относительными, каталог хранит абсолютные
+    old_path = os.path.abspath(old_path)
+    new_path = os.path.abspath(new_path)
+    if old_path == new_path or _known_identical(old_path, new_path):
+        return {'old': old_path, 'new': new_path, 'identical': True, 'summary': {}, 'changes': [], 'duration': 0.0}
+    if in_process:
+        return diff_snapshot_files(old_path, new_path, store_root)
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return executor.submit(diff_snapshot_files, old_path, new_path, store_root).result()
+    except (BrokenProcessPool, OSError, NotImplementedError) as e:
+        print(f"Не удалось запустить отдельный процесс ({e}), сравнение выполняется в текущем")
+        return diff_snapshot_files(old_path, new_path, store_root)
+
+
+def save_report(report, diff_dir=DIFF_DIR):
+    """Сохраняет отчет сравнения в JSON, возвращает путь к нему"""
+    os.makedirs(diff_dir, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(diff_dir, f"diff_{timestamp}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report_path
+
+
+def format_path(path):
+    return '/'.join(str(step['id']) if isinstance(step, dict) else str(step) for step in path)
+
+
+def print_report(report, limit=50):
+    """Выводит сводку сравнения и первые limit изменений"""
+    print("\n=== Сравнение снапшотов ===")
+    print(f"Было:  {report['old']}")
+    print(f"Стало: {report['new']}")
+    if report['identical']:
+        print("✅ Снапшоты совпадают")
+        return
+    kind_names = {KIND_RULE: 'Правила', KIND_ACTION: 'Действия', KIND_LIST: 'Списки', KIND_SETTING: 'Настройки'}
+    for kind, counts in report['summary'].items():
+        print(f"{kind_names.get(kind, kind)}: +{counts[CHANGE_ADDED]} -{counts[CHANGE_REMOVED]} "
+              f"~{counts[CHANGE_MODIFIED]}")
+
+    marks = {CHANGE_ADDED: '+', CHANGE_REMOVED: '-', CHANGE_MODIFIED: '~'}
+    print()
+    for change in report['changes'][:limit]:
+        line = f"  {marks[change['change']]} {format_path(change['path'])}"
+        if change.get('name'):
+            line += f" ({change['name']})"
+        if change.get('fields'):
+            line += f": {', '.join(change['fields'])}"
+        elif 'added_count' in change:
+            line += f": +{change['added_count']} -{change['removed_count']}"
+        elif change['change'] == CHANGE_MODIFIED and ('old' in change or 'new' in change):
+            line += f": {json.dumps(change.get('old'), ensure_ascii=False)} -> " \
+                    f"{json.dumps(change.get('new'), ensure_ascii=False)}"
+        elif 'old' in change or 'new' in change:
+            line += f": {json.dumps(change.get('new', change.get('old')), ensure_ascii=False)}"
+        print(line)
+    if len(report['changes']) > limit:
+        print(f"  ... и еще {len(report['changes']) - limit} изменений (полный список - в файле отчета)")
+    print(f"\nВремя сравнения: {report['duration']:.2f} с")
@@ -1,13 +1,17 @@
 # snapshot_manager.py (обновленный)
 import os
 import json
+import datetime
 from base_manager import BaseManager
+from snapshot_store import STORAGE_FILES
+from snapshot_retention import schedule_compaction
 
 class SnapshotManager(BaseManager):
-    def __init__(self, api_client):
+    def __init__(self, api_client, snapshot_storage=STORAGE_FILES):
         super().__init__(api_client)
         from backup_manager import BackupManager
-        self.backup_manager = BackupManager(api_client)
+        self.snapshot_storage = snapshot_storage
+        self.backup_manager = BackupManager(api_client, snapshot_storage)
     
     def get_tenant_snapshot(self, tenant_id=None):
         """Получает конфигурацию тенанта"""
@@ -66,121 +70,46 @@ class SnapshotManager(BaseManager):
         actions_manager = ActionsManager(self.api_client)
         custom_actions = actions_manager.get_custom_actions()
         
-        # Сохраняем в файлы
-        snapshot_filepath = self.backup_manager.save_snapshot_to_file(snapshot, tenant_id)
-        backends_filepath = None
-        roles_filepath = None
-        actions_filepath = None
-        
-        if backends:
-            backends_filepath = self.backup_manager.save_backends_to_file(backends, tenant_id)
-        
-        if roles:
-            roles_filepath = self.backup_manager.save_roles_to_file(roles, tenant_id)
-        
-        if custom_actions:
-            actions_filepath = self.backup_manager.save_custom_actions_to_file(custom_actions, tenant_id)
-        
-        success_files = [f for f in [snapshot_filepath, backends_filepath, roles_filepath, actions_filepath] if f]
+        # Сохраняем в файлы или в хранилище снапшотов
+        success_files = self.backup_manager.save_tenant_resources(tenant_id, {
+            'snapshot': snapshot,
+            'backends': backends,
+            'roles': roles,
+            'custom_actions': custom_actions
+        })
         
         if len(success_files) >= 2:  # Хотя бы 2 файла успешно сохранены
             print("Данные тенанта успешно сохранены")
+            schedule_compaction()
             return True
         else:
             print("Не удалось сохранить основные данные")
             return False
     
-    def get_all_tenants_snapshots(self):
-        """Получает конфигурации со всех доступных тенантов"""
+    def get_all_tenants_snapshots(self, tenant_workers=None):
+        """Получает конфигурации со всех доступных тенантов (тенанты обрабатываются параллельно)"""
+        from snapshot_collector import DEFAULT_TENANT_WORKERS, SnapshotCollector
         print("\nПолучение конфигураций со всех доступных тенантов...")
         
-        # Сохраняем текущий тенант
-        original_tenant_id = self.api_client.auth_manager.tenant_id
-        
         # Получаем список всех тенантов
         tenants = self.get_available_tenants()
         if not tenants:
             print("Не удалось получить список тенантов")
             return False
         
-        success_count = 0
-        total_tenants = len(tenants)
-        
-        for tenant in tenants:
-            tenant_id = tenant.get('id')
-            tenant_name = tenant.get('name', 'Без названия')
-            
-            print(f"\nОбработка тенанта: {tenant_name} (ID: {tenant_id})")
-            
-            # Получаем конфигурацию тенанта
-            snapshot = self.get_tenant_snapshot(tenant_id)
-            if snapshot:
-                # Получаем бекенды тенанта
-                from backends_manager import BackendsManager
-                backends_manager = BackendsManager(self.api_client)
-                backends = backends_manager.get_tenant_backends(tenant_id)
-                
-                # Получаем роли тенанта
-                from roles_manager import RolesManager
-                roles_manager = RolesManager(self.api_client)
-                roles = roles_manager.get_roles()
-                
-                # Получаем пользовательские действия через ActionsManager
-                from actions_manager import ActionsManager
-                actions_manager = ActionsManager(self.api_client)
-                custom_actions = actions_manager.get_custom_actions()
-                
-                # Сохраняем в файлы
-                snapshot_filepath = self.backup_manager.save_snapshot_to_file(snapshot, tenant_id)
-                backends_success = False
-                roles_success = False
-                actions_success = False
-                
-                if backends:
-                    backends_filepath = self.backup_manager.save_backends_to_file(backends, tenant_id)
-                    backends_success = backends_filepath is not None
-                
-                if roles:
-                    roles_filepath = self.backup_manager.save_roles_to_file(roles, tenant_id)
-                    roles_success = roles_filepath is not None
-                
-                if custom_actions:
-                    actions_filepath = self.backup_manager.save_custom_actions_to_file(custom_actions, tenant_id)
-                    actions_success = actions_filepath is not None
-                
-                success_files = sum([snapshot_filepath is not None, backends_success, roles_success, actions_success])
-                
-                if success_files >= 2:  # Хотя бы 2 файла успешно сохранены
-                    success_count += 1
-                    print(f"Данные тенанта {tenant_name} успешно сохранены")
-                else:
-                    print(f"Не удалось сохранить основные данные тенанта {tenant_name}")
-            else:
-                print(f"Не удалось получить конфигурацию тенанта {tenant_name}")
-        
-        # Восстанавливаем оригинальный тенант
-        if original_tenant_id:
-            self.api_client.auth_manager.tenant_id = original_tenant_id
-            self.api_client.auth_manager.update_jwt_with_tenant(self.api_client.make_request)
-        
-        print(f"\nИтог: успешно обработано {success_count} из {total_tenants} тенантов")
-        return success_count > 0
+        collector = SnapshotCollector(self.api_client, tenant_workers or DEFAULT_TENANT_WORKERS,
+                                      storage=self.snapshot_storage)
+        results = collector.collect(tenants)
+        schedule_compaction()
+        return any(result['success'] for result in results)
     
-    def restore_security_config(self):
-        """Восстанавливает конфигурацию безопасности из снапшота"""
-        if not self.api_client.auth_manager.access_token:
-            if not self.api_client.auth_manager.get_jwt_tokens(self.api_client.make_request):
-                return False
-        
-        if not self.api_client.auth_manager.tenant_id:
-            print("Сначала выберите тенант")
-            return False
-        
+    def _select_snapshot_data(self):
+        """Выбор снапшота текущего тенанта для восстановления, возвращает его данные или None"""
         # Поиск доступных снапшотов
-        snapshot_files = self.backup_manager._find_available_snapshots(self.api_client.auth_manager.tenant_id)
+        snapshot_files = self.backup_manager.find_available_snapshots(self.api_client.auth_manager.tenant_id)
         if not snapshot_files:
             print("Не найдены файлы снапшотов для восстановления")
-            return False
+            return None
         
         print("\nДоступные снапшоты:")
         for i, (filepath, timestamp) in enumerate(snapshot_files, 1):
@@ -188,20 +117,64 @@ class SnapshotManager(BaseManager):
         
         snapshot_index = self._select_index(snapshot_files, "Выберите номер снапшота для восстановления: ")
         if snapshot_index is None:
-            return False
+            return None
         
         selected_file = snapshot_files[snapshot_index][0]
         print(f"Выбран файл: {selected_file}")
         
         try:
-            with open(selected_file, 'r', encoding='utf-8') as f:
-                snapshot_data = json.load(f)
+            snapshot_data = self.backup_manager.load_snapshot(selected_file)
         except Exception as e:
             print(f"Ошибка при чтении файла снапшота: {e}")
-            return False
+            return None
         
         if not snapshot_data:
             print("Файл снапшота пуст")
+            return None
+        return snapshot_data
+    
+    def restore_selected_objects(self, max_workers=None, rate_limit=None):
+        """Восстанавливает из снапшота только изменившиеся правила, действия и списки"""
+        from snapshot_restore import SelectiveRestore
+        if not self.api_client.auth_manager.tenant_id:
+            print("Сначала выберите тенант")
+            return False
+        
+        snapshot_data = self._select_snapshot_data()
+        if not snapshot_data:
+            return False
+        
+        print("\nСравнение снапшота с текущей конфигурацией...")
+        live_data = self.get_tenant_snapshot()
+        if not live_data:
+            return False
+        
+        restore = SelectiveRestore(self.api_client, max_workers=max_workers, rate_limit=rate_limit)
+        plan = restore.plan(snapshot_data, live_data)
+        restore.print_plan(plan)
+        if not plan['operations']:
+            print("Нет объектов, которые можно восстановить выборочно")
+            return False
+        
+        if not self._confirm_action(f"Восстановить {len(plan['operations'])} объектов из снапшота?"):
+            print("Восстановление отменено")
+            return False
+        
+        summary = restore.apply(plan['operations'])
+        return summary['failed'] == 0
+    
+    def restore_security_config(self):
+        """Восстанавливает конфигурацию безопасности из снапшота"""
+        if not self.api_client.auth_manager.access_token:
+            if not self.api_client.auth_manager.get_jwt_tokens(self.api_client.make_request):
+                return False
+        
+        if not self.api_client.auth_manager.tenant_id:
+            print("Сначала выберите тенант")
+            return False
+        
+        snapshot_data = self._select_snapshot_data()
+        if not snapshot_data:
             return False
         
         # Подтверждение
@@ -225,6 +198,187 @@ class SnapshotManager(BaseManager):
         response = self.api_client.restore_snapshot(snapshot_data)
         return response
     
+    def _parse_moment(self, text):
+        """Разбирает дату и время из ввода пользователя"""
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                return datetime.datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+        return None
+    
+    def show_state_at(self):
+        """Показывает конфигурацию тенанта или отдельный объект (например, правило) на момент времени"""
+        from snapshot_delta import find_object
+        store = self.backup_manager.store
+        if store is None:
+            print("История снапшотов доступна только при \"snapshot_storage\": \"store\"")
+            return
+        
+        tenant_id = self.api_client.auth_manager.tenant_id
+        if not tenant_id:
+            print("Сначала выберите тенант")
+            return
+        
+        moment = self._parse_moment(input("Момент времени (ГГГГ-ММ-ДД [ЧЧ:ММ[:СС]], пусто - сейчас): ").strip()
+                                    or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        if moment is None:
+            print("Некорректный формат даты")
+            return
+        
+        manifest_path, snapshot = store.state_at(tenant_id, moment)
+        if snapshot is None:
+            print(f"Нет снапшотов тенанта на момент {moment}")
+            return
+        print(f"Снапшот: {store.load_manifest(manifest_path).get('created_at')}")
+        
+        identifier = input("ID или имя объекта (пусто - вся конфигурация): ").strip()
+        if not identifier:
+            print(json.dumps(snapshot, ensure_ascii=False, indent=2))
+            return
+        
+        found = find_object(snapshot, identifier)
+        if not found:
+            print(f"Объект '{identifier}' не найден в снапшоте")
+            return
+        path, obj = found
+        print(f"Путь: {'/'.join(str(step['id']) if isinstance(step, dict) else str(step) for step in path)}")
+        print(json.dumps(obj, ensure_ascii=False, indent=2))
+    
+    def search_snapshots(self):
+        """Ищет сохраненные снапшоты всех тенантов по каталогу (тенант, тип, период, контрольная сумма)"""
+        from snapshot_collector import RESOURCES
+        self.backup_manager._ensure_catalog()
+        catalog = self.backup_manager.catalog
+        
+        tenant_id = input("ID тенанта (пусто - все тенанты): ").strip() or None
+        resource = input(f"Тип ресурса ({', '.join(RESOURCES)}; пусто - все): ").strip() or None
+        if resource and resource not in RESOURCES:
+            print("Некорректный тип ресурса")
+            return
+        
+        period = []
+        for prompt in ("Начало периода (ГГГГ-ММ-ДД [ЧЧ:ММ[:СС]], пусто - без ограничения): ",
+                       "Конец периода (ГГГГ-ММ-ДД [ЧЧ:ММ[:СС]], пусто - без ограничения): "):
+            text = input(prompt).strip()
+            moment = self._parse_moment(text) if text else None
+            if text and moment is None:
+                print("Некорректный формат даты")
+                return
+            period.append(moment)
+        checksum = input("Контрольная сумма SHA-256 (пусто - любая): ").strip().lower() or None
+        
+        entries = catalog.query(tenant_id=tenant_id, resource=resource, since=period[0], until=period[1],
+                                checksum=checksum, limit=200)
+        if not entries:
+            print("Снапшоты не найдены")
+            return
+        
+        print(f"\nНайдено записей: {len(entries)}")
+        for entry in entries:
+            size = f"{entry['size']} байт" if entry['size'] is not None else "размер неизвестен"
+            checksum_prefix = (entry['checksum'] or '-')[:12]
+            print(f"{entry['timestamp']}  тенант {entry['tenant_id']}  {entry['resource']}  {size}  "
+                  f"{checksum_prefix}  [{entry['storage']}]")
+            print(f"    📁 {entry['path']}")
+    
+    def compare_snapshots(self):
+        """Сравнивает два сохраненных снапшота текущего тенанта"""
+        from snapshot_diff import compare_snapshots, print_report, save_report
+        snapshot_files = self.backup_manager.find_available_snapshots(self.api_client.auth_manager.tenant_id)
+        if len(snapshot_files) < 2:
+            print("Для сравнения нужно хотя бы два снапшота текущего тенанта")
+            return None
+        
+        print("\nДоступные снапшоты:")
+        for i, (filepath, timestamp) in enumerate(snapshot_files, 1):
+            print(f"{i}. {timestamp} - {os.path.basename(filepath)}")
+        old_index = self._select_index(snapshot_files, "Выберите номер исходного (более раннего) снапшота: ")
+        if old_index is None:
+            return None
+        new_index = self._select_index(snapshot_files, "Выберите номер снапшота для сравнения: ")
+        if new_index is None:
+            return None
+        
+        print("\nСравнение снапшотов...")
+        try:
+            report = compare_snapshots(snapshot_files[old_index][0], snapshot_files[new_index][0],
+                                       store_root=self.backup_manager.store.root if self.backup_manager.store else None)
+        except Exception as e:
+            print(f"Ошибка при сравнении снапшотов: {e}")
+            return None
+        print_report(report)
+        if not report['identical']:
+            print(f"📁 Отчет сохранен: {os.path.abspath(save_report(report))}")
+        return report
+    
+    def view_snapshot_section(self, limit=20):
+        """Просмотр одного раздела сохраненного снапшота без чтения всего файла"""
+        from snapshot_reader import open_snapshot
+        snapshot_files = self.backup_manager.find_available_snapshots(self.api_client.auth_manager.tenant_id)
+        if not snapshot_files:
+            print("Не найдены файлы снапшотов текущего тенанта")
+            return None
+        
+        print("\nДоступные снапшоты:")
+        for i, (filepath, timestamp) in enumerate(snapshot_files, 1):
+            print(f"{i}. {timestamp} - {os.path.basename(filepath)}")
+        snapshot_index = self._select_index(snapshot_files, "Выберите номер снапшота: ")
+        if snapshot_index is None:
+            return None
+        
+        try:
+            with open_snapshot(snapshot_files[snapshot_index][0],
+                               self.backup_manager.store.root if self.backup_manager.store else None) as reader:
+                sections = reader.sections()
+                if not sections:
+                    print("Снапшот пуст")
+                    return None
+                print("\nРазделы снапшота:")
+                for i, name in enumerate(sections, 1):
+                    print(f"{i}. {name} ({reader.section_size(name) / 1024:.1f} КБ)")
+                section_index = self._select_index(sections, "Выберите номер раздела: ")
+                if section_index is None:
+                    return None
+                name = sections[section_index]
+                
+                try:
+                    items = reader.iter_items(name)
+                    shown = [item for _, item in zip(range(limit), items)]
+                    remaining = sum(1 for _ in items)
+                except ValueError:
+                    print(json.dumps(reader.read_section(name), ensure_ascii=False, indent=2))
+                    return name
+        except Exception as e:
+            print(f"Ошибка при чтении снапшота: {e}")
+            return None
+        
+        print(f"\nРаздел '{name}': {len(shown) + remaining} элементов")
+        for item in shown:
+            print(json.dumps(item, ensure_ascii=False, indent=2))
+        if remaining:
+            print(f"... и еще {remaining} элементов")
+        return name
+    
+    def compact_snapshots(self):
+        """Удаляет снапшоты, не попавшие в ротацию, и архивирует старые файлы (с предварительной оценкой)"""
+        from snapshot_retention import RetentionPolicy, SnapshotCompactor, get_retention_policy
+        policy = get_retention_policy() or RetentionPolicy()
+        print(f"\nПолитика хранения: последних {policy.keep_last}, по дням {policy.daily}, "
+              f"по неделям {policy.weekly}, по месяцам {policy.monthly}")
+        compactor = SnapshotCompactor(policy, store=self.backup_manager.store)
+        
+        preview = compactor.run(dry_run=True)
+        SnapshotCompactor.print_summary(preview, dry_run=True)
+        if not preview['deleted'] and not preview['archived']:
+            print("Очистка не требуется")
+            return
+        if not self._confirm_action("Выполнить очистку снапшотов?"):
+            print("Очистка отменена")
+            return
+        
+        SnapshotCompactor.print_summary(compactor.run())
+    
     def manage_snapshots(self):
         """Управление получением конфигураций"""
         while True:
@@ -232,9 +386,14 @@ class SnapshotManager(BaseManager):
             print("1. Получить конфигурацию текущего тенанта")
             print("2. Получить конфигурацию выбранного тенанта")
             print("3. Получить конфигурации со всех тенантов")
-            print("4. Вернуться в главное меню")
+            print("4. Состояние конфигурации или объекта на момент времени")
+            print("5. Поиск сохраненных снапшотов (все тенанты)")
+            print("6. Сравнить два снапшота текущего тенанта")
+            print("7. Просмотр раздела снапшота текущего тенанта")
+            print("8. Очистка старых снапшотов по политике хранения")
+            print("9. Вернуться в главное меню")
             
-            choice = input("\nВыберите действие (1-4): ")
+            choice = input("\nВыберите действие (1-9): ")
             
             if choice == '1':
                 if not self.api_client.auth_manager.tenant_id:
@@ -249,6 +408,27 @@ class SnapshotManager(BaseManager):
                 self.get_all_tenants_snapshots()
             
             elif choice == '4':
+                self.show_state_at()
+            
+            elif choice == '5':
+                self.search_snapshots()
+            
+            elif choice == '6':
+                if not self.api_client.auth_manager.tenant_id:
+                    print("Сначала выберите тенант")
+                    continue
+                self.compare_snapshots()
+            
+            elif choice == '7':
+                if not self.api_client.auth_manager.tenant_id:
+                    print("Сначала выберите тенант")
+                    continue
+                self.view_snapshot_section()
+            
+            elif choice == '8':
+                self.compact_snapshots()
+            
+            elif choice == '9':
                 return
             
             else:
@@ -259,9 +439,10 @@ class SnapshotManager(BaseManager):
         while True:
             print("\nВосстановление конфигураций тенантов:")
             print("1. Восстановить 'Конфигурацию безопасности' (с выбором версии снапшота)")
-            print("2. Вернуться в главное меню")
+            print("2. Выборочно восстановить изменившиеся правила, действия и списки из снапшота")
+            print("3. Вернуться в главное меню")
             
-            choice = input("\nВыберите действие (1-2): ")
+            choice = input("\nВыберите действие (1-3): ")
             
             if choice == '1':
                 if not self.api_client.auth_manager.tenant_id:
@@ -270,14 +451,17 @@ class SnapshotManager(BaseManager):
                 self.restore_security_config()
             
             elif choice == '2':
+                self.restore_selected_objects()
+            
+            elif choice == '3':
                 return
             
             else:
                 print("Некорректный выбор. Попробуйте снова.")
     
-    def get_snapshots_from_cli(self):
+    def get_snapshots_from_cli(self, tenant_workers=None):
         """Получает конфигурации со всех тенантов (для вызова из CLI)"""
-        return self.get_all_tenants_snapshots()
+        return self.get_all_tenants_snapshots(tenant_workers)
     
     def manage_tenant_transfer(self):
         """Управление переносом объектов между тенантами"""
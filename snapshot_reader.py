@@ -0,0 +1,272 @@
+# snapshot_reader.py
+import os
+import re
+import json
+import mmap
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+_WHITESPACE = re.compile(rb'[ \t\r\n]*')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.S)
+_SCALAR = re.compile(rb'[^,\]}\s]+')
+# Внутри вложенных значений важны только скобки; строки пропускаются целиком, так как могут содержать скобки
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}]', re.S)
+_SEPARATOR = re.compile(r'\s*([,\]])\s*')
+_DECODER = json.JSONDecoder()
+# Элементы списка разбираются окнами такого размера (окно растет, если элемент в него не помещается)
+STREAM_WINDOW = 1 << 20
+
+
+def index_path(path):
+    """Путь к индексу разделов снапшота (рядом с файлом)"""
+    return f"{path}{INDEX_SUFFIX}"
+
+
+def _skip_whitespace(buffer, pos):
+    return _WHITESPACE.match(buffer, pos).end()
+
+
+def _value_end(buffer, pos):
+    """Позиция сразу после JSON значения, начинающегося с pos (значение не разбирается)"""
+    first = buffer[pos:pos + 1]
+    if first == b'"':
+        return _STRING.match(buffer, pos).end()
+    if first not in (b'{', b'['):
+        return _SCALAR.match(buffer, pos).end()
+    depth = 0
+    for match in _TOKEN.finditer(buffer, pos):
+        token = buffer[match.start():match.start() + 1]
+        if token in (b'{', b'['):
+            depth += 1
+        elif token in (b'}', b']'):
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise ValueError(f"Незакрытое значение с позиции {pos}")
+
+
+def _members(buffer, pos):
+    """Элементы объекта или массива, начинающегося с pos: (ключ или None, начало, конец значения)"""
+    opener = buffer[pos:pos + 1]
+    closer = b'}' if opener == b'{' else b']'
+    pos = _skip_whitespace(buffer, pos + 1)
+    if buffer[pos:pos + 1] == closer:
+        return
+    while True:
+        key = None
+        if opener == b'{':
+            key_end = _STRING.match(buffer, pos).end()
+            key = json.loads(buffer[pos:key_end])
+            pos = _skip_whitespace(buffer, key_end)
+            if buffer[pos:pos + 1] != b':':
+                raise ValueError(f"Ожидалось ':' на позиции {pos}")
+            pos = _skip_whitespace(buffer, pos + 1)
+        end = _value_end(buffer, pos)
+        yield key, pos, end
+        pos = _skip_whitespace(buffer, end)
+        separator = buffer[pos:pos + 1]
+        if separator == closer:
+            return
+        if separator != b',':
+            raise ValueError(f"Ожидалось ',' на позиции {pos}")
+        pos = _skip_whitespace(buffer, pos + 1)
+
+
+def _iter_array(buffer, pos, end):
+    """Элементы массива, начинающегося с pos, по одному
+
+    Разбор идет окнами по STREAM_WINDOW байт встроенным декодером JSON, в
+    памяти одновременно находятся только окно и текущий элемент.
+    """
+    pos += 1
+    window = STREAM_WINDOW
+    first = True
+    while pos < end:
+        window_end = min(end, pos + window)
+        # Окно не должно разрезать многобайтный символ UTF-8
+        while window_end < end and buffer[window_end] & 0xC0 == 0x80:
+            window_end -= 1
+        text = buffer[pos:window_end].decode('utf-8')
+        offset = len(text) - len(text.lstrip(' \t\r\n'))
+        if first and text[offset:offset + 1] == ']':
+            return
+        first = False
+        start_offset = offset
+        while True:
+            try:
+                item, item_end = _DECODER.raw_decode(text, offset)
+            except json.JSONDecodeError:
+                item_end = None
+            complete = item_end is not None and (item_end < len(text) or window_end == end)
+            separator = _SEPARATOR.match(text, item_end) if complete else None
+            if separator is None:
+                if window_end == end:
+                    raise ValueError(f"Некорректный элемент списка на позиции {pos}")
+                break
+            yield item
+            if separator.group(1) == ']':
+                return
+            offset = separator.end()
+        if offset == start_offset:
+            # Элемент больше окна
+            window *= 2
+        else:
+            window = STREAM_WINDOW
+        pos += len(text[:offset].encode('utf-8'))
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_index(path):
+    """Строит индекс разделов верхнего уровня {раздел: [начало, конец]} и сохраняет его рядом с файлом"""
+    size, mtime_ns = _file_signature(path)
+    sections = {}
+    if size:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            pos = _skip_whitespace(buffer, 0)
+            if buffer[pos:pos + 1] != b'{':
+                raise ValueError(f"{path}: снапшот должен быть JSON объектом")
+            for key, start, end in _members(buffer, pos):
+                sections[key] = [start, end]
+
+    index = {'version': INDEX_VERSION, 'size': size, 'mtime_ns': mtime_ns, 'sections': sections}
+    tmp_path = f"{index_path(path)}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path(path))
+    except OSError:
+        # Каталог только для чтения: индекс используется без сохранения
+        pass
+    return index
+
+
+def load_index(path):
+    """Индекс разделов снапшота; устаревший или отсутствующий индекс строится заново"""
+    try:
+        with open(index_path(path), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION and (index.get('size'), index.get('mtime_ns')) == \
+                _file_signature(path):
+            return index
+    except (OSError, ValueError):
+        pass
+    return build_index(path)
+
+
+def remove_index(path):
+    """Удаляет индекс снапшота (вместе с удалением или переносом файла)"""
+    try:
+        os.remove(index_path(path))
+    except OSError:
+        pass
+
+
+class SnapshotReader:
+    """Чтение отдельных разделов большого файла снапшота
+
+    При первом открытии (или при сохранении снапшота) строится индекс
+    смещений разделов верхнего уровня, который хранится рядом с файлом
+    (<файл>.idx) и перестраивается при изменении файла. Файл открывается
+    через mmap, поэтому разбирается только запрошенный раздел, а элементы
+    раздела-списка (правила, списки и т.п.) можно читать по одному, не
+    загружая весь раздел в память.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = load_index(path)
+        self._file = None
+        self._buffer = None
+
+    def _mapped(self):
+        if self._buffer is None:
+            self._file = open(self.path, 'rb')
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._buffer
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._file.close()
+            self._buffer = None
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def sections(self):
+        """Разделы снапшота в порядке следования в файле"""
+        return list(self.index['sections'])
+
+    def section_size(self, name):
+        start, end = self.index['sections'][name]
+        return end - start
+
+    def read_section(self, name):
+        """Разбирает только указанный раздел"""
+        start, end = self.index['sections'][name]
+        return json.loads(self._mapped()[start:end])
+
+    def iter_items(self, name):
+        """Элементы раздела-списка по одному (для раздела {"items": [...]} - элементы items)"""
+        buffer = self._mapped()
+        start, _ = self.index['sections'][name]
+        if buffer[start:start + 1] == b'{':
+            start = next((value_start for key, value_start, _ in _members(buffer, start) if key == 'items'), None)
+        if start is None or buffer[start:start + 1] != b'[':
+            raise ValueError(f"Раздел '{name}' не является списком")
+        yield from _iter_array(buffer, start, self.index['sections'][name][1])
+
+
+class LoadedSnapshot:
+    """Тот же интерфейс для снапшотов, которые нельзя отобразить в память (архив, хранилище)"""
+
+    def __init__(self, data):
+        self.data = data if isinstance(data, dict) else {}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def sections(self):
+        return list(self.data)
+
+    def section_size(self, name):
+        return len(json.dumps(self.data[name], ensure_ascii=False).encode('utf-8'))
+
+    def read_section(self, name):
+        return self.data[name]
+
+    def iter_items(self, name):
+        section = self.data[name]
+        if isinstance(section, dict) and isinstance(section.get('items'), list):
+            section = section['items']
+        if not isinstance(section, list):
+            raise ValueError(f"Раздел '{name}' не является списком")
+        return iter(section)
+
+
+def open_snapshot(path, store_root=None):
+    """Открывает снапшот для чтения по разделам: файл - через индекс и mmap, остальное - целиком"""
+    from snapshot_catalog import split_archive_path
+    from snapshot_store import STORE_DIR, SnapshotStore
+    store = SnapshotStore(store_root or STORE_DIR)
+    if store.is_manifest(path):
+        return LoadedSnapshot(store.load_resource(path, 'snapshot'))
+    if split_archive_path(path)[1] is not None:
+        from snapshot_catalog import load_snapshot_file
+        return LoadedSnapshot(load_snapshot_file(path))
+    return SnapshotReader(path)
@@ -0,0 +1,249 @@
+# snapshot_restore.py
+import copy
+import json
+
+from parallel_executor import DEFAULT_MAX_WORKERS, ParallelExecutor
+from action_mutation import KIND_POLICY, KIND_RULE_SET, KIND_TEMPLATE, SCOPE_SYSTEM, SCOPE_USER, rule_path
+from snapshot_delta import resolve_path
+from snapshot_diff import (CHANGE_MODIFIED, CHANGE_REMOVED, KIND_ACTION, KIND_LIST, KIND_RULE,
+                           SnapshotDiff, format_path)
+
+OP_UPDATE = "update"
+OP_CREATE = "create"
+
+STATUS_RESTORED = "restored"
+STATUS_FAILED = "failed"
+
+# Поля, которые назначает сервер: при создании объекта не передаются
+SERVER_FIELDS = ('id', 'is_system', 'is_default', 'created_at', 'updated_at')
+
+
+class SelectiveRestore:
+    """Выборочное восстановление объектов из снапшота
+
+    Снапшот сравнивается с текущей конфигурацией тенанта (snapshot_diff), и
+    вместо POST всего снапшота восстанавливаются только отличающиеся объекты
+    через их собственные API: у измененного правила, действия или
+    глобального списка PATCH-запросом возвращаются только изменившиеся поля,
+    отсутствующие правила наборов пользовательских правил и пользовательские
+    действия создаются заново. Объекты, появившиеся после снапшота, не
+    удаляются, а изменения, для которых нет отдельного API, только
+    перечисляются - для них остается полное восстановление.
+
+    Сначала восстанавливаются действия: созданные заново действия получают
+    новые ID, и ссылки на них в правилах заменяются перед восстановлением
+    правил. Создание объектов (POST) не повторяется, чтобы не создать дубликат.
+    """
+
+    def __init__(self, api_client, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None):
+        self.api_client = api_client
+        self.executor = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit)
+
+    # ==================== ПЛАНИРОВАНИЕ ====================
+
+    @staticmethod
+    def _rule_location(path):
+        """(вид, ID контейнера, область, ID правила) по пути правила в снапшоте или None
+
+        Вид контейнера определяется по разделу снапшота: наборы
+        пользовательских правил (with_user_rules) и пользовательские шаблоны
+        обслуживаются разными API.
+        """
+        steps = [(index, step) for index, step in enumerate(path) if isinstance(step, dict)]
+        if len(steps) < 2:
+            return None
+        (container_index, container_step), (rule_index, rule_step) = steps[-2], steps[-1]
+        if rule_index != len(path) - 1 or container_index < 1 or rule_index - container_index != 2:
+            return None
+        container_section = str(path[container_index - 1]).lower()
+        rules_section = str(path[rule_index - 1]).lower()
+        if 'with_user_rules' in container_section:
+            kind = KIND_RULE_SET
+        elif 'template' in container_section:
+            kind = KIND_TEMPLATE
+        elif 'polic' in container_section:
+            kind = KIND_POLICY
+        else:
+            return None
+        scope = SCOPE_USER if 'user' in rules_section or kind != KIND_POLICY else SCOPE_SYSTEM
+        return kind, container_step['id'], scope, rule_step['id']
+
+    @staticmethod
+    def _changed_fields(change, snapshot_item):
+        """Изменившиеся поля объекта в том виде, в каком они записаны в снапшоте"""
+        return {field: snapshot_item[field] for field in change.get('fields', [])
+                if field in snapshot_item and field not in SERVER_FIELDS}
+
+    @staticmethod
+    def _creation_data(snapshot_item):
+        return {key: value for key, value in snapshot_item.items() if key not in SERVER_FIELDS}
+
+    def _operation(self, change, snapshot):
+        """Операция восстановления для изменения или None, если отдельного API для него нет"""
+        path = change['path']
+        if not path or not isinstance(path[-1], dict):
+            return None
+        try:
+            item = resolve_path(snapshot, path)
+        except (KeyError, TypeError, IndexError):
+            return None
+        name = item.get('name') or str(item.get('id'))
+
+        if change['kind'] == KIND_RULE:
+            location = self._rule_location(path)
+            if location is None:
+                return None
+            kind, container_id, scope, rule_id = location
+            if change['change'] == CHANGE_MODIFIED:
+                data = self._changed_fields(change, item)
+                if not data:
+                    return None
+                endpoint = rule_path(kind, container_id, scope, rule_id)
+                return {'op': OP_UPDATE, 'kind': KIND_RULE, 'name': name, 'path': path,
+                        'call': lambda data: self.api_client.update_rule_conditional(endpoint, data), 'data': data}
+            if kind == KIND_RULE_SET:
+                # Создать правило можно только в наборе пользовательских правил
+                data = self._creation_data(item)
+                return {'op': OP_CREATE, 'kind': KIND_RULE, 'name': name, 'path': path,
+                        'call': lambda data: self.api_client.create_user_rule_raw(container_id, data), 'data': data}
+            return None
+
+        if change['kind'] == KIND_ACTION:
+            if item.get('is_system'):
+                return None
+            if change['change'] == CHANGE_MODIFIED:
+                data = self._changed_fields(change, item)
+                if not data:
+                    return None
+                return {'op': OP_UPDATE, 'kind': KIND_ACTION, 'name': name, 'path': path,
+                        'call': lambda data: self.api_client.update_action_raw(item['id'], data), 'data': data}
+            data = self._creation_data(item)
+            return {'op': OP_CREATE, 'kind': KIND_ACTION, 'name': name, 'path': path, 'source_id': item.get('id'),
+                    'call': lambda data: self.api_client.create_action_raw(data), 'data': data}
+
+        if change['kind'] == KIND_LIST and change['change'] == CHANGE_MODIFIED:
+            data = self._changed_fields(change, item)
+            if not data:
+                return None
+            return {'op': OP_UPDATE, 'kind': KIND_LIST, 'name': name, 'path': path,
+                    'call': lambda data: self.api_client.update_global_list_raw(item['id'], data), 'data': data}
+        return None
+
+    def plan(self, snapshot, live):
+        """Сравнивает снапшот с текущей конфигурацией, возвращает план восстановления
+
+        План - словарь с операциями (operations), изменениями без отдельного
+        API (unsupported) и объектами, появившимися после снапшота (extra).
+        """
+        # Сравнение "сейчас -> снапшот": added - объекты, которых сейчас нет, removed - появившиеся после снапшота
+        changes = SnapshotDiff(live, snapshot).run()
+
+        # Поля контейнеров (политик, шаблонов), изменения которых расписаны отдельными записями
+        covered = {}
+        for change in changes:
+            path = change['path']
+            for depth in (1, 2):
+                if len(path) > depth:
+                    prefix = path[:-depth]
+                    covered.setdefault(json.dumps(prefix), set()).add(str(path[len(prefix)]))
+
+        operations = []
+        unsupported = []
+        extra = []
+        restored_paths = set()
+        for change in changes:
+            path = change['path']
+            if change['change'] == CHANGE_REMOVED:
+                extra.append(change)
+                continue
+            # Детали объекта, который уже восстанавливается целиком (например, значения списка)
+            if any(json.dumps(path[:depth]) in restored_paths for depth in range(1, len(path))):
+                continue
+            operation = self._operation(change, snapshot)
+            if operation is not None:
+                operations.append(operation)
+                restored_paths.add(json.dumps(path))
+            elif change.get('fields') and set(change['fields']) <= covered.get(json.dumps(change['path']), set()):
+                continue
+            else:
+                unsupported.append(change)
+        return {'operations': operations, 'unsupported': unsupported, 'extra': extra}
+
+    # ==================== ПРОСМОТР ====================
+
+    @staticmethod
+    def print_plan(plan):
+        kind_names = {KIND_RULE: 'правило', KIND_ACTION: 'действие', KIND_LIST: 'список'}
+        op_names = {OP_UPDATE: 'восстановить поля', OP_CREATE: 'создать'}
+        operations = plan['operations']
+        print(f"\n=== Выборочное восстановление: {len(operations)} объектов ===")
+        for operation in operations:
+            line = f"  {op_names[operation['op']]} {kind_names[operation['kind']]} '{operation['name']}'"
+            if operation['op'] == OP_UPDATE:
+                line += f": {', '.join(operation['data'])}"
+            print(line)
+        if plan['unsupported']:
+            print(f"\n⚠️ Изменения без отдельного API (восстанавливаются только полным восстановлением): "
+                  f"{len(plan['unsupported'])}")
+            for change in plan['unsupported'][:20]:
+                print(f"  ~ {format_path(change['path'])}")
+            if len(plan['unsupported']) > 20:
+                print(f"  ... и еще {len(plan['unsupported']) - 20}")
+        if plan['extra']:
+            print(f"\nОбъекты, появившиеся после снапшота (не удаляются): {len(plan['extra'])}")
+
+    # ==================== ПРИМЕНЕНИЕ ====================
+
+    @staticmethod
+    def _remap_actions(data, action_ids):
+        """Копия данных правила со ссылками на пересозданные действия, замененными на их новые ID"""
+        if not action_ids:
+            return data
+        data = copy.deepcopy(data)
+        for container in (data, data.get('configuration')):
+            if isinstance(container, dict) and isinstance(container.get('actions'), list):
+                container['actions'] = [action_ids.get(str(action_id), action_id)
+                                        for action_id in container['actions']]
+        return data
+
+    def _run(self, operations, on_result):
+        """Выполняет операции параллельно: изменения - с повторами, создание - без повторов"""
+        call = lambda operation: operation['call'](operation['data'])
+        self.executor.map(call, [operation for operation in operations if operation['op'] == OP_UPDATE],
+                          on_result)
+        self.executor.map(call, [operation for operation in operations if operation['op'] == OP_CREATE],
+                          on_result, max_retries=0)
+
+    def apply(self, operations):
+        """Выполняет операции (сначала действия, затем правила и списки), возвращает сводку"""
+        summary = {'total': len(operations), STATUS_RESTORED: 0, STATUS_FAILED: 0}
+        # ID действия в снапшоте -> ID пересозданного действия
+        action_ids = {}
+
+        def on_result(operation, response):
+            if response is not None and response.status_code in (200, 201, 204):
+                summary[STATUS_RESTORED] += 1
+                print(f"✅ {operation['name']}")
+                if operation['kind'] == KIND_ACTION and operation['op'] == OP_CREATE:
+                    try:
+                        new_id = response.json().get('id')
+                    except (ValueError, AttributeError):
+                        new_id = None
+                    if new_id is not None and operation.get('source_id') is not None:
+                        action_ids[str(operation['source_id'])] = new_id
+            else:
+                summary[STATUS_FAILED] += 1
+                error_msg = response.text if response is not None else "Неизвестная ошибка"
+                print(f"❌ {operation['name']}: {error_msg}")
+
+        self._run([operation for operation in operations if operation['kind'] == KIND_ACTION], on_result)
+        others = [operation for operation in operations if operation['kind'] != KIND_ACTION]
+        for operation in others:
+            if operation['kind'] == KIND_RULE:
+                operation['data'] = self._remap_actions(operation['data'], action_ids)
+        self._run(others, on_result)
+        print(f"\nВосстановлено: {summary[STATUS_RESTORED]} из {summary['total']}")
+        if summary[STATUS_FAILED]:
+            print(f"  Ошибок: {summary[STATUS_FAILED]}")
+        return summary
+
@@ -0,0 +1,301 @@
+# snapshot_retention.py
+import os
+import time
+import zipfile
+import datetime
+import threading
+
+from snapshot_catalog import (ARCHIVE_PREFIX, ARCHIVE_SUFFIX, TIMESTAMP_FORMAT, archive_member_path,
+                              get_snapshot_catalog, split_archive_path)
+from snapshot_store import STORAGE_FILES, STORAGE_STORE, SnapshotStore
+from snapshot_reader import remove_index
+
+DEFAULT_KEEP_LAST = 10
+DEFAULT_DAILY = 7
+DEFAULT_WEEKLY = 4
+DEFAULT_MONTHLY = 12
+# Сохраняемые файлы старше этого срока и не больше этого размера переносятся в месячные архивы
+DEFAULT_ARCHIVE_AFTER_DAYS = 7
+DEFAULT_SMALL_FILE_SIZE = 256 * 1024
+# Пауза между группами, чтобы фоновая очистка не мешала основной работе
+DEFAULT_PAUSE = 0.05
+
+_policy = None
+_background = None
+_background_lock = threading.Lock()
+
+
+def _parse_timestamp(timestamp):
+    try:
+        return datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetentionPolicy:
+    """Ротация снапшотов дед-отец-сын
+
+    Для каждого тенанта и ресурса сохраняются keep_last последних снапшотов
+    и последний снапшот каждого из daily последних дней, weekly последних
+    недель и monthly последних месяцев; остальные удаляются. Снапшоты с
+    нераспознанным временем не удаляются.
+    """
+
+    def __init__(self, keep_last=DEFAULT_KEEP_LAST, daily=DEFAULT_DAILY, weekly=DEFAULT_WEEKLY,
+                 monthly=DEFAULT_MONTHLY, archive_after_days=DEFAULT_ARCHIVE_AFTER_DAYS,
+                 small_file_size=DEFAULT_SMALL_FILE_SIZE):
+        # Последний снапшот нужен всегда: от него считаются разницы в хранилище
+        self.keep_last = max(1, int(keep_last))
+        self.daily = max(0, int(daily))
+        self.weekly = max(0, int(weekly))
+        self.monthly = max(0, int(monthly))
+        self.archive_after_days = archive_after_days
+        self.small_file_size = small_file_size
+
+    @classmethod
+    def from_config(cls, settings):
+        """Политика из параметра конфигурации "snapshot_retention" (отсутствующие ключи - по умолчанию)"""
+        keys = ('keep_last', 'daily', 'weekly', 'monthly', 'archive_after_days', 'small_file_size')
+        return cls(**{key: settings[key] for key in keys if key in (settings or {})})
+
+    def keep(self, timestamps):
+        """Возвращает множество сохраняемых меток времени"""
+        ordered = sorted(set(timestamps), reverse=True)
+        keep = set(ordered[:self.keep_last])
+        moments = [(timestamp, _parse_timestamp(timestamp)) for timestamp in ordered]
+        keep.update(timestamp for timestamp, moment in moments if moment is None)
+
+        buckets = (
+            (self.daily, lambda moment: moment.date()),
+            (self.weekly, lambda moment: moment.isocalendar()[:2]),
+            (self.monthly, lambda moment: (moment.year, moment.month))
+        )
+        for count, bucket in buckets:
+            seen = set()
+            for timestamp, moment in moments:
+                if moment is None:
+                    continue
+                key = bucket(moment)
+                if key in seen:
+                    continue
+                if len(seen) >= count:
+                    break
+                seen.add(key)
+                keep.add(timestamp)
+        return keep
+
+
+class SnapshotCompactor:
+    """Очистка и сжатие снапшотов по политике хранения
+
+    Работает по каталогу снапшотов группами (тенант и ресурс): удаляет
+    снапшоты, не попавшие в ротацию, и переносит старые небольшие файлы в
+    архивы <тенант>/archive-ГГГГ-ММ.zip. Снапшоты хранилища удаляются целыми
+    запусками (манифестами), после чего объекты без ссылок удаляются сборкой
+    мусора; полные копии, от которых считаются оставшиеся разницы, остаются.
+    Каталог обновляется вместе с файлами, группы обрабатываются по одной,
+    поэтому очистку можно прервать и продолжить позже.
+    """
+
+    def __init__(self, policy=None, catalog=None, store=None, base_dir="snapshot", pause=0):
+        self.policy = policy or RetentionPolicy()
+        self.catalog = catalog or get_snapshot_catalog()
+        self.store = store or SnapshotStore()
+        self.base_dir = base_dir
+        self.pause = pause
+
+    # ==================== ФАЙЛЫ ====================
+
+    @staticmethod
+    def _archive_name(timestamp):
+        moment = _parse_timestamp(timestamp)
+        return f"{ARCHIVE_PREFIX}{moment.strftime('%Y-%m')}{ARCHIVE_SUFFIX}"
+
+    @staticmethod
+    def _rewrite_archive(archive_path, add=None, drop=None):
+        """Пересобирает архив: добавляет файлы {имя: путь}, исключает имена drop
+
+        Архив записывается во временный файл и заменяется целиком, поэтому
+        прерванная очистка не оставляет поврежденный архив. Пустой архив удаляется.
+        """
+        add = add or {}
+        drop = drop or set()
+        members = {}
+        if os.path.exists(archive_path):
+            with zipfile.ZipFile(archive_path) as archive:
+                for member in archive.namelist():
+                    if member not in drop and member not in add:
+                        members[member] = archive.read(member)
+        for member, path in add.items():
+            with open(path, 'rb') as f:
+                members[member] = f.read()
+
+        if not members:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            return
+        tmp_path = f"{archive_path}.tmp"
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for member in sorted(members):
+                archive.writestr(member, members[member])
+        os.replace(tmp_path, archive_path)
+
+    def _compact_files(self, entries, stats, dry_run):
+        """Удаляет лишние и архивирует старые файлы одной группы"""
+        keep = self.policy.keep(entry['timestamp'] for entry in entries)
+        expired = [entry for entry in entries if entry['timestamp'] not in keep]
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.policy.archive_after_days)
+        to_archive = [entry for entry in entries
+                      if entry['timestamp'] in keep and split_archive_path(entry['path'])[1] is None
+                      and (_parse_timestamp(entry['timestamp']) or cutoff) < cutoff
+                      and (entry['size'] or 0) <= self.policy.small_file_size]
+        stats['deleted'] += len(expired)
+        stats['archived'] += len(to_archive)
+        if dry_run:
+            return
+
+        # Файлы внутри архивов удаляются одной пересборкой архива
+        archived_drops = {}
+        for entry in expired:
+            archive_path, member = split_archive_path(entry['path'])
+            if member is None:
+                if os.path.exists(entry['path']):
+                    os.remove(entry['path'])
+                remove_index(entry['path'])
+                self.catalog.remove(entry['path'])
+            else:
+                archived_drops.setdefault(archive_path, set()).add(member)
+        for archive_path, members in archived_drops.items():
+            self._rewrite_archive(archive_path, drop=members)
+            for member in members:
+                self.catalog.remove(archive_member_path(archive_path, member))
+
+        archives = {}
+        for entry in to_archive:
+            if not os.path.exists(entry['path']):
+                self.catalog.remove(entry['path'])
+                continue
+            archive_path = os.path.join(os.path.dirname(entry['path']), self._archive_name(entry['timestamp']))
+            archives.setdefault(archive_path, {})[os.path.basename(entry['path'])] = entry['path']
+        for archive_path, files in archives.items():
+            self._rewrite_archive(archive_path, add=files)
+            for member, path in files.items():
+                # Сначала каталог указывает на архив, только потом удаляется исходный файл
+                self.catalog.move(path, archive_member_path(archive_path, member))
+                os.remove(path)
+                remove_index(path)
+
+    # ==================== ХРАНИЛИЩЕ ====================
+
+    def _compact_store(self, tenant_id, stats, dry_run):
+        """Удаляет запуски тенанта в хранилище, не попавшие в ротацию"""
+        manifests = {}
+        for entry in self.catalog.query(tenant_id=tenant_id, storage=STORAGE_STORE):
+            manifests[entry['path']] = entry['timestamp']
+        keep = self.policy.keep(manifests.values())
+        expired = [path for path, timestamp in manifests.items() if timestamp not in keep]
+        stats['deleted'] += len(expired)
+        if dry_run:
+            return
+        for path in expired:
+            if os.path.exists(path):
+                self.store.remove_manifest(path)
+            self.catalog.remove(path)
+        if expired:
+            stats['manifests_removed'] = True
+
+    # ==================== ЗАПУСК ====================
+
+    def steps(self, dry_run=False, stats=None):
+        """Обрабатывает группы по одной, после каждой возвращает текущую сводку"""
+        stats = stats if stats is not None else {}
+        for key in ('deleted', 'archived', 'objects_removed', 'bytes_freed'):
+            stats.setdefault(key, 0)
+        # Файлы, сохраненные до появления каталога (например, бекапы настроек трафика), дописываются в каталог
+        self.catalog.rebuild(base_dir=self.base_dir, store=self.store, only_missing=True)
+
+        store_tenants = set()
+        for tenant_id, resource, storage in self.catalog.groups():
+            if storage == STORAGE_STORE:
+                if tenant_id in store_tenants:
+                    continue
+                store_tenants.add(tenant_id)
+                self._compact_store(tenant_id, stats, dry_run)
+            elif storage == STORAGE_FILES:
+                self._compact_files(self.catalog.query(tenant_id=tenant_id, resource=resource, storage=storage),
+                                    stats, dry_run)
+            yield stats
+            if self.pause:
+                time.sleep(self.pause)
+
+        if stats.pop('manifests_removed', False):
+            removed, freed = self.store.collect_garbage()
+            stats['objects_removed'] += removed
+            stats['bytes_freed'] += freed
+            yield stats
+
+    def run(self, dry_run=False, time_budget=None):
+        """Выполняет очистку (не дольше time_budget секунд, если задано), возвращает сводку"""
+        started = time.monotonic()
+        stats = {}
+        for _ in self.steps(dry_run=dry_run, stats=stats):
+            if time_budget is not None and time.monotonic() - started > time_budget:
+                break
+        stats.pop('manifests_removed', None)
+        return stats
+
+    @staticmethod
+    def print_summary(stats, dry_run=False):
+        if dry_run:
+            print(f"Будет удалено снапшотов: {stats['deleted']}, перенесено в архивы: {stats['archived']}")
+            return
+        print(f"Удалено снапшотов: {stats['deleted']}, перенесено в архивы: {stats['archived']}")
+        if stats['objects_removed']:
+            print(f"Удалено объектов хранилища: {stats['objects_removed']} "
+                  f"({stats['bytes_freed'] / 1024:.1f} КБ)")
+
+
+# ==================== ФОНОВАЯ ОЧИСТКА ====================
+
+def configure_retention(settings):
+    """Включает автоматическую очистку после сохранения снапшотов (settings - "snapshot_retention")"""
+    global _policy
+    _policy = RetentionPolicy.from_config(settings) if settings else None
+    return _policy
+
+
+def get_retention_policy():
+    return _policy
+
+
+def schedule_compaction():
+    """Запускает очистку в фоновом потоке, если задана политика и очистка еще не идет
+
+    Поток не демонический: при любом выходе из программы (CLI, меню, настройки
+    трафика) интерпретатор дожидается окончания очистки, и она не прерывается
+    между перезаписью архива и удалением исходного файла.
+    """
+    global _background
+    if _policy is None:
+        return None
+    with _background_lock:
+        if _background is not None and _background.is_alive():
+            return _background
+
+        def worker():
+            try:
+                SnapshotCompactor(_policy, pause=DEFAULT_PAUSE).run()
+            except Exception as e:
+                print(f"Ошибка фоновой очистки снапшотов: {e}")
+
+        _background = threading.Thread(target=worker, name="snapshot-compaction", daemon=False)
+        _background.start()
+        return _background
+
+
+def wait_for_compaction(timeout=None):
+    """Ожидает завершения фоновой очистки (перед выходом из CLI)"""
+    with _background_lock:
+        thread = _background
+    if thread is not None:
+        thread.join(timeout)
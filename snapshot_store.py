@@ -0,0 +1,257 @@
+# snapshot_store.py
+import os
+import gzip
+import json
+import time
+import hashlib
+import datetime
+import tempfile
+import threading
+
+from snapshot_delta import apply as apply_delta, diff as diff_documents
+
+STORE_DIR = "snapshot_store"
+MANIFEST_VERSION = 1
+# Полная копия ресурса сохраняется не реже, чем раз в столько запусков
+DEFAULT_FULL_INTERVAL = 24
+# Если разница больше этой доли полного ресурса, выгоднее сохранить новую полную копию
+MAX_DELTA_RATIO = 0.5
+TIMESTAMP_FORMAT = "%Y-%m-%d-%H-%M-%S"
+
+STORAGE_FILES = "files"
+STORAGE_STORE = "store"
+
+
+def canonical_bytes(data):
+    """Каноническое представление данных: одинаковое содержимое дает одинаковый хэш"""
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class SnapshotStore:
+    """Хранилище снапшотов с адресацией по содержимому
+
+    Каждый ресурс (конфигурация, бекенды, роли, действия) хранится один раз
+    как сжатый объект objects/<хэш>, запуск описывается небольшим манифестом
+    manifests/<тенант>/<время>.json со ссылками на объекты. Неизменившийся
+    ресурс - и в следующем запуске, и в другом тенанте - стоит только проверки
+    наличия объекта, поэтому объем хранилища растет с объемом изменений, а не
+    с числом запусков.
+
+    Изменившийся ресурс сохраняется как структурная разница с последней
+    полной копией (ссылка в манифесте - {base, delta, chain}); полная копия
+    записывается раз в full_interval запусков или когда разница слишком
+    велика. Любой запуск восстанавливается из одной полной копии и одной
+    разницы.
+    """
+
+    def __init__(self, root=STORE_DIR, full_interval=DEFAULT_FULL_INTERVAL):
+        self.root = root
+        self.full_interval = full_interval
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifests_dir = os.path.join(root, "manifests")
+        self.written_count = 0
+        self.reused_count = 0
+        self._lock = threading.Lock()
+
+    # ==================== ОБЪЕКТЫ ====================
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f"{digest[2:]}.json.gz")
+
+    def has(self, digest):
+        return os.path.exists(self.object_path(digest))
+
+    def put(self, data):
+        """Сохраняет объект, если его еще нет, возвращает хэш содержимого"""
+        raw = canonical_bytes(data)
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            try:
+                # Время изменения защищает объект от сборки мусора, пока манифест еще не записан
+                os.utime(path)
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    self.reused_count += 1
+                return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Одинаковый объект может записываться из нескольких потоков - каждый пишет свой временный файл
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(raw))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.written_count += 1
+        return digest
+
+    def get(self, digest):
+        """Читает объект по хэшу"""
+        with open(self.object_path(digest), 'rb') as f:
+            return json.loads(gzip.decompress(f.read()).decode('utf-8'))
+
+    # ==================== ИСТОРИЯ РЕСУРСОВ ====================
+
+    def resolve(self, entry):
+        """Восстанавливает ресурс по ссылке из манифеста (хэш полной копии или {base, delta})"""
+        if isinstance(entry, dict):
+            return apply_delta(self.get(entry['base']), self.get(entry['delta']))
+        return self.get(entry)
+
+    def latest_entry(self, tenant_id, resource):
+        """Ссылка на ресурс в последнем манифесте тенанта"""
+        for path, _ in self.list_manifests(tenant_id):
+            try:
+                entry = self.load_manifest(path).get('objects', {}).get(resource)
+            except (OSError, ValueError):
+                continue
+            if entry:
+                return entry
+        return None
+
+    def put_resource(self, tenant_id, resource, data):
+        """Сохраняет ресурс тенанта полной копией или разницей с последней полной копией, возвращает ссылку"""
+        previous = self.latest_entry(tenant_id, resource)
+        if previous is None:
+            return self.put(data)
+
+        base = previous['base'] if isinstance(previous, dict) else previous
+        chain = previous.get('chain', 0) + 1 if isinstance(previous, dict) else 1
+        if chain >= self.full_interval or not self.has(base):
+            return self.put(data)
+
+        delta = diff_documents(self.get(base), data)
+        if not delta:
+            return base
+        if len(canonical_bytes(delta)) > MAX_DELTA_RATIO * len(canonical_bytes(data)):
+            return self.put(data)
+        return {'base': base, 'delta': self.put(delta), 'chain': chain}
+
+    # ==================== МАНИФЕСТЫ ====================
+
+    def write_manifest(self, tenant_id, objects, created_at=None):
+        """Записывает манифест запуска {ресурс: хэш}, возвращает путь к нему"""
+        created_at = created_at or datetime.datetime.now()
+        tenant_dir = os.path.join(self.manifests_dir, str(tenant_id))
+        os.makedirs(tenant_dir, exist_ok=True)
+        timestamp = created_at.strftime(TIMESTAMP_FORMAT)
+        path = os.path.join(tenant_dir, f"{timestamp}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'tenant_id': tenant_id,
+                'created_at': created_at.isoformat(),
+                'objects': objects
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def is_manifest(self, path):
+        """Проверяет, что путь указывает на манифест этого хранилища"""
+        manifests_dir = os.path.abspath(self.manifests_dir)
+        return os.path.abspath(path).startswith(manifests_dir + os.sep)
+
+    def list_manifests(self, tenant_id):
+        """Возвращает [(путь, время)] манифестов тенанта (последний первым)"""
+        tenant_dir = os.path.join(self.manifests_dir, str(tenant_id))
+        if not os.path.isdir(tenant_dir):
+            return []
+        manifests = [(os.path.join(tenant_dir, filename), filename[:-len('.json')])
+                     for filename in os.listdir(tenant_dir) if filename.endswith('.json')]
+        manifests.sort(key=lambda x: x[1], reverse=True)
+        return manifests
+
+    @staticmethod
+    def load_manifest(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load_resource(self, manifest_path, resource):
+        """Читает ресурс запуска по манифесту (None, если в запуске его нет)"""
+        entry = self.load_manifest(manifest_path).get('objects', {}).get(resource)
+        return self.resolve(entry) if entry else None
+
+    def remove_manifest(self, path):
+        """Удаляет манифест запуска (объекты удаляются сборкой мусора)"""
+        if not self.is_manifest(path):
+            raise ValueError(f"{path} не является манифестом хранилища")
+        os.remove(path)
+
+    def manifest_at(self, tenant_id, moment):
+        """Последний манифест тенанта, записанный не позже moment (datetime)"""
+        timestamp = moment.strftime(TIMESTAMP_FORMAT)
+        for path, manifest_timestamp in self.list_manifests(tenant_id):
+            if manifest_timestamp <= timestamp:
+                return path
+        return None
+
+    def state_at(self, tenant_id, moment, resource='snapshot'):
+        """Состояние ресурса тенанта на момент времени, возвращает (путь манифеста, данные)"""
+        manifest_path = self.manifest_at(tenant_id, moment)
+        if manifest_path is None:
+            return None, None
+        return manifest_path, self.load_resource(manifest_path, resource)
+
+    # ==================== СБОРКА МУСОРА ====================
+
+    def referenced_objects(self):
+        """Хэши объектов, на которые ссылается хотя бы один манифест (включая полные копии для разниц)"""
+        referenced = set()
+        if not os.path.isdir(self.manifests_dir):
+            return referenced
+        for tenant_id in os.listdir(self.manifests_dir):
+            for path, _ in self.list_manifests(tenant_id):
+                try:
+                    objects = self.load_manifest(path).get('objects', {})
+                except (OSError, ValueError):
+                    continue
+                for entry in objects.values():
+                    if isinstance(entry, dict):
+                        referenced.update((entry['base'], entry['delta']))
+                    elif entry:
+                        referenced.add(entry)
+        return referenced
+
+    def collect_garbage(self, grace_period=3600):
+        """Удаляет объекты без ссылок из манифестов, возвращает (число объектов, освобождено байт)
+
+        Объекты моложе grace_period секунд не удаляются: их манифест может
+        записываться прямо сейчас.
+        """
+        if not os.path.isdir(self.objects_dir):
+            return 0, 0
+        started = time.time()
+        referenced = self.referenced_objects()
+        removed = 0
+        freed = 0
+        for prefix in os.listdir(self.objects_dir):
+            directory = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if not filename.endswith('.json.gz'):
+                    continue
+                digest = prefix + filename[:-len('.json.gz')]
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if digest in referenced or started - stat.st_mtime < grace_period:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += stat.st_size
+        return removed, freed
@@ -101,6 +101,36 @@ class TenantManager:
                 print("Пожалуйста, введите число")
         return None
 
+    def select_multiple_tenants(self, prompt="Выберите тенанты:"):
+        """Выбирает несколько тенантов (номера через запятую или 'all') и возвращает их данные"""
+        tenants = self.get_available_tenants()
+        if not tenants:
+            print("Не удалось получить список тенантов")
+            return None
+
+        print(f"\n{prompt}")
+        for i, tenant in enumerate(tenants, 1):
+            name = tenant.get("name", "Без названия")
+            tenant_id = tenant.get("id", "Без ID")
+            print(f"{i}. {name} (ID: {tenant_id})")
+
+        while True:
+            choice = input("\nВведите номера тенантов через запятую, 'all' для всех (или 'q' для отмены): ").strip()
+            if choice.lower() == 'q':
+                return None
+            if choice.lower() == 'all':
+                return tenants
+
+            try:
+                indexes = [int(part) - 1 for part in choice.split(',') if part.strip()]
+            except ValueError:
+                print("Пожалуйста, введите числа через запятую")
+                continue
+
+            if indexes and all(0 <= index < len(tenants) for index in indexes):
+                return [tenants[index] for index in sorted(set(indexes))]
+            print("Некорректный номер")
+
     def select_source_and_target_tenants(self):
         """Выбирает исходный и целевой тенанты для копирования"""
         tenants = self.get_available_tenants()
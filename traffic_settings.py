@@ -1,8 +1,12 @@
 # traffic_settings.py (оптимизированный с BaseManager)
 import os
 import json
+import hashlib
 import datetime
 from base_manager import BaseManager
+from snapshot_catalog import get_snapshot_catalog
+from snapshot_retention import schedule_compaction
+from snapshot_store import STORAGE_FILES, canonical_bytes
 
 class TrafficSettingsManager(BaseManager):
     def __init__(self, api_client):
@@ -51,10 +55,20 @@ class TrafficSettingsManager(BaseManager):
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(current_settings, f, ensure_ascii=False, indent=2)
             print(f"Бекап настроек сохранен в файл: {filepath}")
-            return True
         except Exception as e:
             print(f"Ошибка при сохранении бекапа: {e}")
             return False
+        
+        # Бекап учитывается в каталоге снапшотов, чтобы на него распространялась политика хранения
+        try:
+            get_snapshot_catalog().record(self.api_client.auth_manager.tenant_id, 'traffic_settings', current_time,
+                                          os.path.abspath(filepath), STORAGE_FILES,
+                                          size=os.path.getsize(filepath),
+                                          checksum=hashlib.sha256(canonical_bytes(current_settings)).hexdigest())
+        except Exception as e:
+            print(f"Предупреждение: бекап не записан в каталог снапшотов: {e}")
+        schedule_compaction()
+        return True
     
     def _show_current_settings(self, settings):
         """Выводит текущие настройки"""
@@ -0,0 +1,112 @@
+# unit_of_work.py
+from parallel_executor import ParallelExecutor
+
+DEFAULT_FLUSH_WORKERS = 4
+
+
+def merge_fields(target, fields):
+    """Сливает изменения полей: вложенные словари объединяются, остальные значения заменяются"""
+    for key, value in fields.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_fields(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+class PendingPatch:
+    """Накопленные изменения одного ресурса"""
+
+    def __init__(self, key, send, label=None):
+        self.key = key
+        self.send = send
+        self.label = label or str(key)
+        self.fields = {}
+        self.current = {}
+        self.response = None
+        self.skipped = False
+
+    def changed_fields(self):
+        """Возвращает только поля, значения которых отличаются от известного состояния ресурса"""
+        return {key: value for key, value in self.fields.items()
+                if key not in self.current or self.current[key] != value}
+
+    @property
+    def ok(self):
+        """Изменения применены или применять было нечего"""
+        return self.skipped or (self.response is not None and self.response.status_code in (200, 204))
+
+
+class PatchUnitOfWork:
+    """Собирает PATCH-изменения по ресурсам и отправляет их при фиксации
+
+    Изменения одного ресурса (ключ - кортеж вида ('user_rule', template_id,
+    rule_id)) сливаются в один запрос, поля со значениями, совпадающими с
+    известным состоянием ресурса, отбрасываются. Запросы к разным ресурсам
+    отправляются параллельно.
+    """
+
+    def __init__(self, max_workers=DEFAULT_FLUSH_WORKERS, rate_limit=None):
+        # Повтор без ответа - однократный: обычные методы клиента уже обрабатывают 401/404
+        self.executor = ParallelExecutor(max_workers=max_workers, rate_limit=rate_limit, max_retries=1)
+        self._pending = {}
+
+    def __len__(self):
+        return sum(1 for patch in self._pending.values() if patch.send is not None)
+
+    def __contains__(self, key):
+        return key in self._pending
+
+    def update(self, key, send, fields, label=None):
+        """Добавляет изменения ресурса; send(data) отправляет PATCH и возвращает ответ"""
+        patch = self._pending.get(key)
+        if patch is None:
+            patch = PendingPatch(key, send, label)
+            self._pending[key] = patch
+        elif patch.send is None:
+            # Для ресурса было известно только состояние
+            patch.send = send
+            patch.label = label or patch.label
+        merge_fields(patch.fields, fields)
+        return patch
+
+    def observe(self, key, state):
+        """Запоминает известное состояние ресурса (например, только что записанное)"""
+        patch = self._pending.get(key)
+        if patch is None:
+            patch = PendingPatch(key, None)
+            self._pending[key] = patch
+        patch.current.update(state or {})
+
+    def commit(self, on_result=None):
+        """Отправляет накопленные изменения, возвращает список PendingPatch в порядке добавления
+
+        on_result(patch) вызывается в текущем потоке по мере готовности.
+        """
+        patches = [patch for patch in self._pending.values() if patch.send is not None]
+
+        to_send = []
+        for patch in patches:
+            changes = patch.changed_fields()
+            if changes:
+                to_send.append((patch, changes))
+            else:
+                patch.skipped = True
+                if on_result:
+                    on_result(patch)
+
+        def handle(item, response):
+            item[0].response = response
+            if on_result:
+                on_result(item[0])
+
+        self.executor.map(lambda item: item[0].send(item[1]), to_send, handle)
+
+        for patch in patches:
+            # Примененные изменения становятся известным состоянием ресурса для следующих этапов
+            observed = PendingPatch(patch.key, None, patch.label)
+            observed.current = dict(patch.current)
+            if patch.ok:
+                observed.current.update(patch.fields)
+            self._pending[patch.key] = observed
+        return patches